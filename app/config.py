@@ -18,6 +18,40 @@ class Settings(BaseSettings):
     REDIS_USER: str
     REDIS_USER_PASSWORD: str
 
+    # Кэш DAO (L1 в памяти воркера + L2 в Redis, см. app/dao/cache.py)
+    CACHE_ENABLED: bool = True
+    CACHE_TTL: int = 300
+    CACHE_L1_TTL: int = 30
+    CACHE_L1_MAXSIZE: int = 10000
+    # Снимки авторизованных пользователей для get_current_user (app/users/snapshot.py)
+    USER_CACHE_TTL: int = 30
+    USER_CACHE_MAXSIZE: int = 10000
+    # Скомпилированные списки разрешенных IP пользователей (app/users/ip_allowlist.py)
+    IP_ALLOWLIST_CACHE_TTL: int = 60
+    # Проверенные JWT до истечения exp (app/users/tokens.py)
+    JWT_CACHE_MAXSIZE: int = 10000
+    # Фильтр Блума занятых ников/email для проверок доступности (app/users/availability.py)
+    AVAILABILITY_FILTER_ENABLED: bool = True
+    AVAILABILITY_FILTER_ERROR_RATE: float = 0.01
+    # Количество пользователей ролей (app/roles/counts.py): кэш агрегата и сверка roles.count_users, секунды
+    ROLE_COUNTS_CACHE_TTL: int = 60
+    ROLE_COUNTS_RECONCILE_INTERVAL: int = 300
+    # Пакетная запись логов действий пользователей (app/users/audit_log.py)
+    AUDIT_LOG_QUEUE_SIZE: int = 10000
+    AUDIT_LOG_BATCH_SIZE: int = 500
+    AUDIT_LOG_FLUSH_INTERVAL: float = 0.5
+    AUDIT_LOG_SPILL_DIR: str = "logs/audit_spill"
+    # Версии токенов в памяти воркера (app/users/token_versions.py), секунды
+    TOKEN_VERSION_CACHE_TTL: int = 30
+    # Пул потоков bcrypt и лимит ожидающих вызовов, сверх которого - 503 (app/users/hashing.py)
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_QUEUE_LIMIT: int = 32
+    # Ограничение попыток входа: не более N попыток за окно (секунды) с IP и на email
+    LOGIN_LIMIT_PER_IP: int = 20
+    LOGIN_LIMIT_IP_WINDOW: int = 60
+    LOGIN_LIMIT_PER_EMAIL: int = 10
+    LOGIN_LIMIT_EMAIL_WINDOW: int = 300
+
     model_config = SettingsConfigDict(
         env_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".env"),
         extra='ignore'  # ← ИГНОРИРОВАТЬ ЛИШНИЕ ПЕРЕМЕННЫЕ
@@ -9,6 +9,35 @@ class Settings(BaseSettings):
     DB_NAME: str
     DB_USER: str
     DB_PASSWORD: str
+
+    # Пул соединений с БД (на один процесс-воркер)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Общий лимит соединений приложения на все воркеры (часть max_connections Postgres).
+    # Если задан, pool_size + max_overflow каждого воркера не превышают DB_CONNECTION_BUDGET // WEB_CONCURRENCY
+    DB_CONNECTION_BUDGET: Optional[int] = None
+    WEB_CONCURRENCY: int = 1
+
+    # Реплика для чтения (необязательно; без DB_REPLICA_HOST все запросы идут в основную БД).
+    # Пользователь, пароль, имя БД и порт по умолчанию совпадают с основной БД
+    DB_REPLICA_HOST: Optional[str] = None
+    DB_REPLICA_PORT: Optional[int] = None
+    DB_REPLICA_NAME: Optional[str] = None
+    DB_REPLICA_USER: Optional[str] = None
+    DB_REPLICA_PASSWORD: Optional[str] = None
+    # Отставание реплики, при превышении которого чтение возвращается на основную БД
+    DB_REPLICA_MAX_LAG_SECONDS: float = 5.0
+    DB_REPLICA_CHECK_INTERVAL_SECONDS: float = 5.0
+    # Окно read-your-writes: после записи клиент читает из основной БД
+    DB_READ_YOUR_WRITES_SECONDS: float = 10.0
+
+    # Учет SQL-запросов по HTTP-запросам (Server-Timing, /monitoring/db/routes)
+    SQL_INSTRUMENTATION_ENABLED: bool = True
+    # Сколько раз одинаковый запрос должен повториться за HTTP-запрос, чтобы считаться N+1
+    SQL_N_PLUS_ONE_THRESHOLD: int = 5
     
     # JWT
     SECRET_KEY: str
@@ -50,6 +79,30 @@ class Settings(BaseSettings):
     def database_url(self) -> str:
         return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
     
+    @property
+    def replica_database_url(self) -> Optional[str]:
+        if not self.DB_REPLICA_HOST:
+            return None
+        return (f"postgresql+asyncpg://{self.DB_REPLICA_USER or self.DB_USER}:"
+                f"{self.DB_REPLICA_PASSWORD or self.DB_PASSWORD}@{self.DB_REPLICA_HOST}:"
+                f"{self.DB_REPLICA_PORT or self.DB_PORT}/{self.DB_REPLICA_NAME or self.DB_NAME}")
+
+    @property
+    def db_pool_options(self) -> dict:
+        """Параметры пула для create_async_engine с учетом бюджета соединений на воркер"""
+        pool_size, max_overflow = self.DB_POOL_SIZE, self.DB_MAX_OVERFLOW
+        if self.DB_CONNECTION_BUDGET:
+            per_worker = max(1, self.DB_CONNECTION_BUDGET // max(1, self.WEB_CONCURRENCY))
+            pool_size = min(pool_size, per_worker)
+            max_overflow = max(0, min(max_overflow, per_worker - pool_size))
+        return {
+            "pool_size": pool_size,
+            "max_overflow": max_overflow,
+            "pool_timeout": self.DB_POOL_TIMEOUT,
+            "pool_recycle": self.DB_POOL_RECYCLE,
+            "pool_pre_ping": self.DB_POOL_PRE_PING,
+        }
+
     @property
     def redis_connection_url(self) -> str:
         return f"redis://{self.REDIS_USER}:{self.REDIS_USER_PASSWORD}@{self.REDIS_HOST}:6379/{self.REDIS_DB}"
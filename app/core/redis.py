@@ -0,0 +1,50 @@
+# app/core/redis.py
+"""
+Общее подключение к Redis (кэш DAO, ограничение попыток входа, версии токенов).
+
+redis_client() возвращает None, пока Redis считается недоступным: после ошибки
+(redis_failed) обращения к нему приостанавливаются на REDIS_RETRY_DELAY секунд,
+и вызывающий код работает по своему запасному пути (обычно - память процесса).
+"""
+import time
+from typing import Optional
+
+from redis.asyncio import Redis
+
+from app.config import settings
+
+
+# Пауза перед повторной попыткой обращения к недоступному Redis (секунды)
+REDIS_RETRY_DELAY = 5.0
+
+_redis: Optional[Redis] = None
+_retry_at = 0.0
+
+
+def redis_client() -> Optional[Redis]:
+    global _redis
+    if time.monotonic() < _retry_at:
+        return None
+    if _redis is None:
+        _redis = Redis.from_url(
+            settings.REDIS_URL,
+            db=settings.REDIS_DB,
+            username=settings.REDIS_USER,
+            password=settings.REDIS_USER_PASSWORD,
+            socket_connect_timeout=1,
+            socket_timeout=1,
+        )
+    return _redis
+
+
+def redis_failed():
+    """Отмечает ошибку обращения к Redis: следующие REDIS_RETRY_DELAY секунд он не используется"""
+    global _retry_at
+    _retry_at = time.monotonic() + REDIS_RETRY_DELAY
+
+
+async def close_redis():
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
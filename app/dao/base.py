@@ -1,15 +1,39 @@
 # app.dao.base.py
-from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.future import select
-from sqlalchemy import update as sqlalchemy_update, delete as sqlalchemy_delete, func
-from app.database import async_session_maker
+from sqlalchemy import update as sqlalchemy_update, delete as sqlalchemy_delete, insert, func, desc, bindparam, any_
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from app.dao.cache import ANY_ROW, invalidate_model
+from app.dao.loader import get_loader
+from app.dao.session import session_scope, stream_scope, transaction_scope
+from app.dao.statements import statements
+from app.dao.pagination import split_order_by, check_keys, keyset_condition, decode_cursor, next_cursor
 from app.utils.datetime_utils import DateTimeUtils
 from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Iterable, Optional, Sequence
 
 
 class BaseDAO:
+    # Все методы присоединяются к unit of work запроса (см. app/dao/session.py),
+    # а без него открывают собственную короткую сессию.
+    # Методы записи сбрасывают кэш модели (см. app/dao/cache.py).
+    # load_by_id/load_many_by_ids собирают поиск по id в пакеты (см. app/dao/loader.py).
     model = None
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        model = cls.model
+        if model is not None:
+            # Поиск по первичному ключу - самый частый запрос, строится один раз на модель
+            statements.register(
+                (model.__tablename__, "by_id"),
+                lambda: select(model).where(model.id == bindparam("data_id"))
+            )
+            # Пакетный поиск: один текст запроса для любого количества id
+            statements.register(
+                (model.__tablename__, "by_ids"),
+                lambda: select(model).where(model.id == any_(bindparam("ids", type_=ARRAY(model.id.type))))
+            )
+
     @classmethod
     async def find_one_or_none_by_id(cls, data_id: int):
         """
@@ -21,11 +45,46 @@ class BaseDAO:
         Возвращает:
             Экземпляр модели или None, если ничего не найдено.
         """
-        async with async_session_maker() as session:
-            query = select(cls.model).filter_by(id=data_id)
-            result = await session.execute(query)
+        async with session_scope() as session:
+            query = statements.get((cls.model.__tablename__, "by_id"))
+            result = await session.execute(query, {"data_id": data_id})
             return result.scalar_one_or_none()
 
+    @classmethod
+    async def find_many_by_ids(cls, ids: Iterable[int]) -> dict:
+        """
+        Находит экземпляры модели по набору идентификаторов одним запросом.
+
+        Возвращает:
+            Словарь {id: экземпляр}; ненайденных id в нем нет.
+        """
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return {}
+        async with session_scope() as session:
+            query = statements.get((cls.model.__tablename__, "by_ids"))
+            result = await session.execute(query, {"ids": ids})
+            return {instance.id: instance for instance in result.scalars().all()}
+
+    @classmethod
+    async def load_by_id(cls, data_id: Optional[int]):
+        """
+        Находит экземпляр модели по id через загрузчик запроса: вызовы в одной
+        итерации event loop объединяются в один запрос, результат запоминается
+        до конца HTTP-запроса. None для data_id=None.
+        """
+        if data_id is None:
+            return None
+        return await get_loader((cls.model.__tablename__, "by_id"), cls.find_many_by_ids).load(data_id)
+
+    @classmethod
+    async def load_many_by_ids(cls, ids: Iterable[Optional[int]]) -> dict:
+        """Пакетный load_by_id: {id: экземпляр} для найденных id (None пропускаются)"""
+        ids = [data_id for data_id in dict.fromkeys(ids) if data_id is not None]
+        loader = get_loader((cls.model.__tablename__, "by_id"), cls.find_many_by_ids)
+        instances = await loader.load_many(ids)
+        return {data_id: instance for data_id, instance in zip(ids, instances) if instance is not None}
+
     @classmethod
     async def find_one_or_none(cls, **filter_by):
         """
@@ -37,7 +96,7 @@ class BaseDAO:
         Возвращает:
             Экземпляр модели или None, если ничего не найдено.
         """
-        async with async_session_maker() as session:
+        async with session_scope() as session:
             query = select(cls.model).filter_by(**filter_by)
             result = await session.execute(query)
             return result.scalar_one_or_none()
@@ -53,11 +112,153 @@ class BaseDAO:
         Возвращает:
             Список экземпляров модели.
         """
-        async with async_session_maker() as session:
+        async with session_scope() as session:
             query = select(cls.model).filter_by(**filter_by)
             result = await session.execute(query)
             return result.scalars().all()
 
+    @classmethod
+    async def find_rows(
+        cls,
+        columns: Sequence,
+        *where,
+        order_by: Sequence = (),
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        joins: Sequence = (),
+        **filter_by
+    ) -> list:
+        """
+        Асинхронно возвращает только указанные колонки в виде легких строк (Row, именованные кортежи).
+        Строки не попадают в identity map и не инструментируются ORM, поэтому подходят
+        для списков только для чтения.
+
+        Аргументы:
+            columns: Имена атрибутов модели или SQLAlchemy-выражения (в т.ч. колонки других таблиц с label).
+            *where: Дополнительные условия фильтрации (SQLAlchemy-выражения).
+            order_by: Сортировка.
+            limit: Максимальное количество строк.
+            offset: Смещение.
+            joins: Пары (таблица/alias, условие) для LEFT JOIN.
+            **filter_by: Критерии фильтрации по колонкам модели в виде именованных параметров.
+
+        Возвращает:
+            Список строк с доступом к значениям по имени (row.user_email).
+        """
+        query = cls._rows_query(cls._projection(columns), joins, where, filter_by)
+        query = query.order_by(*order_by).limit(limit).offset(offset)
+
+        async with session_scope() as session:
+            result = await session.execute(query)
+            return result.all()
+
+    @classmethod
+    async def stream(
+        cls,
+        *where,
+        chunk_size: int = 1000,
+        columns: Optional[Sequence] = None,
+        joins: Sequence = (),
+        order_by: Sequence = (),
+        **filter_by
+    ) -> AsyncIterator:
+        """
+        Асинхронный генератор записей через серверный курсор (AsyncSession.stream + yield_per).
+        В памяти одновременно находится не более chunk_size строк, поэтому подходит
+        для выгрузки таблиц любого размера. Использует собственную сессию (см. stream_scope).
+
+        Аргументы:
+            *where: Дополнительные условия фильтрации (SQLAlchemy-выражения).
+            chunk_size: Количество строк, получаемых из БД за один раз.
+            columns: Если указаны - выдаются легкие строки (см. find_rows) вместо ORM-объектов.
+            joins: Пары (таблица/alias, условие) для LEFT JOIN в режиме columns.
+            order_by: Сортировка.
+            **filter_by: Критерии фильтрации по колонкам модели в виде именованных параметров.
+
+        Пример:
+            async for log in UserLogsDAO.stream(chunk_size=500, user_id=1):
+                ...
+        """
+        if columns:
+            query = cls._rows_query(cls._projection(columns), joins, where, filter_by)
+        else:
+            query = select(cls.model).filter_by(**filter_by).where(*where)
+        query = query.order_by(*order_by).execution_options(yield_per=chunk_size)
+
+        async with stream_scope() as session:
+            result = await session.stream(query)
+            items = result if columns else result.scalars()
+            try:
+                async for item in items:
+                    yield item
+            finally:
+                await result.close()
+
+    @classmethod
+    async def find_page(
+        cls,
+        *where,
+        order_by: Sequence = (),
+        after: Optional[str] = None,
+        limit: int = 25,
+        options: Sequence = (),
+        columns: Optional[Sequence] = None,
+        joins: Sequence = (),
+        **filter_by
+    ) -> dict:
+        """
+        Асинхронно возвращает страницу записей с keyset (cursor) пагинацией.
+        Первичный ключ id всегда добавляется в конец сортировки для однозначности;
+        колонки сортировки должны быть NOT NULL.
+
+        Аргументы:
+            *where: Дополнительные условия фильтрации (SQLAlchemy-выражения).
+            order_by: Колонки сортировки, например [desc(Model.updated_at)].
+            after: Курсор, полученный в next_cursor предыдущей страницы.
+            limit: Размер страницы.
+            options: Опции загрузки (joinedload и т.д.), только для режима ORM-объектов.
+            columns: Если указаны - возвращаются легкие строки (см. find_rows) вместо ORM-объектов.
+            joins: Пары (таблица/alias, условие) для LEFT JOIN в режиме columns.
+            **filter_by: Критерии фильтрации по колонкам модели в виде именованных параметров.
+
+        Возвращает:
+            Словарь {"items": [...], "next_cursor": str | None, "has_more": bool}.
+
+        Исключения:
+            InvalidCursorError: если курсор поврежден или не соответствует сортировке.
+        """
+        keys = split_order_by(order_by)
+        if not any(column.key == "id" for column, _ in keys):
+            last_desc = keys[-1][1] if keys else False
+            keys.append((cls.model.__table__.c.id, last_desc))
+        check_keys(keys)
+
+        if columns:
+            # Колонки ключа сортировки нужны в строке для построения следующего курсора
+            selected = cls._projection(columns)
+            selected_keys = {column.key for column in selected}
+            selected += [column for column, _ in keys if column.key not in selected_keys]
+            query = cls._rows_query(selected, joins, where, filter_by)
+        else:
+            query = select(cls.model).options(*options).filter_by(**filter_by).where(*where)
+
+        if after:
+            query = query.where(keyset_condition(keys, decode_cursor(after, keys)))
+        query = query.order_by(*[desc(column) if is_desc else column for column, is_desc in keys])
+        query = query.limit(limit + 1)
+
+        async with session_scope() as session:
+            result = await session.execute(query)
+            items = list(result.all()) if columns else list(result.unique().scalars().all())
+
+        has_more = len(items) > limit
+        items = items[:limit]
+        return {
+            "items": items,
+            "next_cursor": next_cursor(items, keys, has_more),
+            "has_more": has_more
+        }
+
     @classmethod
     async def add(cls, **values):
         """
@@ -70,19 +271,14 @@ class BaseDAO:
         Возвращает:
             Созданный экземпляр модели.
         """
-        async with async_session_maker() as session:
-            async with session.begin():
-                # Обрабатываем datetime поля
-                processed_values = cls._process_datetime_values(values)
-                
-                new_instance = cls.model(**processed_values)
-                session.add(new_instance)
-                try:
-                    await session.commit()
-                except SQLAlchemyError as e:
-                    await session.rollback()
-                    raise e
-                return new_instance
+        # Обрабатываем datetime поля
+        processed_values = cls._process_datetime_values(values)
+
+        new_instance = cls.model(**processed_values)
+        async with transaction_scope() as session:
+            session.add(new_instance)
+        await invalidate_model(cls.model, new_instance.id)
+        return new_instance
 
     @classmethod
     async def add_many(cls, instances: list[dict]):
@@ -96,21 +292,125 @@ class BaseDAO:
         Возвращает:
             Список созданных экземпляров модели.
         """
-        async with async_session_maker() as session:
-            async with session.begin():
-                # Обрабатываем datetime поля для каждого экземпляра
-                processed_instances = [
-                    cls.model(**cls._process_datetime_values(instance_data))
-                    for instance_data in instances
-                ]
-                
-                session.add_all(processed_instances)
-                try:
-                    await session.commit()
-                except SQLAlchemyError as e:
-                    await session.rollback()
-                    raise e
-                return processed_instances
+        # Обрабатываем datetime поля для каждого экземпляра
+        processed_instances = [
+            cls.model(**cls._process_datetime_values(instance_data))
+            for instance_data in instances
+        ]
+
+        async with transaction_scope() as session:
+            session.add_all(processed_instances)
+        await invalidate_model(cls.model, ANY_ROW)
+        return processed_instances
+
+    @classmethod
+    async def bulk_insert(cls, rows: list[dict], returning: bool = True):
+        """
+        Асинхронно вставляет несколько записей одним многострочным INSERT ... RETURNING.
+        В отличие от add_many не создает ORM-объекты до вставки.
+
+        Аргументы:
+            rows: Список словарей со значениями колонок.
+            returning: Если True, возвращает созданные экземпляры модели.
+
+        Возвращает:
+            Список созданных экземпляров модели или количество вставленных строк.
+        """
+        if not rows:
+            return [] if returning else 0
+
+        processed_rows = [cls._process_datetime_values(row) for row in rows]
+        query = insert(cls.model).values(processed_rows)
+        async with transaction_scope() as session:
+            if returning:
+                inserted = (await session.scalars(query.returning(cls.model))).all()
+            else:
+                inserted = (await session.execute(query)).rowcount
+        await invalidate_model(cls.model, ANY_ROW)
+        return inserted
+
+    @classmethod
+    async def bulk_upsert(
+        cls,
+        rows: list[dict],
+        conflict_keys: Sequence[str],
+        update_fields: Optional[Sequence[str]] = None,
+        update_values: Optional[Callable[[Any], dict]] = None
+    ):
+        """
+        Асинхронно вставляет или обновляет несколько записей одним запросом
+        INSERT ... ON CONFLICT (conflict_keys) DO UPDATE ... RETURNING (PostgreSQL).
+
+        Аргументы:
+            rows: Список словарей со значениями колонок.
+            conflict_keys: Колонки уникального ограничения, по которому определяется конфликт.
+            update_fields: Колонки, которые берутся из новой строки при конфликте
+                (по умолчанию - все переданные колонки, кроме conflict_keys).
+            update_values: Функция excluded -> dict с дополнительными выражениями для SET.
+
+        Возвращает:
+            Список вставленных или обновленных экземпляров модели.
+        """
+        if not rows:
+            return []
+
+        # Дубликаты ключа в одном запросе недопустимы для ON CONFLICT DO UPDATE - оставляем последний
+        unique_rows = {
+            tuple(row[key] for key in conflict_keys): cls._process_datetime_values(row)
+            for row in rows
+        }
+        processed_rows = list(unique_rows.values())
+
+        query = pg_insert(cls.model).values(processed_rows)
+        if update_fields is None:
+            update_fields = [key for key in processed_rows[0] if key not in conflict_keys]
+
+        set_ = {field: query.excluded[field] for field in update_fields}
+        if update_values:
+            set_.update(update_values(query.excluded))
+        if 'updated_at' in cls.model.__table__.c and 'updated_at' not in set_:
+            set_['updated_at'] = func.timezone('utc', func.now())
+
+        if set_:
+            query = query.on_conflict_do_update(index_elements=list(conflict_keys), set_=set_)
+        else:
+            query = query.on_conflict_do_nothing(index_elements=list(conflict_keys))
+
+        query = query.returning(cls.model).execution_options(populate_existing=True)
+        async with transaction_scope() as session:
+            result = (await session.scalars(query)).all()
+        await invalidate_model(cls.model)
+        return result
+
+    @classmethod
+    async def copy_records(cls, records: Sequence[tuple], columns: Sequence[str]) -> int:
+        """
+        Асинхронно загружает записи через COPY (asyncpg copy_records_to_table).
+        Самый быстрый путь для импорта больших объемов; ORM-события и Python-значения
+        по умолчанию не применяются, поэтому все обязательные колонки нужно передать явно.
+
+        Аргументы:
+            records: Последовательность кортежей в порядке columns.
+            columns: Имена колонок таблицы.
+
+        Возвращает:
+            Количество загруженных записей.
+        """
+        if not records:
+            return 0
+
+        table = cls.model.__table__
+        async with transaction_scope() as session:
+            connection = await session.connection()
+            raw_connection = await connection.get_raw_connection()
+            await raw_connection.driver_connection.copy_records_to_table(
+                table.name,
+                records=records,
+                columns=list(columns),
+                schema_name=table.schema
+            )
+        await invalidate_model(cls.model, ANY_ROW)
+        return len(records)
 
     @classmethod
     async def update(cls, filter_by, **values):
@@ -125,21 +425,16 @@ class BaseDAO:
         Возвращает:
             Количество обновленных экземпляров модели.
         """
-        async with async_session_maker() as session:
-            async with session.begin():
-                query = (
-                    sqlalchemy_update(cls.model)
-                    .where(*[getattr(cls.model, k) == v for k, v in filter_by.items()])
-                    .values(**values)
-                    .execution_options(synchronize_session="fetch")
-                )
-                result = await session.execute(query)
-                try:
-                    await session.commit()
-                except SQLAlchemyError as e:
-                    await session.rollback()
-                    raise e
-                return result.rowcount
+        query = (
+            sqlalchemy_update(cls.model)
+            .where(*[getattr(cls.model, k) == v for k, v in filter_by.items()])
+            .values(**values)
+            .execution_options(synchronize_session="fetch")
+        )
+        async with transaction_scope() as session:
+            result = await session.execute(query)
+        await invalidate_model(cls.model, filter_by.get('id'))
+        return result.rowcount
 
     @classmethod
     async def delete(cls, delete_all: bool = False, **filter_by):
@@ -157,17 +452,30 @@ class BaseDAO:
             if not filter_by:
                 raise ValueError("Необходимо указать хотя бы один параметр для удаления.")
 
-        async with async_session_maker() as session:
-            async with session.begin():
-                query = sqlalchemy_delete(cls.model).filter_by(**filter_by)
-                result = await session.execute(query)
-                try:
-                    await session.commit()
-                except SQLAlchemyError as e:
-                    await session.rollback()
-                    raise e
-                return result.rowcount
+        query = sqlalchemy_delete(cls.model).filter_by(**filter_by)
+        async with transaction_scope() as session:
+            result = await session.execute(query)
+        await invalidate_model(cls.model, filter_by.get('id'))
+        return result.rowcount
             
+    @classmethod
+    def _projection(cls, columns: Sequence) -> list:
+        """Преобразует имена атрибутов модели в колонки, выражения оставляет как есть"""
+        return [getattr(cls.model, column) if isinstance(column, str) else column for column in columns]
+
+    @classmethod
+    def column_names(cls, columns: Sequence) -> list[str]:
+        """Имена полей легких строк (Row._fields) для колонок columns"""
+        return [column.key for column in cls._projection(columns)]
+
+    @classmethod
+    def _rows_query(cls, selected: list, joins: Sequence, where: Sequence, filter_by: dict):
+        """Строит SELECT по колонкам; filter_by всегда относится к колонкам cls.model"""
+        query = select(*selected).select_from(cls.model)
+        for target, onclause in joins:
+            query = query.outerjoin(target, onclause)
+        return query.where(*[getattr(cls.model, k) == v for k, v in filter_by.items()], *where)
+
     @classmethod
     def _process_datetime_values(cls, values: dict) -> dict:
         """
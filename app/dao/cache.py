@@ -0,0 +1,312 @@
+# app/dao/cache.py
+"""
+Двухуровневый кэш для методов DAO.
+
+L1 - локальный TTL/LRU кэш процесса (воркера uvicorn), L2 - Redis.
+Метод DAO подключается к кэшу декоратором @cached. BaseDAO.add/update/delete
+(и остальные методы записи) сбрасывают записи модели автоматически: сразу
+и повторно после commit unit of work. Сброс публикуется в Redis pub/sub,
+чтобы остальные воркеры удалили свои L1-копии.
+
+Значения хранятся сериализованными (pickle), каждый вызов получает свою копию
+объекта. Redis должен быть внутренним и доверенным. При недоступности Redis
+кэш работает только на L1 со сроком жизни CACHE_L1_TTL.
+"""
+import asyncio
+import functools
+import hashlib
+import json
+import pickle
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.core.redis import REDIS_RETRY_DELAY, redis_client, redis_failed
+from app.dao.loader import forget_loaded
+from app.dao.replica import primary_reads
+from app.dao.session import after_commit, get_current_session
+from app.logger import app_logger as logger
+
+
+KEY_PREFIX = "dao"
+CHANNEL = "dao:invalidate"
+# Ожидание сообщения pub/sub за один вызов (секунды). Явный таймаут: пустое ожидание
+# возвращает None, а не TimeoutError по socket_timeout общего клиента Redis
+PUBSUB_POLL_TIMEOUT = 5.0
+# Запись кэша без первичного ключа (списки, поиск по имени и т.д.)
+ANY_ROW = "_"
+# Ключ session.info: unit of work уже что-то записал, кэш для него не используется
+WRITES_KEY = "dao_cache_writes"
+
+
+class LocalCache:
+    """L1: TTL/LRU кэш в памяти процесса с индексом ключей по (таблица, pk)"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict[str, tuple[float, bytes, str, str]] = OrderedDict()
+        self._index: dict[str, dict[str, set[str]]] = {}
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self._remove(key)
+            return None
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: str, payload: bytes, table: str, pk: str, ttl: float):
+        if key in self._data:
+            self._remove(key)
+        self._data[key] = (time.monotonic() + ttl, payload, table, pk)
+        self._index.setdefault(table, {}).setdefault(pk, set()).add(key)
+        while len(self._data) > self.maxsize:
+            self._remove(next(iter(self._data)))
+
+    def invalidate(self, table: str, pk: Optional[str] = None):
+        """pk=None - все записи таблицы, иначе записи строки pk и записи без pk"""
+        by_pk = self._index.get(table)
+        if not by_pk:
+            return
+        groups = list(by_pk) if pk is None else [pk, ANY_ROW]
+        for group in groups:
+            for key in list(by_pk.get(group, ())):
+                self._remove(key)
+
+    def clear(self):
+        self._data.clear()
+        self._index.clear()
+
+    def _remove(self, key: str):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        _, _, table, pk = entry
+        keys = self._index.get(table, {}).get(pk)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._index[table][pk]
+
+
+class DAOCache:
+    """L1 + L2 (Redis) кэш с инвалидацией по модели и первичному ключу"""
+
+    def __init__(self):
+        self.enabled = settings.CACHE_ENABLED
+        self.default_ttl = settings.CACHE_TTL
+        self.l1_ttl = settings.CACHE_L1_TTL
+        self.local = LocalCache(settings.CACHE_L1_MAXSIZE)
+        self.origin = uuid.uuid4().hex
+        self._listener: Optional[asyncio.Task] = None
+        self._invalidation_callbacks: list[Callable[[Optional[str], Optional[str]], None]] = []
+
+    # --- Redis ---
+
+    def _l2_failed(self, error: Exception):
+        logger.warning(f"DAO cache: Redis недоступен, работаем только на L1: {error}")
+        redis_failed()
+
+    @staticmethod
+    def _tag(table: str, pk: Optional[str] = None) -> str:
+        return f"{KEY_PREFIX}:tag:{table}" if pk is None else f"{KEY_PREFIX}:tag:{table}:{pk}"
+
+    # --- Чтение/запись ---
+
+    async def get(self, key: str) -> tuple[bool, Any]:
+        """Возвращает (найдено, значение)"""
+        payload = self.local.get(key)
+        if payload is None:
+            client = redis_client()
+            if client is None:
+                return False, None
+            try:
+                payload = await client.get(key)
+            except (RedisError, OSError) as e:
+                self._l2_failed(e)
+                return False, None
+            if payload is None:
+                return False, None
+            table, pk = key.split(":")[1:3]
+            self.local.set(key, payload, table, pk, self.l1_ttl)
+        return True, pickle.loads(payload)
+
+    async def set(self, key: str, value: Any, table: str, pk: str, ttl: int):
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.local.set(key, payload, table, pk, min(ttl, self.l1_ttl))
+
+        client = redis_client()
+        if client is None:
+            return
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.set(key, payload, ex=ttl)
+                for tag in (self._tag(table), self._tag(table, pk)):
+                    pipe.sadd(tag, key)
+                    pipe.expire(tag, ttl)
+                await pipe.execute()
+        except (RedisError, OSError) as e:
+            self._l2_failed(e)
+
+    # --- Инвалидация ---
+
+    def on_invalidate(self, callback: Callable[[Optional[str], Optional[str]], None]):
+        """
+        Подписывает локальный кэш вне DAOCache (например, снимки пользователей) на сбросы
+        этого и остальных воркеров: callback(table, pk); table=None - сбросить все.
+        """
+        self._invalidation_callbacks.append(callback)
+
+    def _notify(self, table: Optional[str], pk: Optional[str]):
+        for callback in self._invalidation_callbacks:
+            callback(table, pk)
+
+    async def invalidate(self, table: str, pk: Any = None):
+        """
+        Сбрасывает записи таблицы: pk=None - все записи, иначе записи строки pk
+        и записи без pk (списки). Сброс рассылается остальным воркерам и при
+        CACHE_ENABLED=false: на него подписаны кэши вне DAOCache (on_invalidate).
+        """
+        pk = None if pk is None else str(pk)
+        self._notify(table, pk)
+        if self.enabled:
+            self.local.invalidate(table, pk)
+
+        client = redis_client()
+        if client is None:
+            return
+        try:
+            tags = [self._tag(table)] if pk is None else [self._tag(table, pk), self._tag(table, ANY_ROW)]
+            keys = set()
+            if self.enabled:
+                for tag in tags:
+                    keys.update(await client.smembers(tag))
+            async with client.pipeline(transaction=False) as pipe:
+                if self.enabled:
+                    if keys:
+                        pipe.delete(*keys)
+                    pipe.delete(*tags)
+                pipe.publish(CHANNEL, json.dumps({"origin": self.origin, "table": table, "pk": pk}))
+                await pipe.execute()
+        except (RedisError, OSError) as e:
+            self._l2_failed(e)
+
+    # --- Pub/sub ---
+
+    async def start(self):
+        """
+        Запускает подписку на сбросы от других воркеров (вызывается в lifespan);
+        работает и при CACHE_ENABLED=false - для подписчиков on_invalidate
+        """
+        if self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self):
+        while True:
+            pubsub = None
+            try:
+                client = redis_client()
+                if client is None:
+                    await asyncio.sleep(REDIS_RETRY_DELAY)
+                    continue
+                pubsub = client.pubsub()
+                await pubsub.subscribe(CHANNEL)
+                # Сообщения, пропущенные до подписки, не придут - начинаем с чистого L1
+                self.local.clear()
+                self._notify(None, None)
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=PUBSUB_POLL_TIMEOUT)
+                    if message is None:
+                        continue
+                    data = json.loads(message["data"])
+                    if data.get("origin") != self.origin:
+                        self.local.invalidate(data["table"], data.get("pk"))
+                        self._notify(data["table"], data.get("pk"))
+            except asyncio.CancelledError:
+                raise
+            except (RedisError, OSError, ValueError) as e:
+                self._l2_failed(e)
+                await asyncio.sleep(REDIS_RETRY_DELAY)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except (RedisError, OSError):
+                        pass
+
+
+dao_cache = DAOCache()
+
+
+async def invalidate_model(model, pk: Any = None):
+    """
+    Сбрасывает кэш модели (см. DAOCache.invalidate) и значения, запомненные
+    загрузчиками таблицы в текущем запросе (см. app/dao/loader.py).
+    Внутри unit of work сброс повторяется после commit, а методы с @cached
+    до конца unit of work читают из БД.
+    """
+    table = model.__tablename__
+    forget_loaded(table)
+    await dao_cache.invalidate(table, pk)
+
+    session = get_current_session()
+    if session is not None:
+        session.info[WRITES_KEY] = True
+        after_commit(session, lambda: dao_cache.invalidate(table, pk))
+
+
+def cached(ttl: Optional[int] = None, by_pk: bool = False) -> Callable:
+    """
+    Декоратор метода DAO (под @classmethod): кэширует результат в L1/L2.
+    by_pk=True - первый аргумент метода является первичным ключом cls.model,
+    запись сбрасывается при изменении этой строки. Иначе запись сбрасывается
+    при любой записи в таблицу. None не кэшируется.
+
+    Пример:
+        @classmethod
+        @cached(by_pk=True)
+        async def find_by_id(cls, role_id: int): ...
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(cls, *args, **kwargs):
+            session = get_current_session()
+            if not dao_cache.enabled or (session is not None and session.info.get(WRITES_KEY)):
+                return await func(cls, *args, **kwargs)
+
+            table = cls.model.__tablename__
+            pk = ANY_ROW
+            if by_pk:
+                pk = str(args[0] if args else next(iter(kwargs.values())))
+            digest = hashlib.sha1(repr((args, sorted(kwargs.items()))).encode()).hexdigest()[:16]
+            key = f"{KEY_PREFIX}:{table}:{pk}:{cls.__name__}.{func.__name__}:{digest}"
+
+            found, value = await dao_cache.get(key)
+            if found:
+                return value
+
+            # Кэшируется только прочитанное из основной БД (реплика может отставать)
+            with primary_reads():
+                value = await func(cls, *args, **kwargs)
+            if value is not None:
+                await dao_cache.set(key, value, table, pk, ttl or dao_cache.default_ttl)
+            return value
+
+        return wrapper
+
+    return decorator
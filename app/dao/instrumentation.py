@@ -0,0 +1,160 @@
+# app/dao/instrumentation.py
+"""
+Учет SQL-запросов по HTTP-запросам.
+
+Обработчики before/after_cursor_execute движков SQLAlchemy относят каждый
+запрос к текущему HTTP-запросу (SQLTimingMiddleware) и считают количество
+запросов и суммарное время в БД. Запрос с одинаковым текстом SQL, повторенный
+не менее SQL_N_PLUS_ONE_THRESHOLD раз за HTTP-запрос, считается вероятным N+1.
+
+Результат:
+  - заголовок ответа Server-Timing: db;dur=<мс>;desc="<N> queries"
+    (и db-repeat при подозрении на N+1) - виден в DevTools браузера;
+  - сводка по маршрутам текущего воркера - GET /monitoring/db/routes.
+
+Запросы, выполненные после отправки заголовков (StreamingResponse), попадают
+только в сводку.
+"""
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+from app.core.config import settings as core_settings
+from app.logger import app_logger as logger
+
+
+# Маршрут для запросов, не сопоставленных ни одному эндпоинту (404 и т.п.)
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class RequestSQLStats:
+    """SQL-запросы одного HTTP-запроса"""
+    __slots__ = ("count", "seconds", "shapes")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes: Counter[str] = Counter()
+
+    def repeated(self) -> list[tuple[str, int]]:
+        """Тексты SQL, повторенные не менее SQL_N_PLUS_ONE_THRESHOLD раз"""
+        threshold = core_settings.SQL_N_PLUS_ONE_THRESHOLD
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+class RouteSQLStats:
+    """Накопительная статистика маршрута с момента старта процесса"""
+    __slots__ = ("requests", "queries", "seconds", "max_queries", "n_plus_one_requests", "repeated_statement")
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.seconds = 0.0
+        self.max_queries = 0
+        self.n_plus_one_requests = 0
+        self.repeated_statement: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "queries_total": self.queries,
+            "queries_avg": round(self.queries / self.requests, 2) if self.requests else 0.0,
+            "queries_max": self.max_queries,
+            "db_seconds_total": round(self.seconds, 6),
+            "db_ms_avg": round(self.seconds / self.requests * 1000, 3) if self.requests else 0.0,
+            "n_plus_one_requests": self.n_plus_one_requests,
+            "repeated_statement": self.repeated_statement,
+        }
+
+
+request_sql_stats: ContextVar[Optional[RequestSQLStats]] = ContextVar("request_sql_stats", default=None)
+route_sql_stats: dict[str, RouteSQLStats] = {}
+# (маршрут, текст SQL), о которых уже предупреждали в логе
+_reported: set[tuple[str, str]] = set()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if request_sql_stats.get() is not None:
+        context.sql_timing_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = request_sql_stats.get()
+    start = getattr(context, "sql_timing_start", None)
+    if stats is None or start is None:
+        return
+    stats.count += 1
+    stats.seconds += time.perf_counter() - start
+    stats.shapes[statement] += 1
+
+
+def instrument_engine(engine):
+    """Подключает учет запросов к движку (AsyncEngine)"""
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def record_request(route: str, stats: RequestSQLStats):
+    """Добавляет HTTP-запрос в сводку маршрута и предупреждает о вероятном N+1"""
+    summary = route_sql_stats.get(route)
+    if summary is None:
+        summary = route_sql_stats[route] = RouteSQLStats()
+    summary.requests += 1
+    summary.queries += stats.count
+    summary.seconds += stats.seconds
+    summary.max_queries = max(summary.max_queries, stats.count)
+
+    repeated = stats.repeated()
+    if repeated:
+        shape, n = repeated[0]
+        summary.n_plus_one_requests += 1
+        summary.repeated_statement = shape[:500]
+        if (route, shape) not in _reported:
+            _reported.add((route, shape))
+            logger.warning(f"Вероятный N+1 в {route}: запрос выполнен {n} раз: {shape[:200]}")
+
+
+def routes_summary() -> dict:
+    """Сводка по маршрутам, самые "дорогие" по количеству запросов - первыми"""
+    items = sorted(route_sql_stats.items(), key=lambda item: item[1].queries, reverse=True)
+    return {route: summary.as_dict() for route, summary in items}
+
+
+def server_timing(stats: RequestSQLStats) -> str:
+    value = f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries"'
+    repeated = stats.repeated()
+    if repeated:
+        value += f', db-repeat;desc="{len(repeated)} repeated statements, max {repeated[0][1]}x"'
+    return value
+
+
+class SQLTimingMiddleware:
+    """ASGI middleware: учет SQL-запросов HTTP-запроса и заголовок Server-Timing"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not core_settings.SQL_INSTRUMENTATION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestSQLStats()
+        token = request_sql_stats.set(stats)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                header = (b"server-timing", server_timing(stats).encode())
+                message = {**message, "headers": [*message.get("headers", []), header]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            request_sql_stats.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None)
+            record_request(f"{scope['method']} {path}" if path else UNMATCHED_ROUTE, stats)
@@ -0,0 +1,135 @@
+# app/dao/loader.py
+"""
+Пакетная загрузка (DataLoader) в пределах HTTP-запроса.
+
+DataLoader.load(key) не выполняет запрос сразу: ключи, запрошенные в одной
+итерации event loop, собираются и загружаются одним запросом
+(WHERE id = ANY(:ids)), а результаты запоминаются до конца HTTP-запроса.
+Так цикл по строкам списка с загрузкой связанных записей выполняет один
+запрос вместо N.
+
+Использование:
+    users = await UsersDAO.load_many_by_ids([log.user_id for log in logs])
+
+Загрузчики живут в области видимости запроса (DataLoaderMiddleware). Вне
+HTTP-запроса каждый вызов get_loader возвращает новый загрузчик: пакетирование
+работает, запоминание - нет. Запись в таблицу через BaseDAO сбрасывает
+запомненные значения загрузчиков этой таблицы (см. invalidate_model).
+"""
+import asyncio
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Hashable, Iterable, Optional
+
+
+BatchLoadFn = Callable[[list], Awaitable[dict]]
+
+
+class DataLoader:
+    """Собирает ключи за одну итерацию event loop и загружает их одним вызовом batch_load"""
+
+    def __init__(self, batch_load: BatchLoadFn, lock: Optional[asyncio.Lock] = None):
+        # batch_load(keys) -> {key: value}; отсутствующие ключи дают None
+        self.batch_load = batch_load
+        # Запросы загрузчиков одного HTTP-запроса идут через общую сессию unit of work,
+        # поэтому выполняются по очереди; batch_load не должен сам ждать загрузчик
+        self._lock = lock or asyncio.Lock()
+        self._results: dict[Hashable, asyncio.Future] = {}
+        self._queue: list[Hashable] = []
+
+    def load(self, key: Hashable) -> Awaitable[Any]:
+        future = self._results.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._results[key] = loop.create_future()
+            self._queue.append(key)
+            if len(self._queue) == 1:
+                loop.call_soon(self._schedule_dispatch)
+        return future
+
+    async def load_many(self, keys: Iterable[Hashable]) -> list:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def clear(self, key: Optional[Hashable] = None):
+        """Забывает загруженное значение ключа (key=None - все значения)"""
+        if key is None:
+            self._results = {k: f for k, f in self._results.items() if not f.done()}
+        else:
+            future = self._results.get(key)
+            if future is not None and future.done():
+                del self._results[key]
+
+    def _schedule_dispatch(self):
+        asyncio.ensure_future(self._dispatch())
+
+    async def _dispatch(self):
+        keys, self._queue = self._queue, []
+        futures = [self._results[key] for key in keys]
+        try:
+            async with self._lock:
+                values = await self.batch_load(keys)
+        except Exception as e:
+            for key, future in zip(keys, futures):
+                # Ошибку не запоминаем: следующий load повторит запрос
+                if self._results.get(key) is future:
+                    del self._results[key]
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in zip(keys, futures):
+            if not future.done():
+                future.set_result(values.get(key))
+
+
+class LoaderScope:
+    """Загрузчики одного HTTP-запроса по имени (таблица, назначение)"""
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self._loaders: dict[tuple[str, str], DataLoader] = {}
+
+    def get(self, name: tuple[str, str], batch_load: BatchLoadFn) -> DataLoader:
+        loader = self._loaders.get(name)
+        if loader is None:
+            loader = self._loaders[name] = DataLoader(batch_load, self.lock)
+        return loader
+
+    def forget(self, table: str):
+        for (loader_table, _), loader in self._loaders.items():
+            if loader_table == table:
+                loader.clear()
+
+
+loader_scope: ContextVar[Optional[LoaderScope]] = ContextVar("loader_scope", default=None)
+
+
+def get_loader(name: tuple[str, str], batch_load: BatchLoadFn) -> DataLoader:
+    """Загрузчик текущего HTTP-запроса; вне запроса - новый загрузчик без запоминания"""
+    scope = loader_scope.get()
+    if scope is None:
+        return DataLoader(batch_load)
+    return scope.get(name, batch_load)
+
+
+def forget_loaded(table: str):
+    """Сбрасывает запомненные значения загрузчиков таблицы в текущем запросе"""
+    scope = loader_scope.get()
+    if scope is not None:
+        scope.forget(table)
+
+
+class DataLoaderMiddleware:
+    """ASGI middleware: область видимости загрузчиков на время HTTP-запроса"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = loader_scope.set(LoaderScope())
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            loader_scope.reset(token)
@@ -0,0 +1,146 @@
+# app/dao/pagination.py
+"""
+Keyset (cursor) пагинация.
+
+Курсор - непрозрачная строка (base64 от JSON) со значениями ключа сортировки
+последней записи страницы. Следующая страница выбирается условием
+WHERE (ключ) < (значения курсора), поэтому глубокие страницы стоят столько же,
+сколько первая (при наличии индекса по ключу сортировки).
+
+Колонки ключа сортировки должны быть NOT NULL: NULL не сравнивается условием
+курсора (см. check_keys). Значения курсора приводятся к типам колонок, поэтому
+подмененный курсор дает InvalidCursorError, а не ошибку БД.
+"""
+import base64
+import enum
+import json
+from datetime import date, datetime
+from typing import Any, Optional, Sequence
+
+from sqlalchemy import and_, literal, or_, tuple_
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+
+
+class InvalidCursorError(ValueError):
+    """Курсор поврежден или не соответствует сортировке"""
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+    return value
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Кодирует значения ключа сортировки в непрозрачный курсор"""
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _convert_value(value: Any, column: Any) -> Any:
+    """Значение курсора с типом колонки; InvalidCursorError, если тип не подходит"""
+    if value is None:
+        raise InvalidCursorError("Курсор не соответствует сортировке")
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type in (datetime, date):
+        # datetime - подкласс date, поэтому тип сравнивается точно
+        valid = type(value) is python_type
+    elif issubclass(python_type, enum.Enum):
+        try:
+            return python_type(value)
+        except ValueError:
+            valid = False
+    elif python_type is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    else:
+        valid = isinstance(value, python_type) and (python_type is bool or not isinstance(value, bool))
+    if not valid:
+        raise InvalidCursorError("Курсор не соответствует сортировке")
+    return value
+
+
+def decode_cursor(cursor: str, keys: list[tuple[Any, bool]]) -> list:
+    """Декодирует курсор и приводит значения к типам колонок ключа (keys из split_order_by)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError("Некорректный курсор") from e
+
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise InvalidCursorError("Курсор не соответствует сортировке")
+    try:
+        values = [_decode_value(v) for v in values]
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError("Некорректный курсор") from e
+    return [_convert_value(value, column) for value, (column, _) in zip(values, keys)]
+
+
+def split_order_by(order_by: Sequence[Any]) -> list[tuple[Any, bool]]:
+    """Разбирает order_by (колонки или desc(колонка)) на пары (колонка, по убыванию)"""
+    keys = []
+    for expr in order_by:
+        if isinstance(expr, UnaryExpression) and expr.modifier in (operators.desc_op, operators.asc_op):
+            keys.append((expr.element, expr.modifier is operators.desc_op))
+        else:
+            keys.append((expr, False))
+    return keys
+
+
+def check_keys(keys: list[tuple[Any, bool]]):
+    """ValueError, если колонка ключа сортировки допускает NULL"""
+    for column, _ in keys:
+        if getattr(column, "nullable", False):
+            raise ValueError(f"Keyset пагинация по колонке {column.key}, допускающей NULL, не поддерживается")
+
+
+def keyset_condition(keys: list[tuple[Any, bool]], values: Sequence[Any]):
+    """
+    Условие "строго после курсора" для ключа сортировки.
+    При одинаковом направлении всех колонок используется сравнение кортежей
+    (индексируемое), иначе - развернутое OR-условие.
+    """
+    directions = {is_desc for _, is_desc in keys}
+    columns = [column for column, _ in keys]
+    # Значения передаются bind-параметрами с типом колонки (в т.ч. True/False для Boolean)
+    values = [literal(value, column.type) for column, value in zip(columns, values)]
+
+    if len(directions) == 1:
+        left, right = tuple_(*columns), tuple_(*values)
+        return left < right if directions.pop() else left > right
+
+    clauses = []
+    for i, (column, is_desc) in enumerate(keys):
+        equal = [columns[j] == values[j] for j in range(i)]
+        step = column < values[i] if is_desc else column > values[i]
+        clauses.append(and_(*equal, step))
+    return or_(*clauses)
+
+
+def cursor_values(instance: Any, keys: list[tuple[Any, bool]]) -> list:
+    """Значения ключа сортировки для записи (по именам атрибутов колонок)"""
+    return [getattr(instance, column.key) for column, _ in keys]
+
+
+def next_cursor(items: Sequence[Any], keys: list[tuple[Any, bool]], has_more: bool) -> Optional[str]:
+    """Курсор следующей страницы или None, если страница последняя"""
+    if not has_more or not items:
+        return None
+    return encode_cursor(cursor_values(items[-1], keys))
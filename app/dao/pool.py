@@ -0,0 +1,113 @@
+# app/dao/pool.py
+"""
+Метрики пула соединений с БД.
+
+MeteredQueuePool - пул SQLAlchemy для asyncpg, который дополнительно считает
+выдачи соединений, время ожидания выдачи и таймауты. Вместе с текущим
+состоянием пула (занято, overflow) это позволяет подбирать pool_size и
+количество воркеров под max_connections Postgres по данным, а не наугад.
+Метрики собираются на процесс (воркер uvicorn).
+"""
+import os
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+@dataclass
+class PoolMetrics:
+    """Накопительные счетчики пула с момента старта процесса"""
+    checkouts: int = 0
+    checkout_timeouts: int = 0
+    checkout_wait_seconds: float = 0.0
+    checkout_wait_max_seconds: float = 0.0
+    connects: int = 0
+    invalidations: int = 0
+
+    def record_checkout(self, wait: float):
+        self.checkouts += 1
+        self.checkout_wait_seconds += wait
+        if wait > self.checkout_wait_max_seconds:
+            self.checkout_wait_max_seconds = wait
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool с учетом времени ожидания соединения и таймаутов"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.metrics.checkout_timeouts += 1
+            raise
+        self.metrics.record_checkout(time.perf_counter() - start)
+        return connection
+
+    def _create_connection(self):
+        self.metrics.connects += 1
+        return super()._create_connection()
+
+    def _invalidate(self, connection, exception=None, _checkin=True):
+        self.metrics.invalidations += 1
+        return super()._invalidate(connection, exception, _checkin)
+
+
+def pool_status(engine) -> dict:
+    """Текущее состояние и счетчики пула движка (для эндпоинта мониторинга)"""
+    pool = engine.pool
+    status = {
+        "pid": os.getpid(),
+        "pool_class": type(pool).__name__,
+    }
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        status.update({
+            "pool_size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "pool_timeout_seconds": pool.timeout(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+        })
+
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        status.update({
+            "checkouts_total": metrics.checkouts,
+            "checkout_timeouts_total": metrics.checkout_timeouts,
+            "checkout_wait_seconds_total": round(metrics.checkout_wait_seconds, 6),
+            "checkout_wait_avg_seconds": round(metrics.checkout_wait_seconds / metrics.checkouts, 6) if metrics.checkouts else 0.0,
+            "checkout_wait_max_seconds": round(metrics.checkout_wait_max_seconds, 6),
+            "connects_total": metrics.connects,
+            "invalidations_total": metrics.invalidations,
+        })
+    return status
+
+
+def prometheus_lines(statuses: dict[str, dict]) -> list[str]:
+    """Числовые поля pool_status нескольких движков ({"primary": status, ...}) в формате Prometheus"""
+    lines = []
+    keys = dict.fromkeys(key for status in statuses.values() for key in status)
+    for key in keys:
+        samples = [
+            (name, status) for name, status in statuses.items()
+            if key != "pid" and isinstance(status.get(key), (int, float))
+        ]
+        if not samples:
+            continue
+        metric = f"db_pool_{key}"
+        lines.append(f"# TYPE {metric} {'counter' if key.endswith('_total') else 'gauge'}")
+        for name, status in samples:
+            lines.append(f'{metric}{{engine="{name}",pid="{status["pid"]}"}} {status[key]}')
+    return lines
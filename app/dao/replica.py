@@ -0,0 +1,192 @@
+# app/dao/replica.py
+"""
+Маршрутизация чтения на реплику.
+
+Политика:
+  - GET/HEAD запросы читают из реплики (session_scope/stream_scope вне unit of work);
+  - записи и unit of work всегда идут в основную БД;
+  - после записи запрос до конца читает из основной БД, а клиент получает cookie
+    на DB_READ_YOUR_WRITES_SECONDS, в течение которых его GET тоже идут в основную БД;
+  - ReplicaMonitor периодически измеряет отставание реплики; если оно больше
+    DB_REPLICA_MAX_LAG_SECONDS или реплика недоступна, чтение идет в основную БД;
+  - вне HTTP-запроса (фоновые задачи) используется основная БД;
+  - внутри primary_reads() чтение идет в основную БД: так загружаются данные,
+    которые сохраняются в кэши воркера/Redis или попадают в выпускаемые токены
+    (иначе сразу после сброса кэша в него попала бы отстающая копия строки).
+
+Без DB_REPLICA_HOST модуль ничего не меняет.
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.cookies import CookieError, SimpleCookie
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.core.config import settings as core_settings
+from app.database import replica_engine, replica_session_maker
+from app.logger import app_logger as logger
+
+
+READ_YOUR_WRITES_COOKIE = "db_primary_until"
+
+# Отставание standby; на сервере не в режиме восстановления (например, вторая
+# локальная БД вместо реплики в тестах) функции возвращают NULL -> отставание 0
+REPLICA_LAG_SQL = text("""
+    SELECT COALESCE(
+        CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+             ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+        END, 0)
+""")
+
+
+class RoutingState:
+    """Состояние маршрутизации текущего HTTP-запроса"""
+    __slots__ = ("use_replica", "wrote")
+
+    def __init__(self, use_replica: bool):
+        self.use_replica = use_replica
+        self.wrote = False
+
+
+routing_state: ContextVar[Optional[RoutingState]] = ContextVar("routing_state", default=None)
+# Чтение только из основной БД (см. primary_reads)
+primary_only: ContextVar[bool] = ContextVar("primary_only", default=False)
+
+
+class ReplicaMonitor:
+    """Фоновая проверка отставания реплики"""
+
+    def __init__(self):
+        self.healthy = False
+        self.lag_seconds: Optional[float] = None
+        self.checked_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def check(self) -> bool:
+        try:
+            async with replica_engine.connect() as connection:
+                lag = float(await connection.scalar(REPLICA_LAG_SQL))
+        except Exception as e:
+            if self.healthy:
+                logger.warning(f"Реплика недоступна, чтение переключено на основную БД: {e}")
+            self.healthy, self.lag_seconds = False, None
+        else:
+            healthy = lag <= core_settings.DB_REPLICA_MAX_LAG_SECONDS
+            if healthy != self.healthy:
+                logger.info(f"Реплика {'доступна' if healthy else 'отстает'}: отставание {lag:.1f} с")
+            self.healthy, self.lag_seconds = healthy, lag
+        self.checked_at = time.time()
+        return self.healthy
+
+    async def start(self):
+        if replica_engine is not None and self._task is None:
+            await self.check()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if replica_engine is not None:
+            await replica_engine.dispose()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(core_settings.DB_REPLICA_CHECK_INTERVAL_SECONDS)
+            await self.check()
+
+    def status(self) -> dict:
+        return {
+            "configured": replica_engine is not None,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag_seconds,
+            "max_lag_seconds": core_settings.DB_REPLICA_MAX_LAG_SECONDS,
+            "checked_at": self.checked_at,
+        }
+
+
+replica_monitor = ReplicaMonitor()
+
+
+@contextmanager
+def primary_reads():
+    """Чтение внутри блока - из основной БД (заполнение кэшей, данные для токенов)"""
+    token = primary_only.set(True)
+    try:
+        yield
+    finally:
+        primary_only.reset(token)
+
+
+def replica_allowed() -> bool:
+    """Можно ли читать из реплики в текущем контексте"""
+    state = routing_state.get()
+    return (
+        replica_session_maker is not None
+        and not primary_only.get()
+        and state is not None
+        and state.use_replica
+        and not state.wrote
+        and replica_monitor.healthy
+    )
+
+
+def get_read_session_maker():
+    """Фабрика сессий для чтения вне unit of work: реплика или None (основная БД)"""
+    return replica_session_maker if replica_allowed() else None
+
+
+def mark_write():
+    """Отмечает запись в текущем запросе: дальнейшее чтение - из основной БД"""
+    state = routing_state.get()
+    if state is not None:
+        state.wrote = True
+
+
+class ReadReplicaMiddleware:
+    """ASGI middleware: определяет маршрут чтения запроса и выставляет cookie read-your-writes"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or replica_session_maker is None:
+            await self.app(scope, receive, send)
+            return
+
+        state = RoutingState(use_replica=scope["method"] in ("GET", "HEAD") and not self._in_write_window(scope))
+        token = routing_state.set(state)
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and state.wrote:
+                window = core_settings.DB_READ_YOUR_WRITES_SECONDS
+                cookie = (f"{READ_YOUR_WRITES_COOKIE}={time.time() + window:.0f}; "
+                          f"Max-Age={int(window)}; Path=/; HttpOnly; SameSite=Lax")
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_cookie)
+        finally:
+            routing_state.reset(token)
+
+    @staticmethod
+    def _in_write_window(scope) -> bool:
+        for name, value in scope.get("headers", []):
+            if name != b"cookie":
+                continue
+            cookie = SimpleCookie()
+            try:
+                cookie.load(value.decode("latin-1"))
+                morsel = cookie.get(READ_YOUR_WRITES_COOKIE)
+                return morsel is not None and float(morsel.value) > time.time()
+            except (CookieError, ValueError, TypeError):
+                return False
+        return False
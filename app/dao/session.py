@@ -0,0 +1,143 @@
+# app/dao/session.py
+"""
+Сессия уровня запроса (unit of work) для DAO.
+
+Если внутри запроса открыт unit of work, все методы BaseDAO используют
+одну общую сессию и одно соединение из пула, а фиксация выполняется
+один раз в конце. Вне unit of work каждый вызов DAO, как и раньше,
+открывает собственную короткую сессию (для чтения - возможно, на реплике,
+см. app/dao/replica.py).
+"""
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Awaitable, AsyncIterator, Callable, Optional
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import async_session_maker
+from app.dao.replica import get_read_session_maker, mark_write, replica_allowed
+
+
+# Текущая сессия unit of work (None - unit of work не открыт)
+current_session: ContextVar[Optional[AsyncSession]] = ContextVar("current_session", default=None)
+
+# Ключ session.info со списком действий после commit
+AFTER_COMMIT_KEY = "after_commit"
+
+
+def get_current_session() -> Optional[AsyncSession]:
+    """Возвращает сессию текущего unit of work или None"""
+    return current_session.get()
+
+
+def after_commit(session: AsyncSession, callback: Callable[[], Awaitable]):
+    """Регистрирует действие, выполняемое после успешного commit unit of work (при rollback отбрасывается)"""
+    session.info.setdefault(AFTER_COMMIT_KEY, []).append(callback)
+
+
+@asynccontextmanager
+async def unit_of_work() -> AsyncIterator[AsyncSession]:
+    """
+    Открывает unit of work: одна сессия на весь блок и один commit в конце.
+    Вложенный вызов присоединяется к уже открытому unit of work.
+    """
+    session = current_session.get()
+    if session is not None:
+        yield session
+        return
+
+    async with async_session_maker() as session:
+        token = current_session.set(session)
+        try:
+            yield session
+            await session.commit()
+            mark_write()
+        except BaseException:
+            await session.rollback()
+            raise
+        finally:
+            current_session.reset(token)
+            callbacks = session.info.pop(AFTER_COMMIT_KEY, [])
+
+        for callback in callbacks:
+            await callback()
+
+
+@asynccontextmanager
+async def session_scope() -> AsyncIterator[AsyncSession]:
+    """Сессия для чтения: общая сессия unit of work или новая короткая сессия (реплика, если разрешено)"""
+    session = current_session.get()
+    if session is not None:
+        yield session
+        return
+
+    session_maker = get_read_session_maker() or async_session_maker
+    async with session_maker() as session:
+        yield session
+
+
+@asynccontextmanager
+async def transaction_scope() -> AsyncIterator[AsyncSession]:
+    """
+    Сессия для записи.
+    Внутри unit of work изменения только сбрасываются в БД (flush), commit выполняет
+    unit of work. Вне его открывается отдельная транзакция с commit/rollback.
+    """
+    mark_write()
+    session = current_session.get()
+    if session is not None:
+        yield session
+        await session.flush()
+        return
+
+    async with async_session_maker() as session:
+        async with session.begin():
+            yield session
+
+
+@asynccontextmanager
+async def stream_scope() -> AsyncIterator[AsyncSession]:
+    """
+    Отдельная сессия для потокового чтения (серверный курсор).
+    Не присоединяется к unit of work: поток читается уже после ответа обработчика
+    (StreamingResponse), когда unit of work запроса закрыт.
+    """
+    session_maker = get_read_session_maker() or async_session_maker
+    async with session_maker() as session:
+        yield session
+
+
+async def get_uow_session() -> AsyncIterator[AsyncSession]:
+    """
+    FastAPI-зависимость: сессия unit of work для эндпоинта.
+    Если роутер использует UnitOfWorkRoute, возвращается уже открытая сессия запроса.
+    """
+    async with unit_of_work() as session:
+        yield session
+
+
+class UnitOfWorkRoute(APIRoute):
+    """
+    Класс маршрута, открывающий unit of work на весь запрос, включая зависимости
+    (get_current_user и т.д.). Commit выполняется до отправки ответа клиенту,
+    поэтому ошибка фиксации превращается в 500, а не теряется после ответа.
+
+    GET-запросы, направленные на реплику (см. app/dao/replica.py), выполняются
+    без unit of work: чтение идет в реплику, а случайная запись - в отдельной
+    транзакции основной БД.
+
+    Использование: APIRouter(..., route_class=UnitOfWorkRoute)
+    """
+
+    def get_route_handler(self) -> Callable:
+        original_route_handler = super().get_route_handler()
+
+        async def unit_of_work_route_handler(request: Request) -> Response:
+            if replica_allowed():
+                return await original_route_handler(request)
+            async with unit_of_work():
+                return await original_route_handler(request)
+
+        return unit_of_work_route_handler
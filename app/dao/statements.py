@@ -0,0 +1,68 @@
+# app/dao/statements.py
+"""
+Реестр заранее построенных параметризованных запросов.
+
+Запрос строится один раз (значения передаются через bindparam при выполнении),
+поэтому на горячих путях не создаются новые select(...) и не пересчитывается
+ключ кэша компиляции SQLAlchemy: он мемоизируется на самом объекте запроса.
+Одинаковый текст SQL также позволяет asyncpg переиспользовать подготовленные
+выражения соединения.
+
+Использование:
+    @statements.register("users.by_email")
+    def _user_by_email():
+        return select(User).where(User.user_email == bindparam("user_email"))
+
+    result = await session.execute(statements.get("users.by_email"), {"user_email": email})
+"""
+from typing import Any, Callable, Hashable, Optional
+
+from sqlalchemy.engine import Dialect
+
+from app.logger import app_logger as logger
+
+
+class StatementRegistry:
+    """Ленивый реестр запросов: фабрика вызывается при первом обращении или при проверке (validate)"""
+
+    def __init__(self):
+        self._factories: dict[Hashable, Callable[[], Any]] = {}
+        self._statements: dict[Hashable, Any] = {}
+
+    def register(self, name: Hashable, factory: Optional[Callable[[], Any]] = None):
+        """Регистрирует фабрику запроса; можно использовать как декоратор"""
+        if factory is None:
+            return lambda func: self.register(name, func)
+        self._factories[name] = factory
+        self._statements.pop(name, None)
+        return factory
+
+    def get(self, name: Hashable, factory: Optional[Callable[[], Any]] = None):
+        """
+        Возвращает запрос по имени. Если передана factory и запрос не зарегистрирован,
+        она регистрируется (удобно для запросов, общих для всех моделей BaseDAO).
+        """
+        statement = self._statements.get(name)
+        if statement is None:
+            if name not in self._factories:
+                if factory is None:
+                    raise KeyError(f"Запрос {name!r} не зарегистрирован")
+                self._factories[name] = factory
+            statement = self._statements[name] = self._factories[name]()
+        return statement
+
+    def validate(self, dialect: Dialect) -> int:
+        """
+        Строит все зарегистрированные запросы и проверяет их компиляцию под диалект:
+        ошибки в запросах проявляются при старте, а не на первом запросе пользователя.
+        Кэш компиляции движка и подготовленные выражения соединений при этом не
+        заполняются - это происходит при первом выполнении запроса.
+        Возвращает количество запросов.
+        """
+        for name in list(self._factories):
+            self.get(name).compile(dialect=dialect)
+        logger.info(f"✅ Проверено запросов DAO: {len(self._factories)}")
+        return len(self._factories)
+
+
+statements = StatementRegistry()
@@ -6,14 +6,32 @@ from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, Asyn
 from sqlalchemy.orm import DeclarativeBase, declared_attr, Mapped, mapped_column
 
 from app.config import get_db_url
+from app.core.config import settings as core_settings
+from app.dao.instrumentation import instrument_engine
+from app.dao.pool import MeteredQueuePool
 
 
 DATABASE_URL = get_db_url()
 
-engine = create_async_engine(DATABASE_URL) # создаёт асинхронное подключение к базе данных PostgreSQL, используя драйвер asyncpg
+# создаёт асинхронное подключение к базе данных PostgreSQL, используя драйвер asyncpg;
+# параметры пула - из Settings (app/core/config.py), метрики пула - см. app/dao/pool.py
+engine = create_async_engine(DATABASE_URL, poolclass=MeteredQueuePool, **core_settings.db_pool_options)
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False) # создаёт фабрику асинхронных сессий, используя созданный движок. 
                                                                          # Сессии используются для выполнения транзакций в базе данных
 
+# Необязательная реплика для чтения (маршрутизация - см. app/dao/replica.py)
+REPLICA_DATABASE_URL = core_settings.replica_database_url
+replica_engine = (
+    create_async_engine(REPLICA_DATABASE_URL, poolclass=MeteredQueuePool, **core_settings.db_pool_options)
+    if REPLICA_DATABASE_URL else None
+)
+replica_session_maker = async_sessionmaker(replica_engine, expire_on_commit=False) if replica_engine else None
+
+# Учет SQL-запросов по HTTP-запросам (см. app/dao/instrumentation.py)
+for _engine in (engine, replica_engine):
+    if _engine is not None:
+        instrument_engine(_engine)
+
 # настройка аннотаций
 int_pk = Annotated[int, mapped_column(primary_key=True)]
 created_at = Annotated[datetime, mapped_column(server_default=func.now())]
@@ -9,6 +9,26 @@ class TokenNoFoundException(HTTPException):
     def __init__(self):
         super().__init__(status_code=status.HTTP_401_UNAUTHORIZED, detail="Токен не найден")
 
+
+class TooManyLoginAttemptsException(HTTPException):
+    def __init__(self, retry_after: int):
+        super().__init__(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                         detail="Слишком много попыток входа, повторите попытку позже",
+                         headers={"Retry-After": str(max(1, retry_after))})
+
+
+class PasswordHashingBusyException(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                         detail="Сервер перегружен, повторите попытку позже",
+                         headers={"Retry-After": "1"})
+
+class TokenVersionUnavailableException(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                         detail="Проверка токенов временно недоступна, повторите попытку позже",
+                         headers={"Retry-After": "5"})
+
 UserAlreadyExistsException = HTTPException(status_code=status.HTTP_409_CONFLICT,
                                            detail='Пользователь уже существует')
 
@@ -8,10 +8,21 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.logger import app_logger as logger
 from app.tasks.log_cleanup_task import log_cleanup
 from app.tasks.background_tasks import background_tasks
+from app.core.redis import close_redis
+from app.dao.cache import dao_cache
+from app.dao.statements import statements
+from app.dao.replica import ReadReplicaMiddleware, replica_monitor
+from app.dao.loader import DataLoaderMiddleware
+from app.dao.instrumentation import SQLTimingMiddleware
+from app.users.tokens import TokenRefreshMiddleware
+from app.users.availability import taken_values
+from app.roles.counts import role_counts_reconciler
+from app.users.audit_log import audit_log
+from app.users.hashing import password_hasher
 import asyncio
 
 # Импортируем все необходимое
-from app.database import engine, async_session_maker
+from app.database import engine, replica_engine, async_session_maker
 from app.models.relationships import configure_relationships
 
 
@@ -67,18 +78,42 @@ async def shutdown():
     await engine.dispose()
     print("✅ Соединения с базой данных закрыты")
 
+async def start_component(name: str, start):
+    """Запуск компонента в lifespan: ошибка одного компонента не отменяет запуск остальных"""
+    try:
+        result = start()
+        if asyncio.iscoroutine(result):
+            await result
+    except Exception as e:
+        logger.error(f"❌ Ошибка при запуске ({name}): {e}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
        # Startup
     logger.info("🚀 Starting FastAPI application...")
-    
-    try:
-        # Запускаем фоновую задачу очистки логов
-        asyncio.create_task(log_cleanup.start_periodic_cleanup())
-        logger.info("✅ Фоновая задача очистки логов запущена")
-        
-    except Exception as e:
-        logger.error(f"❌ Ошибка при запуске фоновых задач: {e}")
+
+    # Фоновая задача очистки логов
+    await start_component("очистка логов", lambda: asyncio.create_task(log_cleanup.start_periodic_cleanup()))
+    logger.info("✅ Фоновая задача очистки логов запущена")
+
+    # Подписка на сброс кэша DAO от других воркеров
+    await start_component("кэш DAO", dao_cache.start)
+
+    # Построение запросов горячих путей и проверка их компиляции до первого запроса
+    await start_component("реестр запросов", lambda: statements.validate(engine.dialect))
+
+    # Проверка отставания реплики для чтения (если настроена)
+    await start_component("мониторинг реплики", replica_monitor.start)
+
+    # Фильтр занятых ников/email для проверок доступности (строится в фоне)
+    await start_component("фильтр занятых значений", taken_values.start)
+
+    # Сверка roles.count_users с фактическим числом пользователей ролей
+    await start_component("сверка счетчиков ролей", role_counts_reconciler.start)
+
+    # Дозапись логов действий, сохраненных в файлы при недоступной БД
+    await start_component("логи действий", audit_log.start)
     
     yield
     
@@ -86,6 +121,18 @@ async def lifespan(app: FastAPI):
     logger.info("🛑 Shutting down application...")
     log_cleanup.is_running = False
     logger.info("✅ Фоновая задача очистки логов остановлена")
+    # Очередь логов действий - до закрытия кэша DAO и соединений с БД
+    await audit_log.close()
+    await dao_cache.close()
+    await replica_monitor.close()
+    await taken_values.close()
+    await role_counts_reconciler.close()
+    # Соединения с БД закрываются после остановки всех фоновых задач, пишущих в нее
+    await engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
+    password_hasher.close()
+    await close_redis()
 
 
 app = FastAPI(
@@ -105,6 +152,19 @@ app.add_middleware(
     allow_headers=["*"],  # Разрешить все заголовки
 )
 
+# Маршрутизация чтения GET-запросов на реплику (без DB_REPLICA_HOST ничего не делает)
+app.add_middleware(ReadReplicaMiddleware)
+
+# Пакетная загрузка связанных записей в пределах запроса (см. app/dao/loader.py)
+app.add_middleware(DataLoaderMiddleware)
+
+# Новый access-токен по refresh-токену, когда короткий access-токен истек (см. app/users/tokens.py)
+app.add_middleware(TokenRefreshMiddleware)
+
+# Количество и время SQL-запросов: заголовок Server-Timing и /monitoring/db/routes.
+# Добавляется последним, чтобы охватывать остальные middleware
+app.add_middleware(SQLTimingMiddleware)
+
 
 
 # @app.get("/") # эндпоинт главной страницы
@@ -135,6 +195,7 @@ app.include_router(router_billing)
 app.include_router(router_students)
 app.include_router(router_majors)
 app.include_router(router_roles)
+app.include_router(router_monitoring)
 # app.include_router(chat_router)
 
 # Обработчик для TokenExpired
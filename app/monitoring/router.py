@@ -1,8 +1,18 @@
 # app/monitoring/router.py
+from typing import Optional
 from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.users.dependencies import get_current_user
-from app.database import async_session_maker
+from app.users.dependencies import get_current_user, get_current_admin
+from app.database import async_session_maker, engine, replica_engine
+from app.dao.instrumentation import routes_summary
+from app.dao.pool import pool_status, prometheus_lines
+from app.dao.replica import replica_monitor
+from app.users.hashing import password_hasher
+from app.users.login_throttle import login_throttle
+from app.users.availability import taken_values
+from app.roles.counts import role_counts_reconciler
+from app.users.audit_log import audit_log
 from app.users.models import User
 
 router = APIRouter(prefix="/monitoring", tags=["Monitoring"])
@@ -24,4 +34,62 @@ async def get_service_logs(
     db: AsyncSession = Depends(async_session_maker)
 ):
     """Получить логи сервиса"""
-    pass
\ No newline at end of file
+    pass
+
+@router.get("/db/pool", summary="Состояние пула соединений с БД")
+async def get_db_pool_status(current_user: User = Depends(get_current_admin)):
+    """Занятые соединения, overflow, время ожидания выдачи и таймауты (для текущего воркера)"""
+    status = pool_status(engine)
+    if replica_engine is not None:
+        status["replica"] = pool_status(replica_engine)
+    return status
+
+@router.get("/db/replica", summary="Состояние реплики для чтения")
+async def get_db_replica_status(current_user: User = Depends(get_current_admin)):
+    """Настроена ли реплика, ее отставание и используется ли она для чтения"""
+    return replica_monitor.status()
+
+@router.get("/db/routes", summary="SQL-запросы по маршрутам")
+async def get_db_routes_stats(current_user: User = Depends(get_current_admin)):
+    """
+    Количество и время SQL-запросов по маршрутам (для текущего воркера), сначала
+    маршруты с наибольшим числом запросов; n_plus_one_requests - запросы с вероятным N+1
+    """
+    return routes_summary()
+
+@router.get("/auth/hashing", summary="Пул хеширования паролей")
+async def get_password_hashing_status(current_user: User = Depends(get_current_admin)):
+    """Время bcrypt, ожидание и глубина очереди пула, отказы с 503 (для текущего воркера)"""
+    return password_hasher.status()
+
+@router.get("/users/availability-filter", summary="Фильтр доступности ников и email")
+async def get_availability_filter_status(current_user: User = Depends(get_current_admin)):
+    """Размер фильтра Блума и доля проверок без запроса к БД (для текущего воркера)"""
+    return taken_values.status()
+
+@router.get("/roles/counts", summary="Количество пользователей ролей")
+async def get_role_counts_status(current_user: User = Depends(get_current_admin)):
+    """Запросы агрегата и исправления roles.count_users сверкой (для текущего воркера)"""
+    return role_counts_reconciler.status()
+
+@router.get("/users/audit-log", summary="Пакетная запись логов действий")
+async def get_audit_log_status(current_user: User = Depends(get_current_admin)):
+    """Очередь, записанные пакеты и события, сохраненные в файлы (для текущего воркера)"""
+    return await audit_log.status()
+
+@router.get("/auth/login-throttle", summary="Ограничение попыток входа")
+async def get_login_throttle_status(
+    ip: Optional[str] = None,
+    email: Optional[str] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """Лимиты, попытки и отказы (для текущего воркера); с ip/email - текущее число их попыток"""
+    return await login_throttle.status(client_ip=ip, email=email)
+
+@router.get("/metrics", response_class=PlainTextResponse, summary="Метрики в формате Prometheus")
+async def get_metrics(current_user: User = Depends(get_current_admin)):
+    """Метрики пула соединений с БД и пула хеширования паролей текущего воркера в формате Prometheus"""
+    statuses = {"primary": pool_status(engine)}
+    if replica_engine is not None:
+        statuses["replica"] = pool_status(replica_engine)
+    return "\n".join(prometheus_lines(statuses) + password_hasher.prometheus_lines()) + "\n"
@@ -29,8 +29,9 @@ from fastapi.templating import Jinja2Templates
 
 from app.users.models import User
 from app.users.dependencies import get_current_user
-from app.roles.dependencies import require_roles
-from app.roles.models import Role, RoleTypes
+from app.roles.dependencies import require_permission
+from app.roles.models import Permission, Role
+from app.users.tokens import TokenPrincipal
 
 router = APIRouter(prefix="/partials", tags=["Partial Pages"])
 templates = Jinja2Templates(directory="app/templates")
@@ -237,7 +238,7 @@ async def user_tickets_partial(
 @router.get("/tickets/admin")
 async def admin_tickets_partial(
     request: Request,
-    current_user: User = Depends(require_roles([RoleTypes.MODERATOR, RoleTypes.ADMIN, RoleTypes.SUPER_ADMIN]))
+    current_user: TokenPrincipal = Depends(require_permission(Permission.MODERATE))
 ):
     """Частичная страница админских тикетов"""
     return templates.TemplateResponse("partials/admin_tickets.html", {
@@ -248,7 +249,7 @@ async def admin_tickets_partial(
 @router.get("/tickets/admin_ticket_request")
 async def admin_ticket_request_partial(
     request: Request,
-    current_user: User = Depends(require_roles([RoleTypes.MODERATOR, RoleTypes.ADMIN, RoleTypes.SUPER_ADMIN]))
+    current_user: TokenPrincipal = Depends(require_permission(Permission.MODERATE))
 ):
     """Частичная страница управления тикетом для админов"""
     return templates.TemplateResponse("partials/admin_ticket_request.html", {
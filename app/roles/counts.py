@@ -0,0 +1,190 @@
+# app/roles/counts.py
+"""
+Число пользователей ролей, вычисляемое из users вместо счетчиков в строках roles.
+
+Раньше roles.count_users увеличивался и уменьшался при каждой регистрации,
+удалении и смене роли: все регистрации блокировали одну строку roles
+(роль "user"), а при частичных сбоях счетчик расходился с users.
+
+Теперь количество считается одним запросом GROUP BY role_id (индекс по
+users.role_id) и хранится в памяти воркера ROLE_COUNTS_CACHE_TTL секунд;
+запись в roles через BaseDAO (в том числе смена ролей, см.
+UsersDAO.change_roles) сбрасывает кэш на всех воркерах через pub/sub кэша
+DAO. Новые и удаленные пользователи попадают в количество не позднее TTL.
+
+Столбец roles.count_users остается снимком для внешних потребителей:
+RoleCountsReconciler раз в ROLE_COUNTS_RECONCILE_INTERVAL секунд записывает
+в него актуальные значения одним UPDATE (только для разошедшихся ролей).
+Сверку за один интервал выполняет один воркер: перед сверкой воркер
+занимает ключ Redis RECONCILE_LOCK_NAME (SET NX EX interval), и до истечения
+ключа остальные воркеры пропускают свои такты. Без Redis такт выполняет
+каждый воркер, а на PostgreSQL одновременные сверки исключает
+pg_try_advisory_xact_lock (блокировка держится только до конца транзакции).
+"""
+import asyncio
+import math
+import os
+import time
+from typing import Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy import func, select, update
+
+from app.config import settings
+from app.core.redis import redis_client, redis_failed
+from app.dao.cache import dao_cache, invalidate_model
+from app.dao.replica import primary_reads
+from app.dao.session import session_scope, transaction_scope
+from app.logger import app_logger as logger
+from app.roles.models import Role
+from app.users.models import User
+
+
+class RoleCounts:
+    """Количество пользователей по role_id (агрегат в памяти воркера)"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._counts: Optional[dict[int, int]] = None
+        self._expires = 0.0
+        # Увеличивается при сбросе: агрегат, прочитанный до сброса, не сохраняется
+        self._generation = 0
+        self.queries = 0
+
+    @staticmethod
+    async def aggregate() -> dict[int, int]:
+        """Количество пользователей по role_id одним запросом (без кэша)"""
+        async with session_scope() as session:
+            rows = await session.execute(
+                select(User.role_id, func.count()).where(User.role_id.is_not(None)).group_by(User.role_id)
+            )
+            return {role_id: count for role_id, count in rows}
+
+    async def get(self) -> dict[int, int]:
+        if self._counts is not None and self._expires >= time.monotonic():
+            return self._counts
+        generation = self._generation
+        with primary_reads():
+            counts = await self.aggregate()
+        self.queries += 1
+        if self.ttl > 0 and generation == self._generation:
+            self._counts, self._expires = counts, time.monotonic() + self.ttl
+        return counts
+
+    async def count(self, role_id: int) -> int:
+        return (await self.get()).get(role_id, 0)
+
+    def invalidate(self):
+        self._generation += 1
+        self._counts = None
+
+    def on_dao_invalidate(self, table: Optional[str], pk: Optional[str]):
+        """Обработчик сбросов кэша DAO (см. DAOCache.on_invalidate)"""
+        if table is None or table == Role.__tablename__:
+            self.invalidate()
+
+
+# Ключ advisory lock сверки счетчиков (произвольная константа приложения)
+RECONCILE_LOCK_KEY = 0x726F6C65
+# Ключ Redis, который занимает на интервал воркер, выполняющий сверку
+RECONCILE_LOCK_NAME = "role_counts:reconcile"
+
+
+class RoleCountsReconciler:
+    """Фоновая запись актуальных количеств в roles.count_users"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.reconciled_at: Optional[float] = None
+        self.corrected_total = 0
+        self.skipped = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def reconcile(self) -> dict[int, int]:
+        """
+        Исправляет разошедшиеся счетчики; возвращает {role_id: новое значение}.
+        Пустой словарь, если сверку сейчас выполняет другой воркер
+        """
+        actual = (
+            select(func.count()).select_from(User).where(User.role_id == Role.id).scalar_subquery()
+        )
+        query = (
+            update(Role)
+            .where(Role.count_users.is_distinct_from(actual))
+            .values(count_users=actual)
+            .returning(Role.id, Role.count_users)
+            .execution_options(synchronize_session=False)
+        )
+        async with transaction_scope() as session:
+            if session.get_bind().dialect.name == "postgresql":
+                # Сверку уже выполняет другой воркер
+                if not await session.scalar(select(func.pg_try_advisory_xact_lock(RECONCILE_LOCK_KEY))):
+                    self.skipped += 1
+                    return {}
+            corrected = {role_id: count for role_id, count in await session.execute(query)}
+        self.reconciled_at = time.time()
+        if corrected:
+            self.corrected_total += len(corrected)
+            logger.info(f"Счетчики пользователей ролей исправлены: {corrected}")
+            await invalidate_model(Role)
+        return corrected
+
+    async def _claim_interval(self) -> bool:
+        """Занимает текущий интервал сверки; False - его уже занял другой воркер"""
+        client = redis_client()
+        if client is None:
+            return True
+        try:
+            return bool(
+                await client.set(
+                    RECONCILE_LOCK_NAME, os.getpid(), nx=True, ex=max(1, math.ceil(self.interval))
+                )
+            )
+        except (RedisError, OSError) as e:
+            logger.warning(f"Сверка счетчиков ролей: Redis недоступен, интервал не занят: {e}")
+            redis_failed()
+            return True
+
+    async def tick(self) -> Optional[dict[int, int]]:
+        """Один такт сверки; None - интервал уже занят другим воркером"""
+        if not await self._claim_interval():
+            self.skipped += 1
+            return None
+        return await self.reconcile()
+
+    async def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.warning(f"Не удалось сверить счетчики пользователей ролей: {e}")
+            await asyncio.sleep(self.interval)
+
+    def status(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "cache_ttl_seconds": role_counts.ttl,
+            "aggregate_queries_total": role_counts.queries,
+            "reconcile_interval_seconds": self.interval,
+            "reconciled_at": self.reconciled_at,
+            "corrected_total": self.corrected_total,
+            "skipped_total": self.skipped,
+        }
+
+
+role_counts = RoleCounts(settings.ROLE_COUNTS_CACHE_TTL)
+dao_cache.on_invalidate(role_counts.on_dao_invalidate)
+role_counts_reconciler = RoleCountsReconciler(settings.ROLE_COUNTS_RECONCILE_INTERVAL)
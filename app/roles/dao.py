@@ -1,15 +1,35 @@
 from sqlalchemy import select, delete
 from sqlalchemy.orm import selectinload
 from app.dao.base import BaseDAO
+from app.dao.cache import cached
+from app.dao.session import session_scope
+from app.roles.counts import role_counts
 from app.roles.models import Role, RoleTypes
+from app.users.models import User
 
 class RolesDAO(BaseDAO):
     model = Role
 
     @classmethod
-    async def find_all_with_users_count(cls, **filters):
-        """Получить все роли (оптимизированно через BaseDAO)"""
-        return await cls.find_all(**filters)
+    async def find_all_with_users_count(cls, **filters) -> list[dict]:
+        """Получить все роли с количеством пользователей (агрегат из users, см. app/roles/counts.py)"""
+        roles = await cls.find_all(**filters)
+        counts = await role_counts.get()
+        return [
+            {
+                "id": role.id,
+                "role_name": role.role_name,
+                "role_description": role.role_description,
+                "count_users": counts.get(role.id, 0)
+            }
+            for role in roles
+        ]
+
+    @classmethod
+    async def has_users(cls, role_id: int) -> bool:
+        """Есть ли пользователи с ролью (без кэша)"""
+        async with session_scope() as session:
+            return await session.scalar(select(select(User.id).where(User.role_id == role_id).exists()))
 
     @classmethod
     async def find_by_name(cls, role_name: str):
@@ -17,6 +37,7 @@ class RolesDAO(BaseDAO):
         return await cls.find_one_or_none(role_name=role_name)
     
     @classmethod
+    @cached(by_pk=True)
     async def find_by_id(cls, role_id: int):
         """Найти роль по ID"""
         return await cls.find_one_or_none(id=role_id)
@@ -44,7 +65,7 @@ class RolesDAO(BaseDAO):
             return False
         
         # Проверяем, есть ли пользователи с этой ролью
-        if role.count_users > 0:
+        if await cls.has_users(role.id):
             raise ValueError(f"Невозможно удалить роль '{role_name}'. Есть пользователи с этой ролью.")
         
         # Удаляем роль
@@ -55,15 +76,16 @@ class RolesDAO(BaseDAO):
     async def get_role_stats(cls) -> dict:
         """Получить статистику по ролям"""
         roles = await cls.find_all()
+        counts = await role_counts.get()
         
         return {
             "total_roles": len(roles),
-            "total_users": sum(role.count_users for role in roles),
+            "total_users": sum(counts.get(role.id, 0) for role in roles),
             "roles": [
                 {
                     "id": role.id,
                     "name": role.role_name,
-                    "user_count": role.count_users,
+                    "user_count": counts.get(role.id, 0),
                     "is_admin_role": role.is_admin_role
                 }
                 for role in roles
@@ -1,30 +1,44 @@
 # app/roles/dependencies.py
 from fastapi import Depends, HTTPException, status
-from app.users.dependencies import get_current_user
-from app.users.models import User
-from app.roles.models import RoleTypes
+from app.users.dependencies import get_current_principal, load_principal_user
+from app.users.tokens import TokenPrincipal
+from app.roles.models import Permission, RoleTypes
 
 def require_roles(required_roles: list[RoleTypes]):
-    """Зависимость для проверки ролей пользователя"""
-    async def role_checker(current_user: User = Depends(get_current_user)):
-        if current_user.role_id not in required_roles:
+    """Зависимость для проверки ролей пользователя (роль - из access-токена)"""
+    async def role_checker(principal: TokenPrincipal = Depends(get_current_principal)):
+        if principal.role_id not in required_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Недостаточно прав для доступа к этому ресурсу"
             )
-        return current_user
+        return await load_principal_user(principal)
     return role_checker
 
+def require_permission(permission: Permission):
+    """
+    Проверка прав только по access-токену: возвращает TokenPrincipal (id, роль, права)
+    без загрузки пользователя - для эндпоинтов, которым не нужны его данные
+    """
+    async def permission_checker(principal: TokenPrincipal = Depends(get_current_principal)):
+        if not principal.has(permission):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Недостаточно прав для доступа к этому ресурсу"
+            )
+        return principal
+    return permission_checker
+
 # Альтернативная версия если RoleTypes - это класс с константами
 def require_roles_list(required_role_ids: list[int]):
     """Зависимость для проверки ролей по ID"""
-    async def role_checker(current_user: User = Depends(get_current_user)):
-        if current_user.role_id not in required_role_ids:
+    async def role_checker(principal: TokenPrincipal = Depends(get_current_principal)):
+        if principal.role_id not in required_role_ids:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Недостаточно прав для доступа к этому ресурсу"
             )
-        return current_user
+        return await load_principal_user(principal)
     return role_checker
 
 # Специфичные проверки для разных уровней доступа
@@ -1,4 +1,5 @@
 
+from enum import IntFlag
 from sqlalchemy import text, Text
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from app.database import Base, str_uniq, int_pk, str_null_true
@@ -12,11 +13,27 @@ class RoleTypes:
     USER = 4
     GUEST = 5
 
+# Права ролей; битовая маска записывается в access-токен (claim "perm")
+class Permission(IntFlag):
+    MODERATE = 1      # тикеты и обращения пользователей
+    ADMIN = 2         # администрирование пользователей
+    SUPER_ADMIN = 4   # роли, ограничения по IP, управление администраторами
+
+ROLE_PERMISSIONS = {
+    RoleTypes.SUPER_ADMIN: Permission.MODERATE | Permission.ADMIN | Permission.SUPER_ADMIN,
+    RoleTypes.ADMIN: Permission.MODERATE | Permission.ADMIN,
+    RoleTypes.MODERATOR: Permission.MODERATE,
+}
+
+def role_permissions(role_id: int) -> Permission:
+    return ROLE_PERMISSIONS.get(role_id, Permission(0))
+
 # создаем модель таблицы групп пользователей (Role)
 class Role(Base):
     id: Mapped[int_pk] #= mapped_column(Integer, primary_key=True, index=True, autoincrement=True)
     role_name: Mapped[str_uniq] #= mapped_column(String, unique=True, nullable=False)
     role_description: Mapped[str_null_true]#[str] = mapped_column(String, nullable=True)
+    # Снимок, который сверяет app/roles/counts.py; актуальное количество - role_counts
     count_users: Mapped[int] = mapped_column(server_default=text('0'))
 
     # Определяем отношения: одна группа может иметь много пользователей
@@ -29,30 +46,6 @@ class Role(Base):
         """Проверяет, является ли роль административной"""
         return self.id in [RoleTypes.SUPER_ADMIN, RoleTypes.ADMIN]
     
-    @classmethod
-    async def increment_count(cls, role_id: int):
-        """Увеличить счетчик пользователей роли"""
-        from app.database import async_session_maker
-        from sqlalchemy import update
-        
-        async with async_session_maker() as session:
-            await session.execute(
-                update(cls).where(cls.id == role_id).values(count_users=cls.count_users + 1)
-            )
-            await session.commit()
-    
-    @classmethod
-    async def decrement_count(cls, role_id: int):
-        """Уменьшить счетчик пользователей роли"""
-        from app.database import async_session_maker
-        from sqlalchemy import update
-        
-        async with async_session_maker() as session:
-            await session.execute(
-                update(cls).where(cls.id == role_id).values(count_users=cls.count_users - 1)
-            )
-            await session.commit()
-    
     def __str__(self):
         return f"{self.__class__.__name__}(id={self.id}, role_name={self.role_name!r})"
 
@@ -5,7 +5,9 @@ from sqlalchemy.orm import joinedload
 from typing import List, Dict, Any, Optional
 
 from app.database import async_session_maker
-from app.services.models import Service, ServiceStatus
+from app.dao.base import BaseDAO
+from app.dao.cache import cached
+from app.services.models import Service, ServiceStatus, BillingPlan
 
 class ServicesDAO:
     model = Service
@@ -52,4 +54,20 @@ class ServicesDAO:
                     .options(joinedload(cls.model.user))
                     .filter_by(id=service_id))
             result = await session.execute(query)
-            return result.unique().scalar_one_or_none()
\ No newline at end of file
+            return result.unique().scalar_one_or_none()
+
+
+class BillingPlansDAO(BaseDAO):
+    model = BillingPlan
+
+    @classmethod
+    @cached(by_pk=True)
+    async def find_by_id(cls, plan_id: int) -> Optional[BillingPlan]:
+        """Найти тарифный план по ID (через кэш DAO)"""
+        return await cls.find_one_or_none_by_id(plan_id)
+
+    @classmethod
+    @cached()
+    async def get_active_plans(cls) -> List[BillingPlan]:
+        """Получить активные тарифные планы (через кэш DAO)"""
+        return await cls.find_all(is_active=True)
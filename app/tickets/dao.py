@@ -1,15 +1,36 @@
 # app/tickets/dao.py
-from sqlalchemy import select, desc, func
+from sqlalchemy import select, desc, func, bindparam, any_, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import joinedload, selectinload
 from app.dao.base import BaseDAO
 from app.tickets.models import Ticket, TicketMessage, TicketStatus, TicketPriority
 from app.database import async_session_maker
+from app.dao.session import session_scope, transaction_scope
+from app.dao.statements import statements
 from app.users.models import User  # Добавьте этот импорт
+from itertools import combinations
 from typing import List, Optional
 
 class TicketDAO(BaseDAO):
     model = Ticket
 
+    # Колонки для списков тикетов: без description (TEXT) и без ORM-объектов User/Role
+    list_columns = (
+        Ticket.id,
+        Ticket.user_id,
+        Ticket.subject,
+        Ticket.status,
+        Ticket.priority,
+        Ticket.is_pinned,
+        Ticket.created_at,
+        Ticket.updated_at,
+        User.user_email.label('user_email'),
+        User.user_nick.label('user_nick'),
+    )
+    list_joins = ((User, User.id == Ticket.user_id),)
+    # Колонки выгрузки: колонки списка и описание
+    export_columns = (*list_columns, Ticket.description)
+
     @classmethod
     async def create_ticket_with_message(
         cls,
@@ -58,57 +79,25 @@ class TicketDAO(BaseDAO):
         status: Optional[str] = None
     ):
         """Получить тикеты пользователя"""
-        async with async_session_maker() as session:
-            query = select(Ticket).where(Ticket.user_id == user_id)
-
-            if status:
-                query = query.where(Ticket.status == status)
-
-            # Подсчет
-            count_query = select(func.count()).select_from(query.subquery())
-            total_count = await session.scalar(count_query) or 0
-
-            # Данные с пагинацией
-            query = query.order_by(desc(Ticket.updated_at))
-            query = query.offset((page - 1) * page_size).limit(page_size)
-
-            result = await session.execute(query)
-            tickets = result.scalars().all()
-
-            # Получаем пользователей и количество сообщений
-            tickets_data = []
-            for ticket in tickets:
-                # Получаем пользователя
-                user_query = select(User).where(User.id == ticket.user_id)
-                user_result = await session.execute(user_query)
-                user = user_result.scalar_one_or_none()
-
-                # Получаем количество сообщений
-                msg_count_query = select(func.count(TicketMessage.id)).where(TicketMessage.ticket_id == ticket.id)
-                msg_count = await session.scalar(msg_count_query) or 0
-
-                tickets_data.append({
-                    'id': ticket.id,
-                    'user_id': ticket.user_id,
-                    'user_email': user.user_email if user else "Unknown",
-                    'user_nick': getattr(user, 'user_nick', user.user_email if user else "User"),  # Добавляем user_nick
-                    'subject': ticket.subject,
-                    'description': ticket.description,
-                    'status': ticket.status,
-                    'priority': ticket.priority,
-                    'is_pinned': ticket.is_pinned,
-                    'created_at': ticket.created_at,
-                    'updated_at': ticket.updated_at,
-                    'message_count': msg_count
-                })
-
-            return {
-                "tickets": tickets_data,
-                "total_count": total_count,
-                "page": page,
-                "page_size": page_size,
-                "total_pages": (total_count + page_size - 1) // page_size if page_size > 0 else 1
-            }
+        filters = {'user_id': user_id}
+        if status:
+            filters['status'] = status
+        total_count, tickets = await cls._find_list_page(filters, "updated", page, page_size)
+
+        # Количество сообщений - одним запросом для всей страницы
+        message_counts = await cls.get_message_counts([ticket.id for ticket in tickets])
+        tickets_data = [
+            cls._ticket_row_to_dict(ticket, message_counts.get(ticket.id, 0))
+            for ticket in tickets
+        ]
+
+        return {
+            "tickets": tickets_data,
+            "total_count": total_count,
+            "page": page,
+            "page_size": page_size,
+            "total_pages": (total_count + page_size - 1) // page_size if page_size > 0 else 1
+        }
 
     @classmethod
     async def get_admin_tickets(
@@ -121,71 +110,180 @@ class TicketDAO(BaseDAO):
         is_pinned: Optional[bool] = None
     ):
         """Получить все тикеты для админов с ограничением 300"""
-        async with async_session_maker() as session:
-            query = select(Ticket)
+        filters = {}
+        if status:
+            filters['status'] = status
+        if priority:
+            filters['priority'] = priority
+        if user_id:
+            filters['user_id'] = user_id
+        if is_pinned is not None:
+            filters['is_pinned'] = is_pinned
+        total_count, tickets = await cls._find_list_page(filters, "pinned", page, page_size)
+
+        # Ограничиваем общее количество 300
+        effective_total_count = min(total_count, 300)
+
+        # Количество сообщений - одним запросом для всей страницы
+        message_counts = await cls.get_message_counts([ticket.id for ticket in tickets])
+        tickets_data = [
+            cls._ticket_row_to_dict(ticket, message_counts.get(ticket.id, 0))
+            for ticket in tickets
+        ]
+
+        return {
+            "tickets": tickets_data,
+            "total_count": effective_total_count,
+            "page": page,
+            "page_size": page_size,
+            "total_pages": (effective_total_count + page_size - 1) // page_size if page_size > 0 else 1
+        }
 
-            if status:
-                query = query.where(Ticket.status == status)
-            if priority:
-                query = query.where(Ticket.priority == priority)
-            if user_id:
-                query = query.where(Ticket.user_id == user_id)
-            if is_pinned is not None:
-                query = query.where(Ticket.is_pinned == is_pinned)
+    @classmethod
+    async def get_user_tickets_page(
+        cls,
+        user_id: int,
+        after: Optional[str] = None,
+        limit: int = 25,
+        status: Optional[str] = None
+    ):
+        """Получить тикеты пользователя с keyset пагинацией (курсор вместо OFFSET)"""
+        filters = {'user_id': user_id}
+        if status:
+            filters['status'] = status
+
+        page = await cls.find_page(
+            order_by=[desc(Ticket.updated_at)],
+            after=after,
+            limit=limit,
+            columns=cls.list_columns,
+            joins=cls.list_joins,
+            **filters
+        )
+        return await cls._build_tickets_page(page, limit)
 
-            # Подсчет общего количества (без пагинации для фильтров)
-            count_query = select(func.count()).select_from(query.subquery())
-            total_count = await session.scalar(count_query) or 0
+    @classmethod
+    async def get_admin_tickets_page(
+        cls,
+        after: Optional[str] = None,
+        limit: int = 25,
+        status: Optional[str] = None,
+        priority: Optional[str] = None,
+        user_id: Optional[int] = None,
+        is_pinned: Optional[bool] = None
+    ):
+        """Получить все тикеты для админов с keyset пагинацией (закрепленные сверху)"""
+        filters = {}
+        if status:
+            filters['status'] = status
+        if priority:
+            filters['priority'] = priority
+        if user_id:
+            filters['user_id'] = user_id
+        if is_pinned is not None:
+            filters['is_pinned'] = is_pinned
+
+        page = await cls.find_page(
+            order_by=[desc(Ticket.is_pinned), desc(Ticket.updated_at)],
+            after=after,
+            limit=limit,
+            columns=cls.list_columns,
+            joins=cls.list_joins,
+            **filters
+        )
+        return await cls._build_tickets_page(page, limit)
 
-            # Ограничиваем общее количество 300
-            effective_total_count = min(total_count, 300)
+    @classmethod
+    async def _build_tickets_page(cls, page: dict, limit: int):
+        """Преобразует страницу тикетов в ответ; количество сообщений - одним запросом"""
+        tickets = page['items']
+        message_counts = await cls.get_message_counts([ticket.id for ticket in tickets])
+
+        tickets_data = [
+            cls._ticket_row_to_dict(ticket, message_counts.get(ticket.id, 0))
+            for ticket in tickets
+        ]
+
+        return {
+            "tickets": tickets_data,
+            "next_cursor": page['next_cursor'],
+            "has_more": page['has_more'],
+            "limit": limit
+        }
 
-            # Данные с пагинацией
-            query = query.order_by(desc(Ticket.is_pinned), desc(Ticket.updated_at))
-            query = query.offset((page - 1) * page_size).limit(page_size)
+    @classmethod
+    def export_fields(cls) -> list[str]:
+        """Имена полей строк stream_export (заголовок CSV)"""
+        return cls.column_names(cls.export_columns)
 
-            result = await session.execute(query)
-            tickets = result.scalars().all()
+    @classmethod
+    def stream_export(
+        cls,
+        chunk_size: int = 1000,
+        status: Optional[str] = None,
+        priority: Optional[str] = None,
+        user_id: Optional[int] = None
+    ):
+        """Потоковая выгрузка тикетов (колонки списка и описание) в порядке id"""
+        filters = {}
+        if status:
+            filters['status'] = status
+        if priority:
+            filters['priority'] = priority
+        if user_id:
+            filters['user_id'] = user_id
+
+        return cls.stream(
+            chunk_size=chunk_size,
+            columns=cls.export_columns,
+            joins=cls.list_joins,
+            order_by=[Ticket.id],
+            **filters
+        )
+
+    @staticmethod
+    def _ticket_row_to_dict(ticket, message_count: int) -> dict:
+        """Строка списка тикетов (list_columns) -> элемент ответа"""
+        return {
+            'id': ticket.id,
+            'user_id': ticket.user_id,
+            'user_email': ticket.user_email or "Unknown",
+            'user_nick': ticket.user_nick or ticket.user_email or "User",
+            'subject': ticket.subject,
+            'status': ticket.status,
+            'priority': ticket.priority,
+            'is_pinned': ticket.is_pinned,
+            'created_at': ticket.created_at,
+            'updated_at': ticket.updated_at,
+            'message_count': message_count
+        }
 
-            # Получаем пользователей и количество сообщений
-            tickets_data = []
-            for ticket in tickets:
-                # Получаем пользователя
-                user_query = select(User).where(User.id == ticket.user_id)
-                user_result = await session.execute(user_query)
-                user = user_result.scalar_one_or_none()
-
-                # Получаем количество сообщений
-                msg_count_query = select(func.count(TicketMessage.id)).where(TicketMessage.ticket_id == ticket.id)
-                msg_count = await session.scalar(msg_count_query) or 0
-
-                tickets_data.append({
-                    'id': ticket.id,
-                    'user_id': ticket.user_id,
-                    'user_email': user.user_email if user else "Unknown",
-                    'user_nick': getattr(user, 'user_nick', user.user_email if user else "User"),  # Добавляем user_nick
-                    'subject': ticket.subject,
-                    'description': ticket.description,
-                    'status': ticket.status,
-                    'priority': ticket.priority,
-                    'is_pinned': ticket.is_pinned,
-                    'created_at': ticket.created_at,
-                    'updated_at': ticket.updated_at,
-                    'message_count': msg_count
-                })
+    @classmethod
+    async def _find_list_page(cls, filters: dict, ordering: str, page: int, page_size: int):
+        """Общее количество и страница списка тикетов (запросы из реестра, см. TICKET_LIST_FILTERS)"""
+        names = tuple(name for name in TICKET_LIST_FILTERS if name in filters)
+        params = {name: filters[name] for name in names}
+        async with session_scope() as session:
+            total_count = await session.scalar(statements.get(("tickets.count", names)), params) or 0
+            result = await session.execute(
+                statements.get(("tickets.page", names, ordering)),
+                {**params, "limit": page_size, "offset": (page - 1) * page_size}
+            )
+            return total_count, result.all()
 
-            return {
-                "tickets": tickets_data,
-                "total_count": effective_total_count,
-                "page": page,
-                "page_size": page_size,
-                "total_pages": (effective_total_count + page_size - 1) // page_size if page_size > 0 else 1
-            }
+    @classmethod
+    async def get_message_counts(cls, ticket_ids: List[int]) -> dict:
+        """Количество сообщений для набора тикетов одним GROUP BY запросом"""
+        if not ticket_ids:
+            return {}
+        async with session_scope() as session:
+            result = await session.execute(statements.get("tickets.message_counts"), {"ticket_ids": ticket_ids})
+            return dict(result.all())
 
     @classmethod
     async def get_first_ticket_message(cls, ticket_id: int):
         """Получить первое сообщение тикета (описание проблемы)"""
-        async with async_session_maker() as session:
+        async with session_scope() as session:
             query = (
                 select(TicketMessage)
                 .where(TicketMessage.ticket_id == ticket_id)
@@ -198,9 +296,10 @@ class TicketDAO(BaseDAO):
     @classmethod
     async def get_ticket_detail(cls, ticket_id: int, user_id: Optional[int] = None):
         """Получить детальную информацию о тикете"""
-        async with async_session_maker() as session:
+        async with session_scope() as session:
             # Получаем тикет
-            ticket_query = select(Ticket).where(Ticket.id == ticket_id)
+            # populate_existing: внутри unit of work тикет мог быть изменен UPDATE-запросом
+            ticket_query = select(Ticket).where(Ticket.id == ticket_id).execution_options(populate_existing=True)
             if user_id:
                 ticket_query = ticket_query.where(Ticket.user_id == user_id)
 
@@ -238,7 +337,7 @@ class TicketDAO(BaseDAO):
     @classmethod
     async def get_ticket_stats(cls, user_id: Optional[int] = None):
         """Получить статистику по тикетам"""
-        async with async_session_maker() as session:
+        async with session_scope() as session:
             query = select(Ticket)
             
             if user_id:
@@ -312,7 +411,7 @@ class TicketDAO(BaseDAO):
     @classmethod
     async def get_ticket_with_user(cls, ticket_id: int):
         """Получить тикет с информацией о пользователе"""
-        async with async_session_maker() as session:
+        async with session_scope() as session:
             query = (
                 select(Ticket)
                 .options(joinedload(Ticket.user))
@@ -321,20 +420,65 @@ class TicketDAO(BaseDAO):
             result = await session.execute(query)
             return result.unique().scalar_one_or_none()
 
+# Запросы списков тикетов (см. app/dao/statements.py): отдельный запрос на каждый
+# набор фильтров и порядок, значения фильтров и пагинации - через bindparam
+TICKET_LIST_FILTERS = ("user_id", "status", "priority", "is_pinned")
+TICKET_LIST_ORDERINGS = {
+    "updated": (desc(Ticket.updated_at),),
+    "pinned": (desc(Ticket.is_pinned), desc(Ticket.updated_at)),
+}
+
+
+def _tickets_list_statement(filters: tuple):
+    query = select(*TicketDAO.list_columns).select_from(Ticket)
+    for target, onclause in TicketDAO.list_joins:
+        query = query.outerjoin(target, onclause)
+    for name in filters:
+        query = query.where(getattr(Ticket, name) == bindparam(name))
+    return query
+
+
+for _count in range(len(TICKET_LIST_FILTERS) + 1):
+    for _filters in combinations(TICKET_LIST_FILTERS, _count):
+        statements.register(
+            ("tickets.count", _filters),
+            lambda filters=_filters: select(func.count()).select_from(_tickets_list_statement(filters).subquery())
+        )
+        for _ordering, _order_by in TICKET_LIST_ORDERINGS.items():
+            statements.register(
+                ("tickets.page", _filters, _ordering),
+                lambda filters=_filters, order_by=_order_by: (
+                    _tickets_list_statement(filters)
+                    .order_by(*order_by)
+                    .limit(bindparam("limit"))
+                    .offset(bindparam("offset"))
+                )
+            )
+
+statements.register(
+    "tickets.message_counts",
+    lambda: (
+        select(TicketMessage.ticket_id, func.count(TicketMessage.id))
+        .where(TicketMessage.ticket_id == any_(bindparam("ticket_ids", type_=ARRAY(Integer))))
+        .group_by(TicketMessage.ticket_id)
+    )
+)
+
+
 class TicketMessageDAO(BaseDAO):
     model = TicketMessage
 
     @classmethod
     async def add_message(cls, ticket_id: int, sender_id: int, message_text: str, is_tech_support: bool = False):
         """Добавить сообщение"""
-        async with async_session_maker() as session:
-            message = TicketMessage(
-                ticket_id=ticket_id,
-                sender_id=sender_id,
-                message_text=message_text,
-                is_tech_support=is_tech_support  # Добавляем флаг техподдержки
-            )
+        message = TicketMessage(
+            ticket_id=ticket_id,
+            sender_id=sender_id,
+            message_text=message_text,
+            is_tech_support=is_tech_support  # Добавляем флаг техподдержки
+        )
+        async with transaction_scope() as session:
             session.add(message)
-            await session.commit()
+            await session.flush()
             await session.refresh(message)
-            return message
\ No newline at end of file
+        return message
\ No newline at end of file
@@ -1,5 +1,5 @@
 # app/tickets/models.py
-from sqlalchemy import Integer, Text, text, ForeignKey, String, DateTime, Boolean
+from sqlalchemy import Integer, Text, text, ForeignKey, String, DateTime, Boolean, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 from typing import Optional
@@ -20,6 +20,11 @@ class TicketPriority:
 
 class Ticket(Base):
     __tablename__ = 'tickets'
+    __table_args__ = (
+        # Индексы под keyset пагинацию списков тикетов
+        Index('ix_tickets_user_id_updated_at_id', 'user_id', 'updated_at', 'id'),
+        Index('ix_tickets_is_pinned_updated_at_id', 'is_pinned', 'updated_at', 'id'),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False)
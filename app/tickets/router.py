@@ -4,6 +4,9 @@ from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from typing import Optional
 from app.database import async_session_maker
+from app.dao.session import UnitOfWorkRoute, session_scope
+from app.dao.pagination import InvalidCursorError
+from app.utils.export import ExportFormat, export_response
 from sqlalchemy import func, select, text
 from sqlalchemy.orm import joinedload, selectinload
 from app.tickets.models import Ticket, TicketMessage
@@ -12,7 +15,7 @@ from app.tickets.dao import TicketDAO, TicketMessageDAO
 from app.tickets.schemas import (
     TicketCreate, TicketShortResponse, TicketUpdate, 
     TicketMessageCreate, TicketListResponse, TicketDetailResponse,
-    TicketMessageResponse
+    TicketMessageResponse, TicketCursorListResponse
 )
 from app.tickets.models import TicketStatus, TicketPriority
 from app.users.dependencies import get_current_user
@@ -20,7 +23,9 @@ from app.users.models import User
 from app.roles.dependencies import require_roles_list, require_roles
 from app.roles.models import RoleTypes
 
-router = APIRouter(prefix='/tickets', tags=['Тикеты'])
+# Один unit of work на запрос: пользователь, проверка доступа, запись и перечитывание
+# выполняются в одной сессии с одним commit в конце
+router = APIRouter(prefix='/tickets', tags=['Тикеты'], route_class=UnitOfWorkRoute)
 templates = Jinja2Templates(directory='app/templates')
 
 # Вспомогательные зависимости для проверки прав
@@ -206,6 +211,57 @@ async def get_admin_tickets(
     )
     return result
 
+@router.get("/api/user/tickets/cursor", response_model=TicketCursorListResponse)
+async def get_user_tickets_cursor(
+    current_user: User = Depends(get_current_user),
+    after: Optional[str] = Query(None, description="Курсор из next_cursor предыдущей страницы"),
+    limit: int = Query(25, ge=1, le=100),
+    status_filter: Optional[str] = Query(None, alias="status")
+):
+    """Получить тикеты текущего пользователя (keyset пагинация)"""
+    try:
+        return await TicketDAO.get_user_tickets_page(
+            user_id=current_user.id,
+            after=after,
+            limit=limit,
+            status=status_filter
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@router.get("/api/admin/tickets/cursor", response_model=TicketCursorListResponse)
+async def get_admin_tickets_cursor(
+    current_user: User = Depends(require_roles([RoleTypes.MODERATOR, RoleTypes.ADMIN, RoleTypes.SUPER_ADMIN])),
+    after: Optional[str] = Query(None, description="Курсор из next_cursor предыдущей страницы"),
+    limit: int = Query(25, ge=1, le=100),
+    status_filter: Optional[str] = Query(None, alias="status"),
+    priority: Optional[str] = Query(None),
+    user_id: Optional[int] = Query(None)
+):
+    """Получить все тикеты (для админов, keyset пагинация)"""
+    try:
+        return await TicketDAO.get_admin_tickets_page(
+            after=after,
+            limit=limit,
+            status=status_filter,
+            priority=priority,
+            user_id=user_id
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@router.get("/api/admin/tickets/export")
+async def export_admin_tickets(
+    current_user: User = Depends(require_roles([RoleTypes.MODERATOR, RoleTypes.ADMIN, RoleTypes.SUPER_ADMIN])),
+    export_format: ExportFormat = Query("ndjson", alias="format"),
+    status_filter: Optional[str] = Query(None, alias="status"),
+    priority: Optional[str] = Query(None),
+    user_id: Optional[int] = Query(None)
+):
+    """Выгрузить тикеты (для админов, потоково в NDJSON/CSV)"""
+    rows = TicketDAO.stream_export(status=status_filter, priority=priority, user_id=user_id)
+    return export_response(rows, TicketDAO.export_fields(), export_format, "tickets")
+
 # 3. Роуты с динамическими параметрами (в конце)
 
 @router.get("/api/tickets/{ticket_id}", response_model=TicketDetailResponse)
@@ -335,7 +391,7 @@ async def add_message_to_ticket(
     await TicketDAO.update({"id": ticket_id}, status=new_status)
     
     # Получаем сообщение с информацией об отправителе
-    async with async_session_maker() as session:
+    async with session_scope() as session:
         message_query = (
             select(TicketMessage)
             .options(joinedload(TicketMessage.sender))
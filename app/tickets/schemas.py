@@ -61,4 +61,10 @@ class TicketListResponse(BaseModel):
     total_count: int
     page: int
     page_size: int
-    total_pages: int
\ No newline at end of file
+    total_pages: int
+
+class TicketCursorListResponse(BaseModel):
+    tickets: List[TicketShortResponse]
+    next_cursor: Optional[str] = None  # Курсор следующей страницы (None - страница последняя)
+    has_more: bool
+    limit: int
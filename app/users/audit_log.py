@@ -0,0 +1,336 @@
+# app/users/audit_log.py
+"""
+Асинхронная запись логов действий пользователей (users_logs) пакетами.
+
+audit_log.write(...) не ждет БД: событие попадает в очередь воркера
+(AUDIT_LOG_QUEUE_SIZE), а фоновая задача записывает очередь многострочным
+INSERT (UserLogsDAO.bulk_insert) по AUDIT_LOG_BATCH_SIZE событий или не реже
+раза в AUDIT_LOG_FLUSH_INTERVAL секунд. Время события (created_at) фиксируется
+при вызове write. Внутри unit of work событие ставится в очередь только после
+commit (при rollback отбрасывается).
+
+Лог появляется в users_logs с задержкой до AUDIT_LOG_FLUSH_INTERVAL.
+При остановке приложения (lifespan) очередь записывается до конца.
+
+Если БД недоступна (или очередь переполнена), события сохраняются в
+AUDIT_LOG_SPILL_DIR: каждый пакет - отдельный NDJSON файл, записанный целиком
+(временный файл + rename). Файлы дозаписываются в БД при старте и после
+следующей успешной записи; файл, который сейчас дозаписывает другой воркер,
+заблокирован (flock) и пропускается. Строки, нарушающие ограничения БД
+(например, удаленный пользователь), отбрасываются с ошибкой в логе.
+Работа с файлами (запись, чтение, блокировка, удаление) выполняется в
+потоке (asyncio.to_thread) и не блокирует цикл событий.
+"""
+import asyncio
+import contextvars
+import glob
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from app.config import settings
+from app.dao.session import after_commit, get_current_session
+from app.logger import app_logger as logger
+from app.users.dao import UserLogsDAO
+
+try:
+    import fcntl
+except ImportError:  # Windows: без блокировки, дозапись только одним процессом
+    fcntl = None
+
+
+LOG_COLUMNS = ("user_id", "action_type", "old_value", "new_value", "description", "changed_by", "created_at")
+# Не чаще раза в столько секунд проверяются сохраненные в файлы события
+REPLAY_INTERVAL = 30
+
+
+class UnwrittenRows(Exception):
+    """Ошибка БД при записи пакета; rows - строки, которые не были записаны"""
+
+    def __init__(self, rows: list[dict], error: Exception):
+        super().__init__(str(error))
+        self.rows = rows
+
+
+class AuditLogWriter:
+    """Очередь логов действий с фоновой пакетной записью и сохранением в файлы"""
+
+    def __init__(self, queue_size: int, batch_size: int, flush_interval: float, spill_dir: str):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_dir = spill_dir
+        self._queue: Optional[asyncio.Queue] = None
+        self._queue_size = queue_size
+        # Набралось batch_size событий - записать, не дожидаясь flush_interval
+        self._batch_ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flushing: Optional[asyncio.Task] = None
+        # События, не поместившиеся в очередь, и задача их сохранения в файл
+        self._overflow: list[dict] = []
+        self._overflow_task: Optional[asyncio.Task] = None
+        self._spilled = True
+        self._replayed_at = 0.0
+        self.written = 0
+        self.batches = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.dropped = 0
+
+    # --- Постановка в очередь ---
+
+    def write(self, **log_data):
+        """Ставит событие в очередь (без ожидания БД); колонки - как у UserLogsDAO.create_log"""
+        unknown = set(log_data) - set(LOG_COLUMNS)
+        if unknown:
+            raise TypeError(f"Неизвестные поля лога: {sorted(unknown)}")
+        row = {column: log_data.get(column) for column in LOG_COLUMNS}
+        if row["created_at"] is None:
+            row["created_at"] = datetime.now(timezone.utc).replace(tzinfo=None)
+
+        session = get_current_session()
+        if session is not None:
+            after_commit(session, lambda: self._put_after_commit(row))
+        else:
+            self._put(row)
+
+    async def _put_after_commit(self, row: dict):
+        self._put(row)
+
+    def _put(self, row: dict):
+        if self._queue is None:
+            self._queue = asyncio.Queue(self._queue_size)
+        if self._task is None:
+            # Пустой контекст: без сессии unit of work и учета SQL запроса, записавшего первое событие
+            self._task = asyncio.get_running_loop().create_task(self._run(), context=contextvars.Context())
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self._overflow.append(row)
+            if self._overflow_task is None or self._overflow_task.done():
+                self._overflow_task = asyncio.get_running_loop().create_task(
+                    self._spill_overflow(), context=contextvars.Context()
+                )
+            return
+        if self._queue.qsize() >= self.batch_size:
+            self._batch_ready.set()
+
+    # --- Запись в БД ---
+
+    def _take_batch(self, limit: int) -> list[dict]:
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if self._queue.qsize() < self.batch_size:
+            self._batch_ready.clear()
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                # Остановка (close): событие уже взято из очереди, close дождется его записи
+                self._flushing = asyncio.ensure_future(self._flush(batch))
+                raise
+            batch += self._take_batch(self.batch_size - 1)
+            # Начатая запись не прерывается остановкой (см. close)
+            self._flushing = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._flushing)
+
+    async def _insert(self, rows: list[dict]):
+        """
+        Многострочный INSERT; при нарушении ограничений - построчно, с отбрасыванием
+        ошибочных строк. При ошибке БД - UnwrittenRows с еще не записанными строками
+        (уже записанные построчно не повторяются при сохранении в файл)
+        """
+        try:
+            await UserLogsDAO.bulk_insert(rows, returning=False)
+            return
+        except IntegrityError:
+            if len(rows) == 1:
+                self.dropped += 1
+                logger.error(f"Лог действия отброшен (нарушение ограничений БД): {rows[0]}")
+                return
+        except Exception as e:
+            raise UnwrittenRows(rows, e) from e
+        for i, row in enumerate(rows):
+            try:
+                await self._insert([row])
+            except UnwrittenRows as e:
+                raise UnwrittenRows(rows[i:], e.__cause__) from e.__cause__
+
+    async def _flush(self, batch: list[dict]):
+        """Записывает пакет; при ошибке БД - незаписанные строки в файл. Исключений не выбрасывает"""
+        dropped = self.dropped
+        unwritten = []
+        try:
+            await self._insert(batch)
+        except UnwrittenRows as e:
+            unwritten = e.rows
+            error = e
+        self.written += len(batch) - len(unwritten) - (self.dropped - dropped)
+        if unwritten:
+            logger.warning(f"Логи действий ({len(unwritten)}) сохранены в файл, БД недоступна: {error}")
+            await self._spill(unwritten)
+            return
+        self.batches += 1
+        if self._spilled and time.monotonic() - self._replayed_at >= REPLAY_INTERVAL:
+            await self.replay()
+
+    # --- Сохранение в файлы и дозапись ---
+
+    @staticmethod
+    def _encode(row: dict) -> str:
+        return json.dumps({**row, "created_at": row["created_at"].isoformat()}, ensure_ascii=False)
+
+    @staticmethod
+    def _decode(line: str) -> dict:
+        row = json.loads(line)
+        row["created_at"] = datetime.fromisoformat(row["created_at"])
+        return row
+
+    @classmethod
+    def _write_file(cls, path: str, rows: list[dict]):
+        """Записывает файл целиком: временный файл + rename"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            file.write("".join(cls._encode(row) + "\n" for row in rows))
+        os.replace(path + ".tmp", path)
+
+    async def _spill(self, rows: list[dict]):
+        path = os.path.join(self.spill_dir, f"{time.time_ns()}-{os.getpid()}.ndjson")
+        try:
+            await asyncio.to_thread(self._write_file, path, rows)
+        except OSError as e:
+            self.dropped += len(rows)
+            logger.error(f"Логи действий потеряны ({len(rows)}), не удалось сохранить в {path}: {e}")
+            return
+        self.spilled += len(rows)
+        self._spilled = True
+
+    async def _spill_overflow(self):
+        """Сохраняет в файл события, не поместившиеся в очередь (накопленные за время записи - одним файлом)"""
+        while self._overflow:
+            rows, self._overflow = self._overflow, []
+            await self._spill(rows)
+
+    @classmethod
+    def _open_spilled(cls, path: str):
+        """
+        Открывает и блокирует файл; (файл, строки, некорректные строки).
+        None - файл уже дозаписан или его дозаписывает другой воркер
+        """
+        try:
+            file = open(path, encoding="utf-8")
+        except FileNotFoundError:
+            return None
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    file.close()
+                    return None
+            # Файл уже дозаписан другим воркером, пока ждали открытия
+            if os.fstat(file.fileno()).st_nlink == 0:
+                file.close()
+                return None
+            rows, invalid = [], []
+            for line in file:
+                try:
+                    rows.append(cls._decode(line))
+                except (ValueError, KeyError, TypeError):
+                    invalid.append(line)
+        except BaseException:
+            file.close()
+            raise
+        return file, rows, invalid
+
+    async def replay(self) -> int:
+        """Дозаписывает в БД события, сохраненные в файлы; возвращает количество"""
+        self._replayed_at = time.monotonic()
+        replayed = 0
+        paths = await asyncio.to_thread(glob.glob, os.path.join(self.spill_dir, "*.ndjson"))
+        for path in sorted(paths):
+            opened = await asyncio.to_thread(self._open_spilled, path)
+            if opened is None:
+                continue
+            file, rows, invalid = opened
+            for line in invalid:
+                self.dropped += 1
+                logger.error(f"Пропущена некорректная строка {path}: {line[:200]!r}")
+            # Блокировка удерживается до удаления или замены файла
+            with file:
+                for i in range(0, len(rows), self.batch_size):
+                    try:
+                        await self._insert(rows[i:i + self.batch_size])
+                    except UnwrittenRows as e:
+                        logger.warning(f"Дозапись логов действий из {path} отложена: {e}")
+                        # Дозаписанные строки не повторяются
+                        await asyncio.to_thread(self._write_file, path, e.rows + rows[i + self.batch_size:])
+                        return replayed
+                await asyncio.to_thread(os.remove, path)
+            replayed += len(rows)
+            self.replayed += len(rows)
+        self._spilled = False
+        if replayed:
+            logger.info(f"Дозаписано логов действий из файлов: {replayed}")
+        return replayed
+
+    # --- Жизненный цикл ---
+
+    async def start(self):
+        """Дозаписывает события, оставшиеся в файлах после прошлого запуска (вызывается в lifespan)"""
+        try:
+            await self.replay()
+        except Exception as e:
+            logger.warning(f"Не удалось дозаписать логи действий из файлов: {e}")
+
+    async def close(self):
+        """Записывает очередь до конца (при недоступной БД - в файлы)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flushing is not None and not self._flushing.done():
+            await self._flushing
+        if self._queue is not None:
+            while not self._queue.empty():
+                await self._flush(self._take_batch(self.batch_size))
+        if self._overflow_task is not None:
+            await self._overflow_task
+            self._overflow_task = None
+
+    async def status(self) -> dict:
+        spill_files = await asyncio.to_thread(glob.glob, os.path.join(self.spill_dir, "*.ndjson"))
+        return {
+            "pid": os.getpid(),
+            "queue_size": self._queue.qsize() if self._queue is not None else 0,
+            "queue_limit": self._queue_size,
+            "batch_size": self.batch_size,
+            "flush_interval_seconds": self.flush_interval,
+            "written_total": self.written,
+            "batches_total": self.batches,
+            "spilled_total": self.spilled,
+            "replayed_total": self.replayed,
+            "dropped_total": self.dropped,
+            "spill_files": len(spill_files),
+        }
+
+
+audit_log = AuditLogWriter(
+    settings.AUDIT_LOG_QUEUE_SIZE,
+    settings.AUDIT_LOG_BATCH_SIZE,
+    settings.AUDIT_LOG_FLUSH_INTERVAL,
+    settings.AUDIT_LOG_SPILL_DIR
+)
@@ -5,6 +5,7 @@ from jose import jwt
 from datetime import datetime, timedelta, timezone
 from app.config import get_auth_data
 from app.users.dao import UsersDAO
+from app.users.hashing import password_hasher
 from app.utils.secutils import SecurityUtils
 
 
@@ -18,6 +19,16 @@ def get_password_hash(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+
+# Для async-обработчиков: bcrypt выполняется в пуле потоков, а не в event loop
+# (при перегрузке пула - PasswordHashingBusyException, см. app/users/hashing.py)
+async def get_password_hash_async(password: str) -> str:
+    return await password_hasher.run(pwd_context.hash, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.run(pwd_context.verify, plain_password, hashed_password)
+
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(days=30)
@@ -33,8 +44,8 @@ def create_access_token(data: dict) -> str:
 #     return user
 
 async def authenticate_user(user_email: EmailStr, user_pass: str, request: Request = None):
-    user = await UsersDAO.find_one_or_none(user_email=user_email)
-    if not user or verify_password(plain_password=user_pass, hashed_password=user.user_pass) is False:
+    user = await UsersDAO.find_by_email(user_email)
+    if not user or await verify_password_async(user_pass, user.user_pass) is False:
         return None
     
     # Проверяем IP если есть ограничения
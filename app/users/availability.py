@@ -0,0 +1,219 @@
+# app/users/availability.py
+"""
+Фильтр Блума занятых ников и email для проверок доступности при вводе.
+
+/users/check-nickname и /users/check-secondary-email вызываются на каждое
+нажатие клавиши. Фильтр в памяти воркера отвечает "точно свободно" без запроса
+к БД; на "возможно занято" (занято или ложное срабатывание, по умолчанию ~1%)
+ответ подтверждается запросом.
+
+Фильтр строится при старте одним потоковым проходом по users (ники, основные
+и дополнительные email) и дополняется при записи пользователя через BaseDAO,
+в том числе на остальных воркерах (pub/sub кэша DAO, см. DAOCache.on_invalidate):
+значения записанной строки дочитываются по id. Освободившиеся значения
+остаются в фильтре и дают лишний запрос, но не неверный ответ. Пока фильтр
+строится или дочитывается запись, все значения считаются "возможно занятыми".
+
+Регистр не учитывается: фильтр хранит значения в нижнем регистре, что только
+добавляет ложные срабатывания.
+"""
+import asyncio
+import hashlib
+import math
+import os
+from typing import Optional
+
+from sqlalchemy import func, select
+
+from app.config import settings
+from app.dao.cache import ANY_ROW, dao_cache
+from app.dao.replica import primary_reads
+from app.dao.session import session_scope
+from app.logger import app_logger as logger
+from app.users.models import User
+
+
+# Минимальная емкость фильтра и запас на рост таблицы до перестроения
+MIN_CAPACITY = 10000
+CAPACITY_FACTOR = 2
+SCAN_BATCH_SIZE = 5000
+
+
+class BloomFilter:
+    """Битовый массив с k хешами (двойное хеширование blake2b)"""
+    __slots__ = ("capacity", "size", "hashes", "count", "_bits")
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value: str):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, value: str):
+        for position in self._positions(value):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class TakenValuesFilter:
+    """Занятые ники и email пользователей (фильтр Блума в памяти воркера)"""
+
+    def __init__(self, enabled: bool, error_rate: float):
+        self.enabled = enabled
+        self.error_rate = error_rate
+        self._filter: Optional[BloomFilter] = None
+        # Фильтр, который сейчас строится: новые значения добавляются и в него
+        self._building: Optional[BloomFilter] = None
+        # Незавершенные дочитывания и перестроения
+        self._pending = 0
+        self._tasks: set[asyncio.Task] = set()
+        # Запросы перестроения, пришедшие во время перестроения, объединяются в одно
+        self._rebuild_requested = False
+        self._rebuild_lock = asyncio.Lock()
+        self.checks = 0
+        self.definite_misses = 0
+
+    @staticmethod
+    def _key(kind: str, value: str) -> str:
+        return f"{kind}:{value.strip().lower()}"
+
+    def _add_row(self, nick: Optional[str], email: Optional[str], secondary_email: Optional[str]):
+        for target in (self._filter, self._building):
+            if target is None:
+                continue
+            if nick:
+                target.add(self._key("nick", nick))
+            for value in (email, secondary_email):
+                if value:
+                    target.add(self._key("email", value))
+
+    def might_be_taken(self, kind: str, value: str) -> bool:
+        """False - значение точно свободно; True - нужно проверить в БД"""
+        self.checks += 1
+        if self._filter is None or self._pending:
+            return True
+        if self._key(kind, value) in self._filter:
+            return True
+        self.definite_misses += 1
+        return False
+
+    def might_be_taken_nick(self, nick: str) -> bool:
+        return self.might_be_taken("nick", nick)
+
+    def might_be_taken_email(self, email: str) -> bool:
+        return self.might_be_taken("email", email)
+
+    # --- Построение и обновление ---
+
+    async def rebuild(self):
+        """Строит фильтр заново одним потоковым проходом по users"""
+        columns = (User.user_nick, User.user_email, User.secondary_email)
+        async with session_scope() as session:
+            rows = await session.scalar(select(func.count()).select_from(User))
+            building = BloomFilter(max(MIN_CAPACITY, rows * len(columns) * CAPACITY_FACTOR), self.error_rate)
+            self._building = building
+            try:
+                result = await session.stream(select(*columns).execution_options(yield_per=SCAN_BATCH_SIZE))
+                async for nick, email, secondary_email in result:
+                    if nick:
+                        building.add(self._key("nick", nick))
+                    for value in (email, secondary_email):
+                        if value:
+                            building.add(self._key("email", value))
+            finally:
+                self._building = None
+        self._filter = building
+        logger.info(f"Фильтр доступности ников/email: {building.count} значений, {len(building._bits) // 1024} КБ")
+
+    async def _add_user(self, user_id: int):
+        async with session_scope() as session:
+            row = (await session.execute(
+                select(User.user_nick, User.user_email, User.secondary_email).where(User.id == user_id)
+            )).first()
+        if row is not None:
+            self._add_row(*row)
+        if self._filter is not None and self._filter.count > self._filter.capacity:
+            self._request_rebuild()
+
+    def _request_rebuild(self):
+        if not self._rebuild_requested:
+            self._rebuild_requested = True
+            self._schedule(self._rebuild_requested_filter())
+
+    async def _rebuild_requested_filter(self):
+        async with self._rebuild_lock:
+            if self._rebuild_requested:
+                self._rebuild_requested = False
+                await self.rebuild()
+
+    def _schedule(self, coroutine):
+        try:
+            task = asyncio.get_running_loop().create_task(self._run(coroutine))
+        except RuntimeError:
+            # Вне event loop дочитать нельзя - до перестроения фильтр не используется
+            coroutine.close()
+            self._filter = None
+            return
+        self._pending += 1
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, coroutine):
+        try:
+            # Задача наследует контекст запроса, записавшего пользователя: читаем основную БД
+            with primary_reads():
+                await coroutine
+        except Exception as e:
+            # Без актуального фильтра все проверки идут в БД
+            logger.warning(f"Фильтр доступности ников/email отключен до перестроения: {e}")
+            self._filter = None
+        finally:
+            self._pending -= 1
+
+    def on_dao_invalidate(self, table: Optional[str], pk: Optional[str]):
+        """Обработчик сбросов кэша DAO (см. DAOCache.on_invalidate)"""
+        if not self.enabled or (self._filter is None and not self._pending):
+            return
+        if table is None or (table == User.__tablename__ and (pk is None or pk == ANY_ROW)):
+            # Сброс всей таблицы или вставка неизвестных строк
+            self._request_rebuild()
+        elif table == User.__tablename__ and pk.isdigit():
+            self._schedule(self._add_user(int(pk)))
+
+    async def start(self):
+        """Строит фильтр в фоне (вызывается в lifespan); до готовности проверки идут в БД"""
+        if self.enabled and self._filter is None and not self._pending:
+            self._request_rebuild()
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def status(self) -> dict:
+        current = self._filter
+        return {
+            "pid": os.getpid(),
+            "enabled": self.enabled,
+            "ready": current is not None and not self._pending,
+            "values": current.count if current else 0,
+            "capacity": current.capacity if current else 0,
+            "memory_bytes": len(current._bits) if current else 0,
+            "hashes": current.hashes if current else 0,
+            "checks_total": self.checks,
+            "definite_misses_total": self.definite_misses,
+        }
+
+
+taken_values = TakenValuesFilter(settings.AVAILABILITY_FILTER_ENABLED, settings.AVAILABILITY_FILTER_ERROR_RATE)
+dao_cache.on_invalidate(taken_values.on_dao_invalidate)
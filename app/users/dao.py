@@ -1,13 +1,20 @@
-from sqlalchemy import select, delete, desc, update, or_
-from sqlalchemy.orm import joinedload
+from sqlalchemy import select, delete, desc, update, or_, bindparam, func
+from sqlalchemy.orm import joinedload, aliased
 from app.dao.base import BaseDAO
-from app.users.models import User, UserLog
+from app.dao.cache import cached, invalidate_model
+from app.dao.session import after_commit, get_current_session, session_scope, transaction_scope
+from app.dao.statements import statements
+from app.users.models import USER_SEARCH_COLUMNS, User, UserLog
+from app.users.token_versions import token_versions
+from app.users.availability import taken_values
 from app.roles.models import Role
 from app.database import async_session_maker
 from datetime import datetime, timezone, timedelta
 import logging
 import json  # Добавляем импорт json
 import re
+from dataclasses import dataclass
+from typing import Optional
 
 # Система логирования
 DEBUG_LEVEL = 0 # 0 - нет логов, 1 - ошибки, 2 - предупреждения, 3 - все логи
@@ -24,9 +31,54 @@ if (DEBUG_LEVEL >= 1):
         logger.info(f"✅ {message}")
 
 
+# Вход по email - горячий путь авторизации
+statements.register("users.by_email", lambda: select(User).where(User.user_email == bindparam("user_email")))
+# Подбор ника при регистрации: все ники с префиксом (индекс ix_users_user_nick_pattern)
+statements.register(
+    "users.nicks_by_prefix",
+    lambda: select(User.user_nick).where(User.user_nick.like(bindparam("prefix"), escape="\\"))
+)
+
+
+def _naive_utc(value: datetime) -> datetime:
+    """datetime с зоной -> UTC без зоны (created_at логов хранится без временной зоны)"""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+# Не более стольких слов поискового запроса (каждое слово - отдельное условие)
+SEARCH_MAX_TERMS = 5
+
+
+def escape_like(value: str) -> str:
+    """Экранирует спецсимволы LIKE (escape='\\')"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+@dataclass
+class UserConflicts:
+    """Какие значения уже заняты другими пользователями (см. UsersDAO.check_conflicts)"""
+    email: bool = False
+    phone: bool = False
+    nick: bool = False
+    # None, "used_as_primary" или "used_as_secondary"
+    secondary_email: Optional[str] = None
+
+    @property
+    def any(self) -> bool:
+        return self.email or self.phone or self.nick or self.secondary_email is not None
+
+
 class UsersDAO(BaseDAO):
     model = User
 
+    @classmethod
+    @cached(by_pk=True)
+    async def find_one_or_none_by_id(cls, data_id: int):
+        """Найти пользователя по ID (с ролью, через кэш DAO)"""
+        return await super().find_one_or_none_by_id(data_id)
+
     @classmethod
     async def find_full_data(cls, user_id: int):
         """Найти пользователя с полными данными (включая роль)"""
@@ -40,10 +92,100 @@ class UsersDAO(BaseDAO):
             result = await session.execute(query)
             return result.unique().scalars().all()
 
+    @classmethod
+    async def find_all_rows_with_roles(cls, **filter_by):
+        """
+        Найти всех пользователей в виде легких строк (без ORM-объектов) с названием роли.
+        Загружаются только колонки, нужные для списка пользователей.
+        """
+        return await cls.find_rows(
+            [
+                'id', 'user_phone', 'first_name', 'last_name', 'user_nick', 'user_email',
+                'user_status', 'role_id', 'special_notes',
+                Role.role_name.label('role_name')
+            ],
+            joins=[(Role, Role.id == cls.model.role_id)],
+            **filter_by
+        )
+
+    @classmethod
+    async def search_page(
+        cls,
+        search: Optional[str] = None,
+        role_id: Optional[int] = None,
+        user_status: Optional[int] = None,
+        email_verified: Optional[int] = None,
+        phone_verified: Optional[int] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        after: Optional[str] = None,
+        limit: int = 50
+    ) -> dict:
+        """
+        Страница пользователей для админки (новые сверху, легкие строки) с keyset пагинацией.
+        search - слова через пробел; каждое должно встречаться (ILIKE '%слово%') в email,
+        нике, имени, фамилии или телефоне (триграммные индексы, см. USER_SEARCH_COLUMNS).
+        """
+        where = []
+        for term in (search or "").split()[:SEARCH_MAX_TERMS]:
+            pattern = f"%{escape_like(term)}%"
+            where.append(or_(*(
+                getattr(cls.model, column).ilike(pattern, escape="\\") for column in USER_SEARCH_COLUMNS
+            )))
+        if created_from is not None:
+            where.append(cls.model.created_at >= created_from)
+        if created_to is not None:
+            where.append(cls.model.created_at < created_to)
+
+        filters = {
+            key: value for key, value in (
+                ('role_id', role_id), ('user_status', user_status),
+                ('email_verified', email_verified), ('phone_verified', phone_verified)
+            ) if value is not None
+        }
+        return await cls.find_page(
+            *where,
+            order_by=[desc(cls.model.created_at)],
+            after=after,
+            limit=limit,
+            columns=[
+                'id', 'user_phone', 'first_name', 'last_name', 'user_nick', 'user_email',
+                'user_status', 'role_id', 'special_notes', 'email_verified', 'phone_verified',
+                Role.role_name.label('role_name')
+            ],
+            joins=[(Role, Role.id == cls.model.role_id)],
+            **filters
+        )
+
+    # Колонки выгрузки пользователей: без пароля и настроек безопасности
+    export_columns = (
+        'id', 'user_email', 'user_phone', 'first_name', 'last_name', 'user_nick',
+        'user_status', 'role_id', Role.role_name.label('role_name'),
+        'email_verified', 'phone_verified', 'created_at', 'last_login'
+    )
+
+    @classmethod
+    def export_fields(cls) -> list[str]:
+        """Имена полей строк stream_export (заголовок CSV)"""
+        return cls.column_names(cls.export_columns)
+
+    @classmethod
+    def stream_export(cls, chunk_size: int = 1000, **filter_by):
+        """Потоковая выгрузка пользователей (легкие строки, см. export_columns)"""
+        return cls.stream(
+            chunk_size=chunk_size,
+            columns=cls.export_columns,
+            joins=[(Role, Role.id == cls.model.role_id)],
+            order_by=[cls.model.id],
+            **filter_by
+        )
+
     @classmethod
     async def find_by_email(cls, user_email: str):
         """Найти пользователя по email"""
-        return await cls.find_one_or_none(user_email=user_email)
+        async with session_scope() as session:
+            result = await session.execute(statements.get("users.by_email"), {"user_email": user_email})
+            return result.scalar_one_or_none()
     
     @classmethod
     async def find_by_email_with_role(cls, user_email: str):
@@ -58,104 +200,97 @@ class UsersDAO(BaseDAO):
         """Найти пользователя по телефону"""
         return await cls.find_one_or_none(user_phone=user_phone)
 
+    @classmethod
+    async def change_roles(cls, new_role_id: int, *conditions) -> list[tuple[int, Optional[int]]]:
+        """
+        Меняет роль пользователей, подходящих под conditions, одной транзакцией:
+        UPDATE users ... RETURNING прежней роли (строки блокируются FOR UPDATE).
+        Строки roles не изменяются: количество пользователей ролей считается
+        из users (см. app/roles/counts.py).
+        Возвращает [(user_id, old_role_id)] найденных пользователей;
+        old_role_id == new_role_id - роль не менялась.
+        """
+        old_roles = (
+            select(cls.model.id, cls.model.role_id)
+            .where(*conditions)
+            .with_for_update()
+            .cte("old_roles")
+        )
+        query = (
+            update(cls.model)
+            .where(cls.model.id == old_roles.c.id)
+            .values(role_id=new_role_id)
+            .returning(cls.model.id, old_roles.c.role_id)
+            .execution_options(synchronize_session=False)
+        )
+        async with transaction_scope() as session:
+            rows = [(user_id, old_role_id) for user_id, old_role_id in await session.execute(query)]
+            # Роль в выданных токенах больше не действует (см. app/users/token_versions.py).
+            # До commit: если версию не сохранить, роль не меняется (исключение откатывает транзакцию)
+            user_ids = [user_id for user_id, _ in rows]
+            if user_ids:
+                await token_versions.bump(*user_ids)
+        changed = [user_id for user_id, old_role_id in rows if old_role_id != new_role_id]
+
+        if changed:
+            # Сбрасывает и количество пользователей ролей на всех воркерах
+            await invalidate_model(Role)
+            for user_id in changed:
+                await invalidate_model(cls.model, user_id)
+        if user_ids:
+            # И после commit: токены, выпущенные до commit, содержат прежнюю роль.
+            # Версия увеличивается и для пользователей с той же ролью, поэтому повтор
+            # запроса после ошибки доводит отзыв до конца
+            session = get_current_session()
+            if session is not None:
+                after_commit(session, lambda: token_versions.bump(*user_ids))
+            else:
+                await token_versions.bump(*user_ids)
+        return rows
+
     @classmethod
     async def update_user_role(cls, user_id: int, new_role_id: int) -> bool:
-        """Обновить роль пользователя с обновлением счетчиков"""
-        async with async_session_maker() as session:
-            async with session.begin():
-                # Находим пользователя и его текущую роль
-                user = await cls.find_one_or_none_by_id(user_id)
-                if not user:
-                    return False
-                
-                old_role_id = user.role_id
-                
-                # Если роль не изменилась, ничего не делаем
-                if old_role_id == new_role_id:
-                    return True
-                
-                # Обновляем роль пользователя
-                result = await cls.update(
-                    filter_by={'id': user_id},
-                    role_id=new_role_id
-                )
-                
-                if result > 0:
-                    # Обновляем счетчики ролей
-                    if old_role_id:
-                        await Role.decrement_count(old_role_id)
-                    await Role.increment_count(new_role_id)
-                
-                return result > 0
+        """Обновить роль пользователя"""
+        return bool(await cls.change_roles(new_role_id, cls.model.id == user_id))
 
     @classmethod
     async def update_user_role_by_email(cls, user_email: str, new_role_id: int) -> bool:
-        """Обновить роль пользователя по email с обновлением счетчиков"""
-        async with async_session_maker() as session:
-            async with session.begin():
-                # Находим пользователя и его текущую роль
-                user = await cls.find_by_email(user_email)
-                if not user:
-                    return False
-                
-                old_role_id = user.role_id
-                
-                # Если роль не изменилась, ничего не делаем
-                if old_role_id == new_role_id:
-                    return True
-                
-                # Обновляем роль пользователя
-                result = await cls.update(
-                    filter_by={'user_email': user_email},
-                    role_id=new_role_id
-                )
-                
-                if result > 0:
-                    # Обновляем счетчики ролей
-                    if old_role_id:
-                        await Role.decrement_count(old_role_id)
-                    await Role.increment_count(new_role_id)
-                
-                return result > 0
+        """Обновить роль пользователя по email"""
+        return bool(await cls.change_roles(new_role_id, cls.model.user_email == user_email))
+
+    @classmethod
+    async def update_users_role(
+        cls, user_ids: list[int], new_role_id: int, exclude_role_ids: tuple[int, ...] = ()
+    ) -> list[tuple[int, Optional[int]]]:
+        """Изменить роль нескольких пользователей (пропуская роли exclude_role_ids), см. change_roles"""
+        conditions = [cls.model.id.in_(user_ids)]
+        if exclude_role_ids:
+            conditions.append(or_(cls.model.role_id.is_(None), cls.model.role_id.notin_(exclude_role_ids)))
+        return await cls.change_roles(new_role_id, *conditions)
 
     @classmethod
     async def add_user(cls, **user_data: dict):
-        """Добавить пользователя с обновлением счетчика роли"""
+        """Добавить пользователя (счетчик роли не блокируется, см. app/roles/counts.py)"""
         async with async_session_maker() as session:
             async with session.begin():
                 new_user = cls.model(**user_data)
                 session.add(new_user)
                 await session.flush()
                 new_user_id = new_user.id
-                
-                # Обновляем счетчик роли
-                role_id = user_data.get('role_id')
-                if role_id:
-                    await Role.increment_count(role_id)
-                
-                await session.commit()
-                return new_user_id
+        # Новый пользователь: кэши с его ником/email (см. app/users/availability.py)
+        await invalidate_model(cls.model, new_user_id)
+        return new_user_id
 
     @classmethod
     async def delete_user_by_id(cls, user_id: int):
-        """Удалить пользователя с обновлением счетчика роли"""
-        async with async_session_maker() as session:
-            async with session.begin():
-                # Находим пользователя
-                user = await cls.find_one_or_none_by_id(user_id)
-                if not user:
-                    return False
-                
-                role_id = user.role_id
-                
-                # Удаляем пользователя
-                result = await cls.delete(id=user_id)
-                
-                if result > 0 and role_id:
-                    # Обновляем счетчик роли
-                    await Role.decrement_count(role_id)
-                
-                return result > 0
+        """Удалить пользователя"""
+        # До удаления: если версию не сохранить, пользователь не удаляется
+        await token_versions.bump(user_id)
+        result = await cls.delete(id=user_id)
+        if result > 0:
+            # Токены, выпущенные до удаления
+            await token_versions.bump(user_id)
+        return result > 0
 
     @classmethod
     async def get_user_with_role_info(cls, user_id: int):
@@ -192,6 +327,7 @@ class UsersDAO(BaseDAO):
                 )
                 result = await session.execute(stmt)
                 await session.commit()
+                await invalidate_model(cls.model, user_id)
 
                 print(f"✅ Last_login обновлен для пользователя {user_id}")
                 return result.rowcount > 0
@@ -233,8 +369,8 @@ class UsersDAO(BaseDAO):
         if not user:
             return False
         
-        from app.users.auth import verify_password
-        return verify_password(plain_password, user.user_pass)
+        from app.users.auth import verify_password_async
+        return await verify_password_async(plain_password, user.user_pass)
     
     @classmethod
     async def update_security_settings(cls, user_id: int, settings: dict) -> bool:
@@ -281,6 +417,9 @@ class UsersDAO(BaseDAO):
         """Проверяет доступность никнейма"""
         if not user_nick:
             return False
+        # Точно свободный ник не проверяется в БД
+        if not taken_values.might_be_taken_nick(user_nick):
+            return True
             
         existing_user = await cls.find_one_or_none(user_nick=user_nick)
         if not existing_user:
@@ -292,11 +431,66 @@ class UsersDAO(BaseDAO):
             
         return False
     
+    @classmethod
+    async def find_nicks_with_prefix(cls, prefix: str) -> set[str]:
+        """Все занятые ники, начинающиеся с prefix (один запрос)"""
+        pattern = escape_like(prefix) + "%"
+        async with session_scope() as session:
+            result = await session.execute(statements.get("users.nicks_by_prefix"), {"prefix": pattern})
+            return set(result.scalars().all())
+
     @classmethod
     async def find_by_nickname(cls, user_nick: str):
         """Найти пользователя по никнейму"""
         return await cls.find_one_or_none(user_nick=user_nick)
     
+    @classmethod
+    async def check_conflicts(
+        cls,
+        email: Optional[str] = None,
+        phone: Optional[str] = None,
+        nick: Optional[str] = None,
+        secondary_email: Optional[str] = None,
+        exclude_id: Optional[int] = None,
+    ) -> UserConflicts:
+        """
+        Проверяет уникальность email, телефона, ника и дополнительного email
+        (как основного или дополнительного email других пользователей) одним запросом.
+        exclude_id - пользователь, чьи собственные значения не считаются конфликтом.
+        """
+        conditions = []
+        if email:
+            conditions.append(cls.model.user_email == email)
+        if phone:
+            conditions.append(cls.model.user_phone == phone)
+        if nick:
+            conditions.append(cls.model.user_nick == nick)
+        if secondary_email:
+            conditions.append(cls.model.user_email == secondary_email)
+            conditions.append(cls.model.secondary_email == secondary_email)
+
+        conflicts = UserConflicts()
+        if not conditions:
+            return conflicts
+
+        query = select(
+            cls.model.user_email, cls.model.user_phone, cls.model.user_nick, cls.model.secondary_email
+        ).where(or_(*conditions))
+        if exclude_id is not None:
+            query = query.where(cls.model.id != exclude_id)
+        async with session_scope() as session:
+            rows = (await session.execute(query)).all()
+
+        for row in rows:
+            conflicts.email = conflicts.email or (bool(email) and row.user_email == email)
+            conflicts.phone = conflicts.phone or (bool(phone) and row.user_phone == phone)
+            conflicts.nick = conflicts.nick or (bool(nick) and row.user_nick == nick)
+            if secondary_email and row.user_email == secondary_email:
+                conflicts.secondary_email = "used_as_primary"
+            elif secondary_email and row.secondary_email == secondary_email and conflicts.secondary_email is None:
+                conflicts.secondary_email = "used_as_secondary"
+        return conflicts
+
     @classmethod
     async def find_by_secondary_email(cls, secondary_email: str):
         """Найти пользователя по дополнительному email"""
@@ -330,26 +524,160 @@ class UsersDAO(BaseDAO):
 class UserLogsDAO(BaseDAO):
     model = UserLog
 
+    @classmethod
+    def _row_projection(cls) -> tuple[list, list]:
+        """Колонки лога и данные пользователя/инициатора (через alias) для легких строк"""
+        user = aliased(User)
+        changer = aliased(User)
+        columns = [
+            cls.model.id,
+            cls.model.user_id,
+            cls.model.changed_by,
+            cls.model.action_type,
+            cls.model.old_value,
+            cls.model.new_value,
+            cls.model.description,
+            cls.model.created_at,
+            user.user_email.label('user_email'),
+            user.first_name.label('user_first_name'),
+            user.last_name.label('user_last_name'),
+            changer.user_email.label('changer_email'),
+            changer.first_name.label('changer_first_name'),
+            changer.last_name.label('changer_last_name'),
+        ]
+        joins = [
+            (user, user.id == cls.model.user_id),
+            (changer, changer.id == cls.model.changed_by),
+        ]
+        return columns, joins
+
+    @classmethod
+    def _conditions(
+        cls,
+        user_id: Optional[int] = None,
+        changed_by: Optional[int] = None,
+        action_type: Optional[str] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None
+    ) -> list:
+        """Условия фильтрации логов; created_* - UTC без временной зоны, как в created_at"""
+        conditions = []
+        if user_id is not None:
+            conditions.append(cls.model.user_id == user_id)
+        if changed_by is not None:
+            conditions.append(cls.model.changed_by == changed_by)
+        if action_type:
+            conditions.append(cls.model.action_type == action_type)
+        if created_from is not None:
+            conditions.append(cls.model.created_at >= _naive_utc(created_from))
+        if created_to is not None:
+            conditions.append(cls.model.created_at < _naive_utc(created_to))
+        return conditions
+
+    @classmethod
+    async def query(
+        cls,
+        user_id: Optional[int] = None,
+        changed_by: Optional[int] = None,
+        action_type: Optional[str] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        after: Optional[str] = None,
+        limit: int = 50
+    ) -> dict:
+        """
+        Страница логов (новые сверху, легкие строки с пользователем и инициатором,
+        см. _row_projection) с фильтрами в SQL и keyset пагинацией.
+        Фильтр по пользователю, инициатору или типу действия использует индекс
+        (колонка, created_at, id).
+        """
+        columns, joins = cls._row_projection()
+        return await cls.find_page(
+            *cls._conditions(user_id, changed_by, action_type, created_from, created_to),
+            order_by=[desc(cls.model.created_at)],
+            after=after,
+            limit=limit,
+            columns=columns,
+            joins=joins
+        )
+
+    @classmethod
+    async def count(cls, **filters) -> int:
+        """Количество логов по фильтрам _conditions"""
+        async with session_scope() as session:
+            return await session.scalar(
+                select(func.count()).select_from(cls.model).where(*cls._conditions(**filters))
+            )
+
+    @classmethod
+    async def find_rows_by_filters(cls, limit: int = 50, offset: int = 0, **filters) -> list:
+        """Логи по фильтрам _conditions с limit/offset (новые сверху, легкие строки)"""
+        columns, joins = cls._row_projection()
+        return await cls.find_rows(
+            columns,
+            *cls._conditions(**filters),
+            order_by=[desc(cls.model.created_at), desc(cls.model.id)],
+            limit=limit,
+            offset=offset,
+            joins=joins
+        )
+
     @classmethod
     async def create_log(cls, **log_data: dict):
-        """Создать запись в логе"""
+        """Создать запись в логе сразу (в обработчиках запросов - audit_log.write, см. app/users/audit_log.py)"""
         return await cls.add(**log_data)
 
     @classmethod
     async def get_user_logs(cls, user_id: int, limit: int = 50, offset: int = 0):
-        """Получить логи пользователя"""
-        async with async_session_maker() as session:
-            query = (select(cls.model)
-                    .options(
-                        joinedload(cls.model.user),
-                        joinedload(cls.model.changer)
-                    )
-                    .filter_by(user_id=user_id)
-                    .order_by(desc(cls.model.created_at))
-                    .limit(limit)
-                    .offset(offset))
-            result = await session.execute(query)
-            return result.scalars().all()
+        """Получить логи пользователя (легкие строки, см. _row_projection)"""
+        columns, joins = cls._row_projection()
+        return await cls.find_rows(
+            columns,
+            order_by=[desc(cls.model.created_at)],
+            limit=limit,
+            offset=offset,
+            joins=joins,
+            user_id=user_id
+        )
+
+    @classmethod
+    async def get_logs_page(
+        cls,
+        after: Optional[str] = None,
+        limit: int = 50,
+        user_id: Optional[int] = None,
+        action_type: Optional[str] = None
+    ) -> dict:
+        """Получить страницу логов (новые сверху, легкие строки) с keyset пагинацией, см. query"""
+        return await cls.query(user_id=user_id or None, action_type=action_type, after=after, limit=limit)
+
+    @classmethod
+    def export_fields(cls) -> list[str]:
+        """Имена полей строк stream_export (заголовок CSV)"""
+        return cls.column_names(cls._row_projection()[0])
+
+    @classmethod
+    def stream_export(
+        cls,
+        chunk_size: int = 1000,
+        user_id: Optional[int] = None,
+        action_type: Optional[str] = None
+    ):
+        """Потоковая выгрузка логов (легкие строки, см. _row_projection) в порядке id"""
+        filters = {}
+        if user_id:
+            filters['user_id'] = user_id
+        if action_type:
+            filters['action_type'] = action_type
+
+        columns, joins = cls._row_projection()
+        return cls.stream(
+            chunk_size=chunk_size,
+            columns=columns,
+            joins=joins,
+            order_by=[cls.model.id],
+            **filters
+        )
 
     @classmethod
     async def get_role_change_logs(cls, user_id: int = None, limit: int = 50):
@@ -370,21 +698,8 @@ class UserLogsDAO(BaseDAO):
             return result.scalars().all()
 
     @classmethod
-    async def get_recent_role_changes(cls, days: int = 30):
-        """Получить recent изменения ролей за указанное количество дней"""
-        async with async_session_maker() as session:
-            # Используем timezone-aware datetime
-            since_date = datetime.now(timezone.utc) - timedelta(days=days)
-            
-            query = (select(cls.model)
-                    .options(
-                        joinedload(cls.model.user),
-                        joinedload(cls.model.changer)
-                    )
-                    .filter(
-                        cls.model.action_type == 'role_change',
-                        cls.model.created_at >= since_date
-                    )
-                    .order_by(desc(cls.model.created_at)))
-            result = await session.execute(query)
-            return result.scalars().all()
\ No newline at end of file
+    async def get_recent_role_changes(cls, days: int = 30, user_id: Optional[int] = None, limit: int = 500):
+        """Изменения ролей за указанное количество дней (новые сверху, легкие строки, см. query)"""
+        since_date = datetime.now(timezone.utc) - timedelta(days=days)
+        page = await cls.query(user_id=user_id, action_type='role_change', created_from=since_date, limit=limit)
+        return page['items']
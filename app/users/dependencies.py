@@ -1,97 +1,124 @@
+import time
 from fastapi import Request, HTTPException, status, Depends
-from jose import jwt, JWTError
+from jose import JWTError
 from typing import Optional
-from datetime import datetime, timezone
-from app.config import get_auth_data
 from app.users.models import User
 from app.exceptions import TokenExpiredException, NoJwtException, NoUserIdException, ForbiddenException, TokenNoFoundException
 from app.users.dao import UsersDAO
+from app.users.snapshot import UserSnapshot, user_snapshots
+from app.users.tokens import ACCESS_COOKIE, TokenPrincipal, decode_access_token, resolve_principal
 from app.roles.models import Role, RoleTypes
 from app.utils.secutils import SecurityUtils
 from app.users.ip_dao import UserAllowedIPsDAO
 
 
 def get_token(request: Request):
-    token = request.cookies.get('users_access_token')
+    token = request.cookies.get(ACCESS_COOKIE)
     if not token:
         raise TokenNoFoundException
     return token
 
   
-async def get_current_user(token: str = Depends(get_token)):
+async def get_current_user(token: str = Depends(get_token)) -> UserSnapshot:
     """
     Основная зависимость для получения текущего пользователя
-    Используется для защищенных эндпоинтов
+    Используется для защищенных эндпоинтов.
+    Возвращает неизменяемый снимок пользователя из кэша (см. app/users/snapshot.py)
     """
     try:
-        auth_data = get_auth_data()
-        payload = jwt.decode(token, auth_data['secret_key'], algorithms=[auth_data['algorithm']])
+        payload = decode_access_token(token)
     except JWTError:
         raise NoJwtException
 
     expire = payload.get('exp')
-    expire_time = datetime.fromtimestamp(int(expire), tz=timezone.utc)
-    if (not expire) or (expire_time < datetime.now(timezone.utc)):
+    if (not expire) or (int(expire) < time.time()):
         raise TokenExpiredException
 
     user_id = payload.get('sub')
     if not user_id:
         raise NoUserIdException
 
-    user = await UsersDAO.find_one_or_none_by_id(int(user_id))
+    user = await user_snapshots.get(int(user_id))
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Пользователь не найден')
 
     return user
 
-async def get_optional_user(request: Request) -> Optional[User]:
+async def get_optional_user(request: Request) -> Optional[UserSnapshot]:
     """
     Зависимость для опционального получения пользователя
     Возвращает пользователя если авторизован, иначе None
     Используется для главной страницы и публичных эндпоинтов
     """
     try:
-        token = request.cookies.get('users_access_token')
+        token = request.cookies.get(ACCESS_COOKIE)
         if not token:
             return None
             
-        auth_data = get_auth_data()
-        payload = jwt.decode(token, auth_data['secret_key'], algorithms=[auth_data['algorithm']])
+        payload = decode_access_token(token)
         
         # Проверяем срок действия токена
         expire = payload.get('exp')
-        if expire:
-            expire_time = datetime.fromtimestamp(int(expire), tz=timezone.utc)
-            if expire_time < datetime.now(timezone.utc):
-                return None
+        if expire and int(expire) < time.time():
+            return None
         
         user_id = payload.get('sub')
         if not user_id:
             return None
             
-        user = await UsersDAO.find_one_or_none_by_id(int(user_id))
+        user = await user_snapshots.get(int(user_id))
         return user
         
     except (JWTError, Exception):
         # Любая ошибка - считаем пользователя неавторизованным
         return None
 
-async def get_current_admin(current_user: User = Depends(get_current_user)):
+async def get_current_principal(token: str = Depends(get_token)) -> TokenPrincipal:
+    """
+    Id, роль и права пользователя из access-токена.
+    Пока версия токенов пользователя не менялась (см. app/users/token_versions.py),
+    обходится без загрузки пользователя; после смены роли роль берется из БД.
+    """
+    try:
+        payload = decode_access_token(token)
+    except JWTError:
+        raise NoJwtException
+
+    expire = payload.get('exp')
+    if (not expire) or (int(expire) < time.time()):
+        raise TokenExpiredException
+
+    if not payload.get('sub'):
+        raise NoUserIdException
+
+    principal = await resolve_principal(payload)
+    if principal is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Пользователь не найден')
+    return principal
+
+async def load_principal_user(principal: TokenPrincipal) -> UserSnapshot:
+    """Снимок пользователя для обработчика после проверки роли по токену"""
+    user = principal.user or await user_snapshots.get(principal.id)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Пользователь не найден')
+    return user
+
+async def get_current_admin(principal: TokenPrincipal = Depends(get_current_principal)):
     """Проверяет, что пользователь имеет роль Admin или SuperAdmin"""
-    if current_user.is_admin:
-        return current_user
+    if principal.is_admin:
+        return await load_principal_user(principal)
     raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Недостаточно прав!')
 
-async def get_current_moderator(current_user: User = Depends(get_current_user)):
-    """Проверяет, что пользователь имеет роль SuperAdmin"""
-    if current_user.is_moderator:
-        return current_user
+async def get_current_moderator(principal: TokenPrincipal = Depends(get_current_principal)):
+    """Проверяет, что пользователь имеет роль Moderator или выше"""
+    if principal.is_moderator:
+        return await load_principal_user(principal)
     raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Недостаточно прав!')
 
-async def get_current_super_admin(current_user: User = Depends(get_current_user)):
+async def get_current_super_admin(principal: TokenPrincipal = Depends(get_current_principal)):
     """Проверяет, что пользователь имеет роль SuperAdmin"""
-    if current_user.is_super_admin:
-        return current_user
+    if principal.is_super_admin:
+        return await load_principal_user(principal)
     raise HTTPException(
         status_code=status.HTTP_403_FORBIDDEN, 
         detail='Требуются права суперадминистратора!'
@@ -135,12 +162,20 @@ async def validate_role_change(current_user: User, target_user_id: int, new_role
 async def log_role_change(user_id: int, old_role_id: int, new_role_id: int, changed_by: int, description: str = None):
     """Создать запись в логе об изменении роли"""
     from app.roles.dao import RolesDAO
-    from app.users.dao import UserLogsDAO
+    from app.users.audit_log import audit_log
     
     old_role_name = await RolesDAO.get_role_name_by_id(old_role_id)
     new_role_name = await RolesDAO.get_role_name_by_id(new_role_id)
     
-    log_data = {
+    log_data = role_change_log_data(user_id, old_role_id, old_role_name, new_role_id, new_role_name, changed_by, description)
+    
+    audit_log.write(**log_data)
+    return log_data
+
+def role_change_log_data(user_id: int, old_role_id: int, old_role_name: str, new_role_id: int, new_role_name: str,
+                         changed_by: int, description: str = None) -> dict:
+    """Запись лога об изменении роли (для log_role_change и пакетной смены ролей)"""
+    return {
         'user_id': user_id,
         'action_type': 'role_change',
         'old_value': f"role_id:{old_role_id}:{old_role_name}",
@@ -148,19 +183,6 @@ async def log_role_change(user_id: int, old_role_id: int, new_role_id: int, chan
         'description': description or f"Изменение роли с '{old_role_name}' на '{new_role_name}'",
         'changed_by': changed_by
     }
-    
-    await UserLogsDAO.create_log(**log_data)
-    return log_data
-
-async def update_role_counters(old_role_id: int, new_role_id: int):
-    """Обновить счетчики пользователей в ролях"""
-    from app.roles.models import Role
-    
-    if old_role_id and old_role_id != new_role_id:
-        await Role.decrement_count(old_role_id)
-    
-    if new_role_id != old_role_id:
-        await Role.increment_count(new_role_id)
 
 async def validate_ip_access(request: Request, current_user: User = Depends(get_current_user)):
     """
@@ -0,0 +1,132 @@
+# app/users/hashing.py
+"""
+Хеширование паролей (bcrypt) вне event loop.
+
+Один вызов bcrypt занимает десятки миллисекунд CPU; выполненный прямо в
+async-обработчике, он останавливает все запросы воркера. PasswordHasher
+выполняет хеширование в отдельном пуле потоков (bcrypt отпускает GIL) из
+PASSWORD_HASH_WORKERS потоков. В очереди ждут не более PASSWORD_HASH_QUEUE_LIMIT
+вызовов; при переполнении запрос сразу получает 503 с Retry-After, а не
+ждет за сотнями других логинов.
+
+Метрики (время хеширования, ожидание в очереди, глубина очереди, отказы) -
+GET /monitoring/auth/hashing и /monitoring/metrics.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional, TypeVar
+
+from app.config import settings
+from app.exceptions import PasswordHashingBusyException
+
+
+T = TypeVar("T")
+
+
+@dataclass
+class HashingMetrics:
+    """Накопительные счетчики с момента старта процесса"""
+    calls: int = 0
+    rejected: int = 0
+    hash_seconds: float = 0.0
+    hash_max_seconds: float = 0.0
+    wait_seconds: float = 0.0
+    wait_max_seconds: float = 0.0
+
+    def record(self, wait: float, duration: float):
+        self.calls += 1
+        self.hash_seconds += duration
+        self.wait_seconds += wait
+        self.hash_max_seconds = max(self.hash_max_seconds, duration)
+        self.wait_max_seconds = max(self.wait_max_seconds, wait)
+
+
+class PasswordHasher:
+    """Ограниченный пул потоков для bcrypt с быстрым отказом при перегрузке"""
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.metrics = HashingMetrics()
+        # Вызовы, отправленные в пул и еще не завершенные (выполняются + ждут)
+        self.pending = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.pending - self.workers)
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        """Выполняет func(*args) в пуле; PasswordHashingBusyException - очередь заполнена"""
+        if self.queue_depth >= self.queue_limit:
+            self.metrics.rejected += 1
+            raise PasswordHashingBusyException
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        submitted = time.perf_counter()
+        started = 0.0
+
+        def timed():
+            nonlocal started
+            started = time.perf_counter()
+            return func(*args)
+
+        loop = asyncio.get_running_loop()
+
+        def finished():
+            # Вызов освобождает место в пуле, только когда поток действительно закончил
+            # (отмена ожидающего запроса не останавливает уже начатое хеширование)
+            self.pending -= 1
+            if started:
+                self.metrics.record(started - submitted, time.perf_counter() - started)
+
+        def done(_future):
+            try:
+                loop.call_soon_threadsafe(finished)
+            except RuntimeError:  # event loop уже закрыт (остановка приложения)
+                pass
+
+        future = self._executor.submit(timed)
+        self.pending += 1
+        future.add_done_callback(done)
+        return await asyncio.wrap_future(future)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def status(self) -> dict:
+        metrics = self.metrics
+        return {
+            "pid": os.getpid(),
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "in_flight": self.pending - self.queue_depth,
+            "queue_depth": self.queue_depth,
+            "calls_total": metrics.calls,
+            "rejected_total": metrics.rejected,
+            "hash_seconds_total": round(metrics.hash_seconds, 6),
+            "hash_avg_seconds": round(metrics.hash_seconds / metrics.calls, 6) if metrics.calls else 0.0,
+            "hash_max_seconds": round(metrics.hash_max_seconds, 6),
+            "wait_seconds_total": round(metrics.wait_seconds, 6),
+            "wait_max_seconds": round(metrics.wait_max_seconds, 6),
+        }
+
+    def prometheus_lines(self) -> list[str]:
+        status = self.status()
+        lines = []
+        for key, value in status.items():
+            if key in ("pid", "workers", "queue_limit"):
+                continue
+            metric = f"password_hash_{key}"
+            lines.append(f"# TYPE {metric} {'counter' if key.endswith('_total') else 'gauge'}")
+            lines.append(f'{metric}{{pid="{status["pid"]}"}} {value}')
+        return lines
+
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE_LIMIT)
@@ -0,0 +1,120 @@
+# app/users/ip_allowlist.py
+"""
+Проверка IP по списку разрешенных адресов пользователя без запросов к БД.
+
+Активные записи users_allowed_ips пользователя (отдельные IPv4/IPv6 адреса
+и подсети CIDR) компилируются в IPAllowList - отсортированные непересекающиеся
+интервалы целых чисел для каждой версии IP; проверка адреса - бинарный поиск.
+
+Скомпилированные списки хранятся в памяти воркера (IP_ALLOWLIST_CACHE_TTL).
+Любая запись в users_allowed_ips через BaseDAO сбрасывает все списки, в том
+числе на остальных воркерах (pub/sub кэша DAO, см. DAOCache.on_invalidate):
+изменения редки, а по id записи нельзя узнать пользователя. В обычном случае
+(пользователь без ограничений или список уже в кэше) проверка не делает
+ни одного запроса.
+"""
+import ipaddress
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from app.config import settings
+from app.dao.cache import dao_cache
+from app.dao.replica import primary_reads
+from app.logger import app_logger as logger
+from app.users.ip_dao import UserAllowedIPsDAO
+
+
+class IPAllowList:
+    """Скомпилированный список разрешенных адресов и подсетей"""
+    __slots__ = ("_starts", "_ends", "size")
+
+    def __init__(self, networks: Iterable[str] = ()):
+        intervals: dict[int, list[tuple[int, int]]] = {4: [], 6: []}
+        self.size = 0
+        for value in networks:
+            # Некорректная запись тоже включает ограничения: она не разрешает ни одного адреса
+            self.size += 1
+            try:
+                network = ipaddress.ip_network(value.strip(), strict=False)
+            except ValueError:
+                logger.warning(f"Пропущен некорректный разрешенный IP: {value!r}")
+                continue
+            intervals[network.version].append(
+                (int(network.network_address), int(network.broadcast_address))
+            )
+
+        self._starts: dict[int, list[int]] = {}
+        self._ends: dict[int, list[int]] = {}
+        for version, items in intervals.items():
+            starts, ends = [], []
+            for start, end in sorted(items):
+                # Пересекающиеся и соседние интервалы сливаются
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            self._starts[version], self._ends[version] = starts, ends
+
+    @property
+    def restricted(self) -> bool:
+        """Есть ли ограничения; пустой список разрешает любой адрес"""
+        return self.size > 0
+
+    def allows(self, ip: str) -> bool:
+        if not self.restricted:
+            return True
+        try:
+            address = ipaddress.ip_address(ip.strip())
+        except ValueError:
+            return False
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        value = int(address)
+        starts = self._starts[address.version]
+        index = bisect_right(starts, value) - 1
+        return index >= 0 and value <= self._ends[address.version][index]
+
+
+class AllowListCache:
+    """Скомпилированные списки по user_id в памяти воркера"""
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: OrderedDict[int, tuple[float, IPAllowList]] = OrderedDict()
+        # Увеличивается при сбросе: список, загруженный до сброса, не сохраняется
+        self._generation = 0
+
+    async def get(self, user_id: int) -> IPAllowList:
+        entry = self._data.get(user_id)
+        if entry is not None:
+            if entry[0] >= time.monotonic():
+                self._data.move_to_end(user_id)
+                return entry[1]
+            del self._data[user_id]
+
+        generation = self._generation
+        with primary_reads():
+            addresses = await UserAllowedIPsDAO.get_user_allowed_ips_list(user_id)
+        allowlist = IPAllowList(addresses)
+        if self.ttl > 0 and generation == self._generation:
+            self._data[user_id] = (time.monotonic() + self.ttl, allowlist)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return allowlist
+
+    def invalidate(self):
+        self._generation += 1
+        self._data.clear()
+
+    def on_dao_invalidate(self, table: Optional[str], pk: Optional[str]):
+        """Обработчик сбросов кэша DAO (см. DAOCache.on_invalidate)"""
+        if table is None or table == UserAllowedIPsDAO.model.__tablename__:
+            self.invalidate()
+
+
+allowlists = AllowListCache(settings.IP_ALLOWLIST_CACHE_TTL, settings.USER_CACHE_MAXSIZE)
+dao_cache.on_invalidate(allowlists.on_dao_invalidate)
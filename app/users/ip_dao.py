@@ -1,10 +1,19 @@
-from sqlalchemy import select, delete, and_
+import time
+from sqlalchemy import select, delete, and_, func, inspect
 from sqlalchemy.orm import joinedload
 from app.dao.base import BaseDAO
+from app.dao.session import session_scope
 from app.users.models import UserAllowedIP
 from app.database import async_session_maker
 from typing import List, Optional
 
+# Ключ пакетного upsert. В существующие БД добавляется скриптом
+# scripts/sql/users_allowed_ips_unique.sql (с удалением дубликатов); пока его нет,
+# add_multiple_ips добавляет адреса по одному
+UPSERT_KEY = ('user_id', 'ip_address')
+# Через сколько секунд повторно проверять наличие ключа, если его не было
+UPSERT_KEY_RECHECK_SECONDS = 60
+
 class UserAllowedIPsDAO(BaseDAO):
     model = UserAllowedIP
 
@@ -45,14 +54,61 @@ class UserAllowedIPsDAO(BaseDAO):
             description=description
         )
 
+    # Результат проверки has_upsert_key и время проверки
+    _has_upsert_key: Optional[bool] = None
+    _upsert_key_checked_at = 0.0
+
+    @classmethod
+    async def has_upsert_key(cls) -> bool:
+        """Есть ли в БД уникальное ограничение или индекс по (user_id, ip_address)"""
+        if cls._has_upsert_key is True:
+            return True
+        if cls._has_upsert_key is False and time.monotonic() - cls._upsert_key_checked_at < UPSERT_KEY_RECHECK_SECONDS:
+            return False
+
+        def find_key(connection) -> bool:
+            inspector = inspect(connection)
+            table = cls.model.__tablename__
+            keys = [constraint['column_names'] for constraint in inspector.get_unique_constraints(table)]
+            keys += [index['column_names'] for index in inspector.get_indexes(table) if index.get('unique')]
+            return any(set(columns) == set(UPSERT_KEY) for columns in keys)
+
+        async with session_scope() as session:
+            connection = await session.connection()
+            cls._has_upsert_key = await connection.run_sync(find_key)
+        cls._upsert_key_checked_at = time.monotonic()
+        return cls._has_upsert_key
+
     @classmethod
-    async def add_multiple_ips(cls, user_id: int, ip_addresses: List[str]) -> List[UserAllowedIP]:
-        """Добавить несколько IP адресов для пользователя"""
-        results = []
-        for ip in ip_addresses:
-            ip_record = await cls.add_ip_for_user(user_id, ip)
-            results.append(ip_record)
-        return results
+    async def add_multiple_ips(
+        cls,
+        user_id: int,
+        ip_addresses: List[str],
+        descriptions: Optional[List[Optional[str]]] = None
+    ) -> List[UserAllowedIP]:
+        """
+        Добавить несколько IP адресов для пользователя одним запросом (upsert).
+        Уже существующие адреса активируются, описание обновляется, если передано.
+        """
+        descriptions = descriptions or [None] * len(ip_addresses)
+        if not await cls.has_upsert_key():
+            # БД без ключа upsert: по одному адресу (SELECT + INSERT/UPDATE)
+            return [
+                await cls.add_ip_for_user(user_id, ip, description)
+                for ip, description in zip(ip_addresses, descriptions)
+            ]
+        rows = [
+            {'user_id': user_id, 'ip_address': ip, 'description': description, 'is_active': 1}
+            for ip, description in zip(ip_addresses, descriptions)
+        ]
+        return await cls.bulk_upsert(
+            rows,
+            conflict_keys=list(UPSERT_KEY),
+            update_fields=['is_active'],
+            update_values=lambda excluded: {
+                'description': func.coalesce(excluded.description, cls.model.description)
+            }
+        )
 
     @classmethod
     async def deactivate_ip(cls, user_id: int, ip_address: str) -> bool:
@@ -2,6 +2,7 @@ import logging
 from datetime import datetime, timezone, timedelta
 from sqlalchemy import delete
 from app.database import async_session_maker
+from app.dao.session import session_scope
 from app.users.models import UserLog
 
 logger = logging.getLogger(__name__)
@@ -40,7 +41,8 @@ class LogCleaner:
         Получает статистику по логам
         """
         try:
-            async with async_session_maker() as session:
+            # Тяжелое чтение: при настроенной реплике выполняется на ней
+            async with session_scope() as session:
                 from sqlalchemy import func, select
                 
                 # Общее количество логов
@@ -0,0 +1,177 @@
+# app/users/login_throttle.py
+"""
+Ограничение попыток входа (/users/login/) по IP клиента и по email.
+
+Каждая попытка увеличивает два счетчика скользящего окна: для IP
+(LOGIN_LIMIT_PER_IP за LOGIN_LIMIT_IP_WINDOW секунд) и для email
+(LOGIN_LIMIT_PER_EMAIL за LOGIN_LIMIT_EMAIL_WINDOW). Попытка сверх лимита
+получает 429 до поиска пользователя в БД и проверки bcrypt, поэтому перебор
+паролей не расходует CPU воркера; Retry-After - через сколько секунд
+следующая попытка уложится в лимит. Успешный вход сбрасывает
+счетчик email.
+
+Скользящее окно приближается двумя фиксированными: текущее окно плюс
+предыдущее с весом оставшейся доли. Счетчики хранятся в Redis (общие для
+всех воркеров); при недоступности Redis - в памяти процесса.
+Email в ключах хранится в виде хеша.
+"""
+import hashlib
+import math
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.core.redis import redis_client, redis_failed
+from app.exceptions import TooManyLoginAttemptsException
+from app.logger import app_logger as logger
+
+
+KEY_PREFIX = "login_throttle"
+# Размер счетчиков в памяти, после которого удаляются устаревшие окна
+LOCAL_PRUNE_SIZE = 10000
+
+
+@dataclass
+class ThrottleMetrics:
+    """Накопительные счетчики с момента старта процесса"""
+    attempts: int = 0
+    rejected_ip: int = 0
+    rejected_email: int = 0
+    redis_errors: int = 0
+
+
+class LoginThrottle:
+    """Счетчики попыток входа со скользящим окном (Redis или память процесса)"""
+
+    def __init__(self):
+        self.limits = {
+            "ip": (settings.LOGIN_LIMIT_PER_IP, settings.LOGIN_LIMIT_IP_WINDOW),
+            "email": (settings.LOGIN_LIMIT_PER_EMAIL, settings.LOGIN_LIMIT_EMAIL_WINDOW),
+        }
+        self.metrics = ThrottleMetrics()
+        self._local: dict[tuple[str, str, int], int] = {}
+
+    @staticmethod
+    def _ident(kind: str, value: str) -> str:
+        value = value.strip().lower() if kind == "email" else value.strip()
+        return hashlib.sha1(value.encode()).hexdigest()[:20]
+
+    @staticmethod
+    def _key(kind: str, ident: str, index: int) -> str:
+        return f"{KEY_PREFIX}:{kind}:{ident}:{index}"
+
+    async def _counts(self, kind: str, ident: str, index: int, increment: bool) -> tuple[int, int]:
+        """(текущее окно, предыдущее окно); increment - учесть попытку"""
+        window = self.limits[kind][1]
+        client = redis_client()
+        if client is not None:
+            current_key, previous_key = self._key(kind, ident, index), self._key(kind, ident, index - 1)
+            try:
+                async with client.pipeline(transaction=False) as pipe:
+                    if increment:
+                        pipe.incr(current_key)
+                        pipe.expire(current_key, window * 2)
+                    else:
+                        pipe.get(current_key)
+                    pipe.get(previous_key)
+                    result = await pipe.execute()
+                return int(result[0] or 0), int(result[-1] or 0)
+            except (RedisError, OSError) as e:
+                self.metrics.redis_errors += 1
+                logger.warning(f"Ограничение попыток входа: Redis недоступен, счетчики в памяти: {e}")
+                redis_failed()
+
+        if increment:
+            self._local[(kind, ident, index)] = self._local.get((kind, ident, index), 0) + 1
+            if len(self._local) > LOCAL_PRUNE_SIZE:
+                self._prune()
+        return self._local.get((kind, ident, index), 0), self._local.get((kind, ident, index - 1), 0)
+
+    def _prune(self):
+        now = time.time()
+        self._local = {
+            key: count for key, count in self._local.items()
+            if key[2] >= math.floor(now / self.limits[key[0]][1]) - 1
+        }
+
+    async def _hit(self, kind: str, value: str, increment: bool = True) -> tuple[float, float]:
+        """(оценка числа попыток за скользящее окно, секунд до попытки в пределах лимита)"""
+        limit, window = self.limits[kind]
+        position = time.time() / window
+        index = math.floor(position)
+        elapsed = position - index
+        current, previous = await self._counts(kind, self._ident(kind, value), index, increment)
+        return current + previous * (1 - elapsed), self._retry_after(limit, window, current, previous, elapsed)
+
+    @staticmethod
+    def _retry_after(limit: int, window: float, current: int, previous: int, elapsed: float) -> float:
+        """
+        Секунды до момента, когда следующая попытка уложится в лимит.
+        Следующая попытка сама увеличит текущий счетчик, поэтому оценка без
+        нее должна опуститься до limit - 1
+        """
+        allowed = max(limit - 1, 0)
+        if previous and current <= allowed:
+            # Еще в текущем окне: current + previous * (1 - e) <= allowed
+            return max(1 - (allowed - current) / previous - elapsed, 0) * window
+        # В следующем окне текущий счетчик становится предыдущим:
+        # current * (1 - e) <= allowed
+        wait = (1 - elapsed) * window
+        if current > allowed:
+            wait += (1 - allowed / current) * window
+        return wait
+
+    async def check(self, client_ip: Optional[str], email: str):
+        """Учитывает попытку входа; TooManyLoginAttemptsException - лимит превышен"""
+        self.metrics.attempts += 1
+        for kind, value in (("ip", client_ip), ("email", email)):
+            if not value:
+                continue
+            estimate, retry_after = await self._hit(kind, value)
+            if estimate > self.limits[kind][0]:
+                if kind == "ip":
+                    self.metrics.rejected_ip += 1
+                else:
+                    self.metrics.rejected_email += 1
+                raise TooManyLoginAttemptsException(math.ceil(retry_after))
+
+    async def reset_email(self, email: str):
+        """Сбрасывает счетчик email после успешного входа"""
+        ident = self._ident("email", email)
+        index = math.floor(time.time() / self.limits["email"][1])
+        for i in (index, index - 1):
+            self._local.pop(("email", ident, i), None)
+        client = redis_client()
+        if client is None:
+            return
+        try:
+            await client.delete(self._key("email", ident, index), self._key("email", ident, index - 1))
+        except (RedisError, OSError):
+            self.metrics.redis_errors += 1
+            redis_failed()
+
+    async def status(self, client_ip: Optional[str] = None, email: Optional[str] = None) -> dict:
+        """Счетчики ограничителя; с ip/email - текущая оценка попыток для них"""
+        metrics = self.metrics
+        status = {
+            "pid": os.getpid(),
+            "backend": "redis" if redis_client() is not None else "memory",
+            "limits": {kind: {"limit": limit, "window_seconds": window} for kind, (limit, window) in self.limits.items()},
+            "attempts_total": metrics.attempts,
+            "rejected_ip_total": metrics.rejected_ip,
+            "rejected_email_total": metrics.rejected_email,
+            "redis_errors_total": metrics.redis_errors,
+            "local_counters": len(self._local),
+        }
+        for kind, value in (("ip", client_ip), ("email", email)):
+            if value:
+                estimate, _ = await self._hit(kind, value, increment=False)
+                status[f"{kind}_attempts"] = round(estimate, 2)
+        return status
+
+
+login_throttle = LoginThrottle()
@@ -1,5 +1,5 @@
 
-from sqlalchemy import Integer, ForeignKey, Text, text, event, DateTime
+from sqlalchemy import DDL, Integer, ForeignKey, Text, text, event, DateTime, Index, UniqueConstraint
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from typing import Optional, List
 from app.database import Base, str_uniq, int_pk, str_null_true
@@ -9,6 +9,14 @@ from app.tickets.models import Ticket, TicketMessage
 
 class UserLog(Base):
     __tablename__ = "users_logs"
+    __table_args__ = (
+        # Индекс под keyset пагинацию логов (created_at DESC, id DESC)
+        Index("ix_users_logs_created_at_id", "created_at", "id"),
+        # Фильтры UserLogsDAO.query по пользователю, инициатору и типу действия с тем же порядком
+        Index("ix_users_logs_user_id_created_at", "user_id", "created_at", "id"),
+        Index("ix_users_logs_changed_by_created_at", "changed_by", "created_at", "id"),
+        Index("ix_users_logs_action_type_created_at", "action_type", "created_at", "id"),
+    )
     
     id: Mapped[int_pk]
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False)
@@ -34,6 +42,11 @@ class UserLog(Base):
 
 class UserAllowedIP(Base):
     __tablename__ = "users_allowed_ips"
+    __table_args__ = (
+        # Ключ для пакетного upsert IP адресов (ON CONFLICT). В существующую БД
+        # добавляется скриптом scripts/sql/users_allowed_ips_unique.sql
+        UniqueConstraint("user_id", "ip_address", name="uq_users_allowed_ips_user_ip"),
+    )
     
     id: Mapped[int_pk]
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -59,8 +72,23 @@ class UserAllowedIP(Base):
     def __repr__(self):
         return str(self)
 
+# Колонки поиска пользователей в админке (ILIKE '%...%', см. UsersDAO.search_page)
+USER_SEARCH_COLUMNS = ("user_email", "user_nick", "first_name", "last_name", "user_phone")
+
 # создаем модель таблицы Пользователей
 class User(Base):
+    __table_args__ = (
+        # Поиск ников по префиксу (LIKE 'prefix%') при подборе ника для регистрации
+        Index("ix_users_user_nick_pattern", "user_nick", postgresql_ops={"user_nick": "varchar_pattern_ops"}),
+        # Keyset пагинация списка пользователей (created_at DESC, id DESC)
+        Index("ix_users_created_at_id", "created_at", "id"),
+        # Поиск по подстроке: триграммные GIN индексы (расширение pg_trgm)
+        *(
+            Index(f"ix_users_{column}_trgm", column, postgresql_using="gin", postgresql_ops={column: "gin_trgm_ops"})
+            for column in USER_SEARCH_COLUMNS
+        ),
+    )
+
     id: Mapped[int_pk] #= mapped_column(Integer, primary_key=True, index=True, autoincrement=True)
     user_phone: Mapped[str_uniq] #= mapped_column(String, unique=True, index=True, nullable=False)
     first_name: Mapped[str] = mapped_column(index=True, nullable=True)
@@ -74,7 +102,7 @@ class User(Base):
     user_status: Mapped[int] = mapped_column(Integer, nullable=True)
     # verification_codes: Mapped[list["VerificationCode"]] = relationship(back_populates="user")
     special_notes: Mapped[str_null_true] #= mapped_column(String, nullable=True)
-    role_id: Mapped[int] = mapped_column(Integer, ForeignKey("roles.id"), nullable=True, default=4)
+    role_id: Mapped[int] = mapped_column(Integer, ForeignKey("roles.id"), index=True, nullable=True, default=4)
     tg_chat_id: Mapped[Optional[str]] = mapped_column(nullable=True)
 
     # ДОБАВЛЯЕМ ТОЛЬКО last_login, так как created_at и updated_at уже есть в Base
@@ -148,3 +176,9 @@ class User(Base):
         """Проверяет, является ли пользователь администратором"""
         return self.role_id in [1, 2, 3]  # Предполагая, что 1=SuperAdmin, 2=Admin, 3=Moderator
     
+
+# Триграммные индексы users требуют pg_trgm; в миграции - op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+event.listen(
+    User.__table__, "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
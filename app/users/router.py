@@ -1,24 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response
+from fastapi import APIRouter, Depends, HTTPException, status, Response, Query
 from typing import Optional, List
+from datetime import datetime
 import re
 import random
 import json
 import logging
 import asyncio
 from jose import jwt, JWTError
+from sqlalchemy.exc import IntegrityError
 from app.config import get_auth_data
 from app.tasks.log_cleanup_task import log_cleanup
 from app.logger import app_logger as logger
 from fastapi.requests import Request
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from app.users.auth import get_password_hash, authenticate_user, create_access_token
+from app.users.auth import get_password_hash_async, verify_password_async, authenticate_user
 from app.exceptions import UserAlreadyExistsException, IncorrectEmailOrPasswordException, PasswordMismatchException
+from app.exceptions import NoJwtException, TokenNoFoundException
 from app.users.dao import UsersDAO, UserLogsDAO
 from app.roles.dao import RolesDAO
+from app.roles.counts import role_counts
 from app.users.rb import RBUser
 from app.users.models import User
 from app.utils.secutils import SecurityUtils
 from app.users.log_cleaner import LogCleaner
+from app.users.login_throttle import login_throttle
+from app.users.audit_log import audit_log
+from app.users.availability import taken_values
+from app.users.snapshot import user_snapshots
+from app.users.tokens import REFRESH_COOKIE, check_refresh_token, clear_auth_cookies, cookie_user_id
+from app.users.tokens import revoke_refresh_tokens, set_auth_cookies
 from app.tasks.background_tasks import background_tasks
 from app.users.ip_dao import UserAllowedIPsDAO
 from app.users.schemas import SUserBase, SUserAdd, SUserResponse, SUserListResponse, SUserAuth
@@ -26,8 +36,14 @@ from app.users.schemas import SUserRegister, SUserByEmailResponse, SUserUpdatePr
 from app.users.schemas import SUserUpdateRole, SUserUpdateRoleResponse, SUserUpdateRoleByEmail, SUserRoleInfo
 from app.users.schemas import SUserLogResponse, SUserLogsList, SRoleChangeLog, SUserRead, SUserAddSecondaryEmail
 from app.users.schemas import SUserIPRestriction, SUserProfileResponse, SUserAddIP, SUserRemoveIP, SUserAllowedIPResponse
-from app.users.schemas import SUserAllowedIPBase
+from app.users.schemas import SUserAllowedIPBase, SUserLogsCursorPage, RoleResponse
+from app.users.schemas import SUsersBulkUpdateRole, SUsersBulkUpdateRoleResponse, SUserRoleChange, SUsersSearchPage
+from app.roles.models import RoleTypes
+from app.dao.session import unit_of_work
+from app.dao.pagination import InvalidCursorError
+from app.utils.export import ExportFormat, export_response
 from app.users.dependencies import get_current_user, get_current_admin, get_current_moderator, get_current_super_admin, validate_role_change, log_role_change
+from app.users.dependencies import role_change_log_data
 
 from fastapi.templating import Jinja2Templates
 
@@ -62,68 +78,80 @@ async def get_categories(request: Request):
 async def register_user(user_data: SUserRegister) -> dict:
     from app.users.dao import UsersDAO
     
-    # Проверяем существование пользователя по email
-    user_by_email = await UsersDAO.find_by_email(user_data.user_email)
-    if user_by_email:
+    # Проверяем email, телефон и указанный ник одним запросом
+    conflicts = await UsersDAO.check_conflicts(
+        email=user_data.user_email,
+        phone=user_data.user_phone,
+        nick=user_data.user_nick
+    )
+    if conflicts.email:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail='Пользователь с таким email уже существует'
         )
-    
-    # Проверяем существование пользователя по телефону
-    user_by_phone = await UsersDAO.find_by_phone(user_data.user_phone)
-    if user_by_phone:
+    if conflicts.phone:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail='Пользователь с таким телефоном уже существует'
         )
-
-    # Генерируем уникальный ник, если не указан
-    user_dict = user_data.model_dump(exclude={'user_pass_check'})
-    
-    if not user_dict.get('user_nick'):
-        user_dict['user_nick'] = await generate_unique_nick(
-            user_data.first_name, 
-            user_data.last_name
+    if conflicts.nick:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='Этот никнейм уже занят'
         )
 
-    user_dict['user_pass'] = get_password_hash(user_data.user_pass)
-    
-    await UsersDAO.add_user(**user_dict)
+    user_dict = user_data.model_dump(exclude={'user_pass_check'})
+    user_dict['user_pass'] = await get_password_hash_async(user_data.user_pass)
+    generate_nick = not user_dict.get('user_nick')
+
+    for attempt in range(NICK_INSERT_ATTEMPTS):
+        # Генерируем уникальный ник, если не указан
+        if generate_nick:
+            user_dict['user_nick'] = await generate_unique_nick(
+                user_data.first_name, 
+                user_data.last_name
+            )
+        try:
+            await UsersDAO.add_user(**user_dict)
+            break
+        except IntegrityError as e:
+            # Ник заняла параллельная регистрация между подбором и вставкой - подбираем заново
+            if not generate_nick or 'user_nick' not in str(e.orig) or attempt == NICK_INSERT_ATTEMPTS - 1:
+                raise
     return {'message': f'Вы успешно зарегистрированы!'}
 
 
+# Попытки вставки пользователя, если сгенерированный ник успели занять
+NICK_INSERT_ATTEMPTS = 3
+# Длина ника без суффикса "_N" (N > 1): 47 - число цифр N
+NICK_SUFFIX_BASE_LENGTH = 47
+
+
+def _nick_candidate(base_nick: str, counter: int) -> str:
+    """Вариант ника: base_nick, base_nick_1, base_ni_2, ..."""
+    if counter == 0:
+        return base_nick
+    if counter == 1:
+        return f"{base_nick}_{counter}"
+    # Обрезаем base_nick если нужно место для цифр
+    return f"{base_nick[:NICK_SUFFIX_BASE_LENGTH - len(str(counter))]}_{counter}"
+
+
 async def generate_unique_nick(first_name: str, last_name: str) -> str:
-    """Генерирует уникальный никнейм"""
-   
-    
+    """
+    Генерирует уникальный никнейм: первый свободный вариант base_nick(_N).
+    Все занятые варианты загружаются одним запросом по префиксу, свободный
+    суффикс ищется в памяти, поэтому время не зависит от популярности имени.
+    """
     base_nick = _create_base_nick(first_name, last_name)
-    unique_nick = base_nick
-    counter = 1
-    
-    # Проверяем уникальность ника и добавляем цифры при необходимости
-    while counter <= 100:
-        existing_user = await UsersDAO.find_one_or_none(user_nick=unique_nick)
-        if not existing_user:
-            break
-        
-        # Если ник уже существует, добавляем цифру
-        if counter == 1:
-            unique_nick = f"{base_nick}_{counter}"
-        else:
-            # Обрезаем base_nick если нужно место для цифр
-            max_base_length = 47 - len(str(counter))
-            truncated_base = base_nick[:max_base_length]
-            unique_nick = f"{truncated_base}_{counter}"
-        
+    # Общий префикс всех вариантов, в том числе обрезанных под суффикс до 7 цифр
+    taken = await UsersDAO.find_nicks_with_prefix(base_nick[:NICK_SUFFIX_BASE_LENGTH - 7])
+
+    # Варианты различны, поэтому среди len(taken) + 1 первых есть свободный
+    counter = 0
+    while _nick_candidate(base_nick, counter) in taken:
         counter += 1
-    
-    # Если все варианты заняты, генерируем случайный
-    if counter > 100:
-        import random
-        unique_nick = f"user_{random.randint(10000, 99999)}"
-    
-    return unique_nick
+    return _nick_candidate(base_nick, counter)
 
 
 def _create_base_nick(first_name: str, last_name: str) -> str:
@@ -219,6 +247,9 @@ def _create_base_nick(first_name: str, last_name: str) -> str:
 
 @router.post("/login/")
 async def auth_user(response: Response, user_data: SUserAuth, request: Request):
+    # Лимит попыток по IP и email - до поиска пользователя и проверки bcrypt
+    await login_throttle.check(SecurityUtils.get_client_ip(request), user_data.user_email)
+
     check = await authenticate_user(
         user_email=user_data.user_email, 
         user_pass=user_data.user_pass,
@@ -226,24 +257,19 @@ async def auth_user(response: Response, user_data: SUserAuth, request: Request):
     )
     if check is None:
         raise IncorrectEmailOrPasswordException
+    await login_throttle.reset_email(user_data.user_email)
     
     # Обновляем время последнего входа
     success = await UsersDAO.update_last_login(check.id)
     if not success:
         log_error(f"Не удалось обновить last_login для пользователя {check.id}")
     
-    access_token = create_access_token({"sub": str(check.id)})
-    response.set_cookie(
-        key="users_access_token", 
-        value=access_token, 
-        httponly=True,
-        max_age=30*24*60*60,
-        path="/"
-    )
+    # Короткий access-токен с ролью и refresh-токен (см. app/users/tokens.py)
+    await set_auth_cookies(response, check.id, check.role_id)
     
     # Логируем успешный вход с IP
     client_ip = SecurityUtils.get_client_ip(request)
-    await UserLogsDAO.create_log(
+    audit_log.write(
         user_id=check.id,
         action_type='login',
         old_value=None,
@@ -265,41 +291,115 @@ async def auth_user(response: Response, user_data: SUserAuth, request: Request):
 
 @router.get("/me/")
 async def get_me(user_data: User = Depends(get_current_user)):
-    return user_data
+    # Снимок пользователя (UserSnapshot) без пароля, как User.to_dict
+    return user_data.to_dict()
+
+@router.post("/refresh/")
+async def refresh_tokens(response: Response, request: Request):
+    """Новые access- и refresh-токены по refresh-токену; роль - текущая из БД"""
+    refresh_token = request.cookies.get(REFRESH_COOKIE)
+    if not refresh_token:
+        raise TokenNoFoundException
+    try:
+        user_id = await check_refresh_token(refresh_token)
+    except JWTError:
+        raise NoJwtException
+
+    user = await user_snapshots.get(user_id)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Пользователь не найден')
+    await set_auth_cookies(response, user.id, user.role_id)
+    return {"ok": True, "user_id": user.id}
 
 @router.post("/logout/")
-async def logout_user(response: Response):
-    response.delete_cookie(key="users_access_token")
+async def logout_user(response: Response, request: Request):
+    # Отзываем refresh-токены пользователя: скопированная cookie больше не выпустит access-токен
+    user_id = cookie_user_id(request.cookies)
+    if user_id is not None:
+        await revoke_refresh_tokens(user_id)
+    clear_auth_cookies(response)
     return {'message': 'Пользователь успешно вышел из системы'}
 
-@router.get("/all/", summary="Получить список всех пользователей", response_model=SUserListResponse)
+def user_row_to_response(user) -> SUserResponse:
+    """Легкая строка пользователя с role_name (find_all_rows_with_roles, search_page) -> схема ответа"""
+    extra = {key: value for key, value in user._mapping.items() if key in ('email_verified', 'phone_verified')}
+    return SUserResponse(
+        id=user.id,
+        user_phone=user.user_phone,
+        first_name=user.first_name,
+        last_name=user.last_name,
+        user_nick=user.user_nick,
+        user_email=user.user_email,
+        user_status=user.user_status,
+        role_id=user.role_id,
+        special_notes=user.special_notes,
+        role=RoleResponse(id=user.role_id, role_name=user.role_name) if user.role_name is not None else None,
+        **extra
+    )
+
+@router.get("/all/", summary="Получить список всех пользователей", response_model=SUserListResponse,
+            deprecated=True)
 async def get_all_users(
     current_user: User = Depends(get_current_admin),
     request_body: RBUser = Depends()
     ) -> SUserListResponse:
-    # Используем метод с загрузкой ролей
-    users = await UsersDAO.find_all_with_roles(**request_body.to_dict())
+    """Весь список без ограничения; для админки - постраничный /users/search/"""
+    # Только нужные колонки и название роли, без ORM-объектов User/Role
+    users = await UsersDAO.find_all_rows_with_roles(**request_body.to_dict())
     
     # Преобразуем пользователей в схему ответа
-    user_responses = []
-    for user in users:
-        user_response = SUserResponse(
-            id=user.id,
-            user_phone=user.user_phone,
-            first_name=user.first_name,
-            last_name=user.last_name,
-            user_nick=user.user_nick,
-            user_email=user.user_email,
-            user_status=user.user_status,
-            role_id=user.role_id,
-            special_notes=user.special_notes,
-            role=user.role  # объект Role автоматически преобразуется в RoleResponse
-        )
-        user_responses.append(user_response)
+    user_responses = [user_row_to_response(user) for user in users]
     
     return SUserListResponse(users=user_responses, total=len(user_responses))
 
-@router.get("/all_users/")
+@router.get("/search/", summary="Поиск пользователей (keyset пагинация)", response_model=SUsersSearchPage)
+async def search_users(
+    q: Optional[str] = Query(None, max_length=100, description="Слова для поиска в email, нике, имени, фамилии и телефоне"),
+    role_id: Optional[int] = None,
+    user_status: Optional[int] = None,
+    email_verified: Optional[int] = Query(None, ge=0, le=1),
+    phone_verified: Optional[int] = Query(None, ge=0, le=1),
+    created_from: Optional[datetime] = Query(None, description="Зарегистрирован не раньше"),
+    created_to: Optional[datetime] = Query(None, description="Зарегистрирован раньше"),
+    after: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(get_current_admin)
+) -> SUsersSearchPage:
+    """
+    Пользователи постранично, новые сверху (только для администраторов).
+    Для следующей страницы передайте next_cursor из ответа в параметр after
+    с теми же фильтрами.
+    """
+    try:
+        page = await UsersDAO.search_page(
+            search=q,
+            role_id=role_id,
+            user_status=user_status,
+            email_verified=email_verified,
+            phone_verified=phone_verified,
+            created_from=created_from,
+            created_to=created_to,
+            after=after,
+            limit=limit
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return SUsersSearchPage(
+        users=[user_row_to_response(user) for user in page['items']],
+        next_cursor=page['next_cursor'],
+        has_more=page['has_more']
+    )
+
+@router.get("/export/", summary="Выгрузить всех пользователей (NDJSON/CSV)")
+async def export_users(
+    current_user: User = Depends(get_current_admin),
+    export_format: ExportFormat = Query("ndjson", alias="format")
+):
+    """Потоковая выгрузка пользователей: память сервера не зависит от количества записей"""
+    return export_response(UsersDAO.stream_export(), UsersDAO.export_fields(), export_format, "users")
+
+@router.get("/all_users/", deprecated=True)
 async def get_all_users(user_data: User = Depends(get_current_super_admin)):
     return await UsersDAO.find_all()
 
@@ -359,25 +459,21 @@ async def add_user(
     current_user: User = Depends(get_current_admin)
     ) -> dict:
     """Добавить пользователя (только для админов)"""
-    # Проверяем уникальность email и телефона
-    # existing_user = await UsersDAO.find_one_or_none(user_email=user.user_email)
-    existing_user = await UsersDAO.find_by_email(user.user_email)
-    if existing_user:
+    # Проверяем уникальность email и телефона одним запросом
+    conflicts = await UsersDAO.check_conflicts(email=user.user_email, phone=user.user_phone)
+    if conflicts.email:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail='Пользователь с таким email уже существует'
         )
-    
-    # existing_user = await UsersDAO.find_one_or_none(user_phone=user.user_phone)
-    existing_user = await UsersDAO.find_by_phone(user.user_phone)
-    if existing_user:
+    if conflicts.phone:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail='Пользователь с таким телефоном уже существует'
         )
 
     user_data = user.model_dump()
-    user_data['user_pass'] = get_password_hash(user_data['user_pass'])
+    user_data['user_pass'] = await get_password_hash_async(user_data['user_pass'])
     
     user_id = await UsersDAO.add_user(**user_data)
     if user_id:
@@ -500,58 +596,161 @@ async def update_user_role_by_email(
         role_name=new_role.role_name
     )
 
+@router.put("/bulk-update-role/", 
+           summary="Изменить роль нескольких пользователей", 
+           response_model=SUsersBulkUpdateRoleResponse)
+async def bulk_update_user_role(
+    role_data: SUsersBulkUpdateRole,
+    super_admin: User = Depends(get_current_super_admin)
+) -> SUsersBulkUpdateRoleResponse:
+    """
+    Изменить роль нескольких пользователей (только для суперадминистратора).
+    Роль, счетчики ролей и логи изменяются одной транзакцией. Суперадминистраторы
+    и сам текущий пользователь пропускаются, как в /update-role/.
+    """
+    new_role_id = role_data.new_role_id
+    if new_role_id == RoleTypes.SUPER_ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Нельзя назначить роль суперадминистратора"
+        )
+    
+    new_role = await RolesDAO.find_by_id(new_role_id)
+    if not new_role:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Роль с ID {new_role_id} не найдена"
+        )
+    
+    requested_ids = list(dict.fromkeys(role_data.user_ids))
+    user_ids = [user_id for user_id in requested_ids if user_id != super_admin.id]
+    
+    async with unit_of_work():
+        rows = await UsersDAO.update_users_role(user_ids, new_role_id, exclude_role_ids=(RoleTypes.SUPER_ADMIN,))
+        changed = [(user_id, old_role_id) for user_id, old_role_id in rows if old_role_id != new_role_id]
+        
+        # Логи изменений одной вставкой
+        role_names = {new_role_id: new_role.role_name}
+        for _, old_role_id in changed:
+            if old_role_id not in role_names:
+                role_names[old_role_id] = await RolesDAO.get_role_name_by_id(old_role_id)
+        await UserLogsDAO.bulk_insert([
+            role_change_log_data(
+                user_id, old_role_id, role_names[old_role_id], new_role_id, new_role.role_name,
+                changed_by=super_admin.id,
+                description=f"Роль изменена (пакетно) суперадминистратором {super_admin.user_email}"
+            )
+            for user_id, old_role_id in changed
+        ], returning=False)
+    
+    found_ids = {user_id for user_id, _ in rows}
+    return SUsersBulkUpdateRoleResponse(
+        message=f"Роль изменена у {len(changed)} пользователей",
+        new_role_id=new_role_id,
+        role_name=new_role.role_name,
+        changed=[SUserRoleChange(user_id=user_id, old_role_id=old_role_id) for user_id, old_role_id in changed],
+        unchanged=[user_id for user_id, old_role_id in rows if old_role_id == new_role_id],
+        skipped=[user_id for user_id in requested_ids if user_id not in found_ids]
+    )
+
 # Новые роутеры для работы с логами
+def log_row_to_response(log) -> SUserLogResponse:
+    """Легкая строка лога (UserLogsDAO._row_projection) -> схема ответа"""
+    return SUserLogResponse(
+        id=log.id,
+        user_id=log.user_id,
+        changed_by=log.changed_by,
+        action_type=log.action_type,
+        old_value=log.old_value,
+        new_value=log.new_value,
+        description=log.description,
+        created_at=log.created_at,
+        user_email=log.user_email,
+        changer_email=log.changer_email,
+        user_name=f"{log.user_first_name} {log.user_last_name}" if log.user_email else None,
+        changer_name=f"{log.changer_first_name} {log.changer_last_name}" if log.changer_email else None
+    )
+
 @router.get("/logs/", 
            summary="Получить логи пользователей", 
            response_model=SUserLogsList)
 async def get_users_logs(
     user_id: Optional[int] = None,
+    changed_by: Optional[int] = None,
     action_type: Optional[str] = None,
-    limit: int = 50,
-    offset: int = 0,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
     admin_user: User = Depends(get_current_super_admin)
 ) -> SUserLogsList:
     """
     Получить логи пользователей (только для администраторов).
+    Для больших смещений используйте /users/logs/cursor/.
     """
-    # Собираем фильтры
-    filters = {}
-    if user_id:
-        filters['user_id'] = user_id
-    if action_type:
-        filters['action_type'] = action_type
-    
-    # Получаем логи с помощью BaseDAO
-    logs = await UserLogsDAO.find_all(**filters)
-    
-    # Сортируем и ограничиваем результат (так как BaseDAO не поддерживает сортировку и пагинацию напрямую)
-    sorted_logs = sorted(logs, key=lambda x: x.created_at, reverse=True)
-    paginated_logs = sorted_logs[offset:offset + limit]
-    
-    # Преобразуем в схему ответа
-    log_responses = []
-    for log in paginated_logs:
-        # Получаем связанные данные пользователей
-        user = await UsersDAO.find_one_or_none_by_id(log.user_id) if log.user_id else None
-        changer = await UsersDAO.find_one_or_none_by_id(log.changed_by) if log.changed_by else None
-        
-        log_response = SUserLogResponse(
-            id=log.id,
-            user_id=log.user_id,
-            changed_by=log.changed_by,
-            action_type=log.action_type,
-            old_value=log.old_value,
-            new_value=log.new_value,
-            description=log.description,
-            created_at=log.created_at,
-            user_email=user.user_email if user else None,
-            changer_email=changer.user_email if changer else None,
-            user_name=f"{user.first_name} {user.last_name}" if user else None,
-            changer_name=f"{changer.first_name} {changer.last_name}" if changer else None
+    filters = dict(
+        user_id=user_id,
+        changed_by=changed_by,
+        action_type=action_type,
+        created_from=created_from,
+        created_to=created_to
+    )
+    # Фильтры, сортировка и пагинация - в SQL; пользователь и инициатор - в той же строке
+    logs = await UserLogsDAO.find_rows_by_filters(limit=limit, offset=offset, **filters)
+    total = await UserLogsDAO.count(**filters)
+
+    log_responses = [log_row_to_response(log) for log in logs]
+
+    return SUserLogsList(logs=log_responses, total=total)
+
+@router.get("/logs/cursor/", 
+           summary="Получить логи пользователей (keyset пагинация)", 
+           response_model=SUserLogsCursorPage)
+async def get_users_logs_cursor(
+    user_id: Optional[int] = None,
+    changed_by: Optional[int] = None,
+    action_type: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    after: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    admin_user: User = Depends(get_current_super_admin)
+) -> SUserLogsCursorPage:
+    """
+    Получить логи пользователей постранично по курсору (только для администраторов).
+    Для следующей страницы передайте next_cursor из ответа в параметр after.
+    """
+    try:
+        page = await UserLogsDAO.query(
+            user_id=user_id,
+            changed_by=changed_by,
+            action_type=action_type,
+            created_from=created_from,
+            created_to=created_to,
+            after=after,
+            limit=limit
         )
-        log_responses.append(log_response)
-    
-    return SUserLogsList(logs=log_responses, total=len(sorted_logs))
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    log_responses = [log_row_to_response(log) for log in page['items']]
+
+    return SUserLogsCursorPage(logs=log_responses, next_cursor=page['next_cursor'], has_more=page['has_more'])
+
+@router.get("/logs/export/", summary="Выгрузить логи пользователей (NDJSON/CSV)")
+async def export_users_logs(
+    user_id: Optional[int] = None,
+    action_type: Optional[str] = None,
+    export_format: ExportFormat = Query("ndjson", alias="format"),
+    admin_user: User = Depends(get_current_super_admin)
+):
+    """Потоковая выгрузка логов пользователей (только для администраторов)"""
+    return export_response(
+        UserLogsDAO.stream_export(user_id=user_id, action_type=action_type),
+        UserLogsDAO.export_fields(),
+        export_format,
+        "users_logs"
+    )
 
 @router.get("/logs/role-changes/", 
            summary="Получить логи изменений ролей", 
@@ -559,36 +758,33 @@ async def get_users_logs(
 async def get_role_change_logs(
     user_id: Optional[int] = None,
     days: int = 30,
+    limit: int = Query(500, ge=1, le=1000),
     admin_user: User = Depends(get_current_super_admin)
 ) -> list[SRoleChangeLog]:
     """
-    Получить логи изменений ролей (только для администраторов).
+    Получить логи изменений ролей (только для администраторов), не более limit последних.
     """
-    logs = await UserLogsDAO.get_recent_role_changes(days=days)
-    
-    # Если нужна фильтрация по конкретному пользователю
-    if user_id:
-        logs = [log for log in logs if log.user_id == user_id]
+    # Тип действия, пользователь и период - в SQL (индексы users_logs, см. UserLogsDAO.query)
+    logs = await UserLogsDAO.get_recent_role_changes(days=days, user_id=user_id, limit=limit)
     
     role_change_logs = []
     for log in logs:
-        if log.action_type == 'role_change':
-            # Парсим old_value и new_value
-            old_role_info = log.old_value.split(':') if log.old_value else ['', '', '']
-            new_role_info = log.new_value.split(':') if log.new_value else ['', '', '']
-            
-            role_change_log = SRoleChangeLog(
-                id=log.id,
-                user_id=log.user_id,
-                user_email=log.user.user_email if log.user else "Unknown",
-                user_name=f"{log.user.first_name} {log.user.last_name}" if log.user else "Unknown User",
-                old_role=old_role_info[2] if len(old_role_info) > 2 else "Unknown",
-                new_role=new_role_info[2] if len(new_role_info) > 2 else "Unknown",
-                changed_by=f"{log.changer.first_name} {log.changer.last_name}" if log.changer else "Unknown",
-                changer_email=log.changer.user_email if log.changer else "Unknown",
-                created_at=log.created_at
-            )
-            role_change_logs.append(role_change_log)
+        # Парсим old_value и new_value
+        old_role_info = log.old_value.split(':') if log.old_value else ['', '', '']
+        new_role_info = log.new_value.split(':') if log.new_value else ['', '', '']
+        
+        role_change_log = SRoleChangeLog(
+            id=log.id,
+            user_id=log.user_id,
+            user_email=log.user_email if log.user_email else "Unknown",
+            user_name=f"{log.user_first_name} {log.user_last_name}" if log.user_email else "Unknown User",
+            old_role=old_role_info[2] if len(old_role_info) > 2 else "Unknown",
+            new_role=new_role_info[2] if len(new_role_info) > 2 else "Unknown",
+            changed_by=f"{log.changer_first_name} {log.changer_last_name}" if log.changer_email else "Unknown",
+            changer_email=log.changer_email if log.changer_email else "Unknown",
+            created_at=log.created_at
+        )
+        role_change_logs.append(role_change_log)
     
     return role_change_logs
 
@@ -606,23 +802,7 @@ async def get_user_logs(
     """
     logs = await UserLogsDAO.get_user_logs(user_id, limit=limit, offset=offset)
     
-    log_responses = []
-    for log in logs:
-        log_response = SUserLogResponse(
-            id=log.id,
-            user_id=log.user_id,
-            changed_by=log.changed_by,
-            action_type=log.action_type,
-            old_value=log.old_value,
-            new_value=log.new_value,
-            description=log.description,
-            created_at=log.created_at,
-            user_email=log.user.user_email if log.user else None,
-            changer_email=log.changer.user_email if log.changer else None,
-            user_name=f"{log.user.first_name} {log.user.last_name}" if log.user else None,
-            changer_name=f"{log.changer.first_name} {log.changer.last_name}" if log.changer else None
-        )
-        log_responses.append(log_response)
+    log_responses = [log_row_to_response(log) for log in logs]
     
     return SUserLogsList(logs=log_responses, total=len(log_responses))
 
@@ -636,12 +816,13 @@ async def get_available_roles(
     Исключает роль суперадминистратора.
     """
     roles = await RolesDAO.get_available_roles(exclude_super_admin=True)
+    counts = await role_counts.get()
     return [
         {
             "id": role.id,
             "name": role.role_name,
             "description": role.role_description,
-            "user_count": role.count_users
+            "user_count": counts.get(role.id, 0)
         }
         for role in roles
     ]
@@ -707,30 +888,28 @@ async def update_user_profile(
     Обновление имени, фамилии и ника пользователя
     """
     try:
-        # Проверяем доступность никнейма
-        if profile_data.user_nick != current_user.user_nick:
-            nick_available = await UsersDAO.is_nickname_available(
-                profile_data.user_nick, 
-                current_user.id
+        # Проверяем новый никнейм и дополнительный email одним запросом
+        conflicts = await UsersDAO.check_conflicts(
+            nick=profile_data.user_nick if profile_data.user_nick != current_user.user_nick else None,
+            secondary_email=profile_data.secondary_email,
+            exclude_id=current_user.id
+        )
+        if conflicts.nick:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Этот никнейм уже занят"
             )
-            if not nick_available:
-                raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail="Этот никнейм уже занят"
-                )
         # ПРОВЕРКА ДОПОЛНИТЕЛЬНОГО EMAIL
         if profile_data.secondary_email:
             # Проверяем, не используется ли email другим пользователем как основной
-            existing_user_by_main_email = await UsersDAO.find_by_email(profile_data.secondary_email)
-            if existing_user_by_main_email and existing_user_by_main_email.id != current_user.id:
+            if conflicts.secondary_email == "used_as_primary":
                 raise HTTPException(
                     status_code=status.HTTP_409_CONFLICT,
                     detail="Этот email уже используется!"
                 )
             
             # Проверяем, не используется ли email другим пользователем как дополнительный
-            existing_user_by_secondary = await UsersDAO.find_by_secondary_email(profile_data.secondary_email)
-            if existing_user_by_secondary and existing_user_by_secondary.id != current_user.id:
+            if conflicts.secondary_email == "used_as_secondary":
                 raise HTTPException(
                     status_code=status.HTTP_409_CONFLICT,
                     detail="Этот email уже используется!!"
@@ -773,7 +952,7 @@ async def update_user_profile(
             )
 
         # Логируем изменение
-        await UserLogsDAO.create_log(
+        audit_log.write(
             user_id=current_user.id,
             action_type='profile_update',
             old_value=json.dumps({
@@ -817,20 +996,16 @@ async def check_secondary_email_availability(
         if email == current_user.user_email:
             return {"available": False, "reason": "same_as_primary"}
         
-        # Проверяем, не используется ли email как основной у любого пользователя
-        existing_user_by_main_email = await UsersDAO.find_by_email(email)
-        if existing_user_by_main_email:
-            return {"available": False, "reason": "used_as_primary"}
-        
-        # Проверяем, не используется ли email как дополнительный у другого пользователя
-        existing_user_by_secondary = await UsersDAO.find_by_secondary_email(email)
-        if existing_user_by_secondary and existing_user_by_secondary.id != current_user.id:
-            return {"available": False, "reason": "used_as_secondary"}
-        
-        # Если текущий пользователь уже использует этот email как дополнительный - разрешаем
-        if existing_user_by_secondary and existing_user_by_secondary.id == current_user.id:
+        # Точно не занятый email (фильтр в памяти) не проверяется в БД
+        if not taken_values.might_be_taken_email(email):
             return {"available": True}
         
+        # Проверяем, не используется ли email как основной или дополнительный у других
+        # пользователей (свой дополнительный email текущему пользователю разрешен)
+        conflicts = await UsersDAO.check_conflicts(secondary_email=email, exclude_id=current_user.id)
+        if conflicts.secondary_email:
+            return {"available": False, "reason": conflicts.secondary_email}
+        
         return {"available": True}
         
     except Exception as e:
@@ -840,22 +1015,25 @@ async def check_secondary_email_availability(
 @router.put("/change-password/", summary="Сменить пароль")
 async def change_password(
     password_data: SUserChangePassword,
+    response: Response,
     current_user: User = Depends(get_current_user)
 ):
     """
     Смена пароля пользователя
     """
-    from app.users.auth import verify_password, get_password_hash
-    
     # Проверяем текущий пароль
-    if not verify_password(password_data.current_password, current_user.user_pass):
+    if not await verify_password_async(password_data.current_password, current_user.user_pass):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Неверный текущий пароль"
         )
     
+    # Остальные сессии выходят после истечения access-токена. Отзыв - до смены пароля:
+    # если его не сохранить, пароль не меняется (503)
+    await revoke_refresh_tokens(current_user.id)
+
     # Хешируем новый пароль
-    new_hashed_password = get_password_hash(password_data.new_password)
+    new_hashed_password = await get_password_hash_async(password_data.new_password)
     
     # Обновляем пароль
     success = await UsersDAO.change_password(current_user.id, new_hashed_password)
@@ -867,7 +1045,7 @@ async def change_password(
         )
     
     # Логируем смену пароля
-    await UserLogsDAO.create_log(
+    audit_log.write(
         user_id=current_user.id,
         action_type='password_change',
         old_value='***',
@@ -875,6 +1053,9 @@ async def change_password(
         description='Пароль изменен',
         changed_by=current_user.id
     )
+
+    # Текущей сессии выдаем новые токены (refresh-токены отозваны до смены пароля)
+    await set_auth_cookies(response, current_user.id, current_user.role_id)
     
     return {"message": "Пароль успешно изменен"}
 
@@ -932,7 +1113,7 @@ async def add_ip_address(
     )
     
     # Логируем добавление IP
-    await UserLogsDAO.create_log(
+    audit_log.write(
         user_id=current_user.id,
         action_type='ip_added',
         old_value=None,
@@ -976,7 +1157,7 @@ async def remove_ip_address(
         )
     
     # Логируем удаление IP
-    await UserLogsDAO.create_log(
+    audit_log.write(
         user_id=current_user.id,
         action_type='ip_removed',
         old_value=ip_data.ip_address,
@@ -1014,18 +1195,15 @@ async def add_multiple_ips(
                 detail=f"Неверный формат IP адреса: {ip_item.ip_address}"
             )
     
-    # Добавляем IP адреса
-    added_ips = []
-    for ip_item in ip_data.ip_addresses:
-        ip_record = await UserAllowedIPsDAO.add_ip_for_user(
-            current_user.id,
-            ip_item.ip_address,
-            ip_item.description
-        )
-        added_ips.append(ip_record)
+    # Добавляем IP адреса одним запросом
+    added_ips = await UserAllowedIPsDAO.add_multiple_ips(
+        current_user.id,
+        [ip_item.ip_address for ip_item in ip_data.ip_addresses],
+        [ip_item.description for ip_item in ip_data.ip_addresses]
+    )
     
     # Логируем добавление IP
-    await UserLogsDAO.create_log(
+    audit_log.write(
         user_id=current_user.id,
         action_type='ips_batch_added',
         old_value=None,
@@ -1142,6 +1320,7 @@ async def disable_ip_restrictions(
     """
     Отключение ограничений по IP
     """
+    old_ips = await UserAllowedIPsDAO.get_user_allowed_ips_list(current_user.id)
     success = await UsersDAO.update_allowed_ips(current_user.id, [])
     
     if not success:
@@ -1151,10 +1330,10 @@ async def disable_ip_restrictions(
         )
     
     # Логируем отключение ограничений
-    await UserLogsDAO.create_log(
+    audit_log.write(
         user_id=current_user.id,
         action_type='ip_restrictions_disable',
-        old_value=current_user.allowed_ips or '[]',
+        old_value=json.dumps(old_ips, ensure_ascii=False),
         new_value='[]',
         description='Ограничения по IP отключены',
         changed_by=current_user.id
@@ -1180,7 +1359,7 @@ async def cleanup_old_logs(
         deleted_count = await LogCleaner.cleanup_old_logs(days_to_keep)
         
         # Логируем действие администратора
-        await UserLogsDAO.create_log(
+        audit_log.write(
             user_id=current_user.id,
             action_type='logs_cleanup',
             old_value=None,
@@ -1238,7 +1417,7 @@ async def start_background_cleanup(
     
     asyncio.create_task(background_tasks.start_cleanup_task())
     
-    await UserLogsDAO.create_log(
+    audit_log.write(
         user_id=current_user.id,
         action_type='background_cleanup_start',
         old_value="stopped",
@@ -1264,7 +1443,7 @@ async def stop_background_cleanup(
     
     background_tasks.stop_cleanup_task()
     
-    await UserLogsDAO.create_log(
+    audit_log.write(
         user_id=current_user.id,
         action_type='background_cleanup_stop',
         old_value="started",
@@ -1302,7 +1481,7 @@ async def cleanup_logs_now(
             log_cleanup.cleanup_days = original_days
         
         # Логируем действие администратора
-        await UserLogsDAO.create_log(
+        audit_log.write(
             user_id=current_user.id,
             action_type='manual_logs_cleanup',
             old_value=None,
@@ -1359,7 +1538,7 @@ async def start_background_cleanup(
     asyncio.create_task(log_cleanup.start_periodic_cleanup())
     
     # Логируем действие
-    await UserLogsDAO.create_log(
+    audit_log.write(
         user_id=current_user.id,
         action_type='background_cleanup_start',
         old_value="stopped",
@@ -1388,7 +1567,7 @@ async def stop_background_cleanup(
     log_cleanup.stop()
     
     # Логируем действие
-    await UserLogsDAO.create_log(
+    audit_log.write(
         user_id=current_user.id,
         action_type='background_cleanup_stop',
         old_value="started",
@@ -1438,7 +1617,7 @@ async def update_cleanup_settings(
     }
     
     # Логируем изменение настроек
-    await UserLogsDAO.create_log(
+    audit_log.write(
         user_id=current_user.id,
         action_type='cleanup_settings_update',
         old_value=json.dumps(old_settings),
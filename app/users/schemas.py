@@ -67,6 +67,12 @@ class SUserListResponse(BaseModel):
     users: list[SUserResponse]
     total: int
 
+# Страница поиска пользователей (keyset пагинация)
+class SUsersSearchPage(BaseModel):
+    users: list[SUserResponse]
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы (None - страница последняя)")
+    has_more: bool
+
 class SUserRegister(BaseModel):
     user_phone: str = Field(..., description="Номер телефона в международном формате, начинающийся с '+'")
     user_email: EmailStr = Field(..., description="Электронная почта пользователя")
@@ -190,6 +196,22 @@ class SUserUpdateRoleByEmail(BaseModel):
     user_email: EmailStr = Field(..., description="Email пользователя")
     new_role_id: int = Field(..., ge=1, description="Новый ID роли пользователя")
 
+class SUsersBulkUpdateRole(BaseModel):
+    user_ids: List[int] = Field(..., min_length=1, max_length=500, description="ID пользователей")
+    new_role_id: int = Field(..., ge=1, description="Новый ID роли пользователей")
+
+class SUserRoleChange(BaseModel):
+    user_id: int
+    old_role_id: Optional[int]
+
+class SUsersBulkUpdateRoleResponse(BaseModel):
+    message: str
+    new_role_id: int
+    role_name: str
+    changed: List[SUserRoleChange] = Field(default_factory=list, description="Роль изменена")
+    unchanged: List[int] = Field(default_factory=list, description="Роль уже была назначена")
+    skipped: List[int] = Field(default_factory=list, description="Не найдены, суперадминистраторы или текущий пользователь")
+
 class SUserRoleInfo(BaseModel):
     id: int
     user_email: str
@@ -228,6 +250,11 @@ class SUserLogsList(BaseModel):
     logs: list[SUserLogResponse]
     total: int
 
+class SUserLogsCursorPage(BaseModel):
+    logs: list[SUserLogResponse]
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы (None - страница последняя)")
+    has_more: bool
+
 class SRoleChangeLog(BaseModel):
     id: int
     user_id: int
@@ -327,14 +354,14 @@ class SUserProfileResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 class SUserAllowedIPBase(BaseModel):
-    ip_address: str = Field(..., description="IP адрес")
+    ip_address: str = Field(..., description="IP адрес или подсеть CIDR (например, 10.0.0.0/24)")
     description: Optional[str] = Field(None, description="Описание IP адреса")
 
     @field_validator("ip_address")
     def validate_ip_address(cls, value):
         import ipaddress
         try:
-            ipaddress.ip_address(value)
+            ipaddress.ip_network(value, strict=False)
             return value
         except ValueError:
             raise ValueError(f'Неверный формат IP адреса: {value}')
@@ -0,0 +1,141 @@
+# app/users/snapshot.py
+"""
+Кэш авторизованных пользователей для get_current_user/get_optional_user.
+
+Вместо ORM-объекта User зависимости возвращают UserSnapshot - неизменяемый
+снимок колонок пользователя и его роли (__slots__, без сессии и ленивых
+связей). Один снимок безопасно отдается всем запросам воркера в течение
+USER_CACHE_TTL секунд, поэтому самый частый запрос системы (пользователь
+по id с ролью) выполняется не чаще раза в USER_CACHE_TTL на пользователя.
+
+Снимок сбрасывается при любой записи в users через BaseDAO (update_user_profile,
+change_password, update_user_role, delete_user_by_id и т.д. вызывают
+invalidate_model), в том числе на остальных воркерах через pub/sub кэша DAO.
+При CACHE_ENABLED=false остальные воркеры увидят изменения через USER_CACHE_TTL.
+"""
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.config import settings
+from app.dao.cache import ANY_ROW, dao_cache
+from app.dao.replica import primary_reads
+from app.roles.models import RoleTypes
+from app.users.dao import UsersDAO
+
+
+USER_FIELDS = (
+    "id", "user_phone", "first_name", "last_name", "user_nick", "user_pass", "user_email",
+    "two_fa_auth", "email_verified", "phone_verified", "user_status", "special_notes",
+    "role_id", "tg_chat_id", "last_login", "secondary_email", "security_settings",
+    "created_at", "updated_at",
+)
+ROLE_FIELDS = ("id", "role_name", "role_description")
+
+
+class _Frozen:
+    """Запрещает изменение атрибутов после создания"""
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values.get(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} неизменяем")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} неизменяем")
+
+
+class RoleSnapshot(_Frozen):
+    __slots__ = ROLE_FIELDS
+
+    def __repr__(self):
+        return f"RoleSnapshot(id={self.id}, role_name={self.role_name!r})"
+
+
+class UserSnapshot(_Frozen):
+    """Снимок пользователя: атрибуты и проверки ролей как у User"""
+    __slots__ = USER_FIELDS + ("role",)
+
+    @classmethod
+    def from_user(cls, user) -> "UserSnapshot":
+        role = user.role
+        return cls(
+            role=RoleSnapshot(**{name: getattr(role, name) for name in ROLE_FIELDS}) if role else None,
+            **{name: getattr(user, name) for name in USER_FIELDS}
+        )
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role_id in (RoleTypes.SUPER_ADMIN, RoleTypes.ADMIN)
+
+    @property
+    def is_super_admin(self) -> bool:
+        return self.role_id == RoleTypes.SUPER_ADMIN
+
+    @property
+    def is_moderator(self) -> bool:
+        return self.role_id in (RoleTypes.SUPER_ADMIN, RoleTypes.ADMIN, RoleTypes.MODERATOR)
+
+    def to_dict(self) -> dict:
+        data = {name: getattr(self, name) for name in USER_FIELDS if name != "user_pass"}
+        data["user_nick"] = self.first_name  # как в User.to_dict
+        return data
+
+    def __repr__(self):
+        return f"UserSnapshot(id={self.id}, first_name={self.first_name!r}, last_name={self.last_name!r})"
+
+
+class UserSnapshotCache:
+    """TTL/LRU кэш снимков пользователей по id в памяти воркера"""
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: OrderedDict[int, tuple[float, UserSnapshot]] = OrderedDict()
+        # Увеличивается при каждом сбросе: снимок, загруженный до сброса, не сохраняется
+        self._generation = 0
+
+    async def get(self, user_id: int) -> Optional[UserSnapshot]:
+        """Снимок пользователя из кэша или из БД; None - пользователь не найден"""
+        entry = self._data.get(user_id)
+        if entry is not None:
+            if entry[0] >= time.monotonic():
+                self._data.move_to_end(user_id)
+                return entry[1]
+            del self._data[user_id]
+
+        generation = self._generation
+        # Из основной БД: снимок кэшируется и по нему выпускаются токены
+        with primary_reads():
+            user = await UsersDAO.find_one_or_none_by_id(user_id)
+        if user is None:
+            return None
+        snapshot = UserSnapshot.from_user(user)
+        if self.ttl > 0 and generation == self._generation:
+            self._data[user_id] = (time.monotonic() + self.ttl, snapshot)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id: Optional[int] = None):
+        """Сбрасывает снимок пользователя (user_id=None - все снимки)"""
+        self._generation += 1
+        if user_id is None:
+            self._data.clear()
+        else:
+            self._data.pop(user_id, None)
+
+    def on_dao_invalidate(self, table: Optional[str], pk: Optional[str]):
+        """Обработчик сбросов кэша DAO (см. DAOCache.on_invalidate)"""
+        if table is None:
+            self.invalidate()
+        elif table == UsersDAO.model.__tablename__ and pk != ANY_ROW:
+            # ANY_ROW - добавление новых строк, существующие снимки не меняются
+            self.invalidate(int(pk) if pk is not None and pk.isdigit() else None)
+
+
+user_snapshots = UserSnapshotCache(settings.USER_CACHE_TTL, settings.USER_CACHE_MAXSIZE)
+dao_cache.on_invalidate(user_snapshots.on_dao_invalidate)
@@ -0,0 +1,136 @@
+# app/users/token_versions.py
+"""
+Версии токенов пользователей для проверки ролей без запросов к БД.
+
+В access-токен при выпуске записывается текущая версия пользователя (claim
+"ver") вместе с ролью. Смена роли или удаление пользователя увеличивают версию
+(bump), и claims уже выданных токенов перестают считаться актуальными:
+зависимости проверки ролей берут роль из БД до выпуска нового токена.
+
+Отдельная версия сессий (session_versions) записывается в refresh-токен и
+увеличивается при выходе и смене пароля: выданные ранее refresh-токены
+перестают выпускать новые access-токены (см. app/users/tokens.py).
+
+Версии хранятся в Redis ({prefix}:{user_id}, INCR) и кэшируются в памяти
+воркера на TOKEN_VERSION_CACHE_TTL секунд. Запись пользователя через BaseDAO
+(и сам bump) сбрасывает кэш на всех воркерах через pub/sub кэша DAO
+(работает и при CACHE_ENABLED=false).
+Пока Redis недоступен, версия неизвестна (None): роль всегда проверяется по БД,
+а refresh-токены не принимаются. bump, который не удалось сохранить в Redis,
+бросает TokenVersionUnavailableException (503): смена роли, выход и смена
+пароля не считаются выполненными, пока версия не увеличена.
+"""
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from redis.exceptions import RedisError
+
+from app.config import settings
+from app.core.config import settings as core_settings
+from app.core.redis import redis_client, redis_failed
+from app.dao.cache import ANY_ROW, dao_cache
+from app.exceptions import TokenVersionUnavailableException
+from app.logger import app_logger as logger
+from app.users.models import User
+
+
+KEY_PREFIX = "token_version"
+SESSION_KEY_PREFIX = "session_version"
+# Версия живет дольше любого токена, выпущенного до ее увеличения
+VERSION_KEY_TTL = core_settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400 + core_settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+
+class TokenVersionStore:
+    """Версии токенов по user_id: Redis и TTL/LRU кэш в памяти воркера"""
+
+    def __init__(self, ttl: float, maxsize: int, key_prefix: str = KEY_PREFIX):
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self.maxsize = maxsize
+        self._data: OrderedDict[int, tuple[float, int]] = OrderedDict()
+        # Увеличивается при сбросе: версия, прочитанная до сброса, не сохраняется
+        self._generation = 0
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.key_prefix}:{user_id}"
+
+    def _remember(self, user_id: int, version: int):
+        if self.ttl <= 0:
+            return
+        self._data[user_id] = (time.monotonic() + self.ttl, version)
+        self._data.move_to_end(user_id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def current(self, user_id: int) -> Optional[int]:
+        """Текущая версия; None - неизвестна (Redis недоступен)"""
+        entry = self._data.get(user_id)
+        if entry is not None:
+            if entry[0] >= time.monotonic():
+                self._data.move_to_end(user_id)
+                return entry[1]
+            del self._data[user_id]
+
+        client = redis_client()
+        if client is None:
+            return None
+        generation = self._generation
+        try:
+            value = await client.get(self._key(user_id))
+        except (RedisError, OSError) as e:
+            logger.warning(f"Версии токенов: Redis недоступен: {e}")
+            redis_failed()
+            return None
+        version = int(value or 0)
+        if generation == self._generation:
+            self._remember(user_id, version)
+        return version
+
+    async def bump(self, *user_ids: int):
+        """
+        Делает claims выданных пользователям токенов неактуальными; остальные
+        воркеры сбрасывают кэш версии через pub/sub кэша DAO.
+        TokenVersionUnavailableException - версию не удалось сохранить в Redis
+        """
+        self._generation += 1
+        for user_id in user_ids:
+            self._data.pop(user_id, None)
+        client = redis_client()
+        if client is None:
+            logger.error(f"Не удалось увеличить версию токенов пользователей {list(user_ids)}: Redis недоступен")
+            raise TokenVersionUnavailableException
+        try:
+            async with client.pipeline(transaction=True) as pipe:
+                for user_id in user_ids:
+                    pipe.incr(self._key(user_id))
+                    pipe.expire(self._key(user_id), VERSION_KEY_TTL)
+                await pipe.execute()
+        except (RedisError, OSError) as e:
+            logger.error(f"Не удалось увеличить версию токенов пользователей {list(user_ids)}: {e}")
+            redis_failed()
+            raise TokenVersionUnavailableException from e
+        # Остальные воркеры перечитают версию (см. on_dao_invalidate)
+        for user_id in user_ids:
+            await dao_cache.invalidate(User.__tablename__, user_id)
+
+    def invalidate(self, user_id: Optional[int] = None):
+        self._generation += 1
+        if user_id is None:
+            self._data.clear()
+        else:
+            self._data.pop(user_id, None)
+
+    def on_dao_invalidate(self, table: Optional[str], pk: Optional[str]):
+        """Обработчик сбросов кэша DAO (см. DAOCache.on_invalidate)"""
+        if table is None:
+            self.invalidate()
+        elif table == User.__tablename__ and pk != ANY_ROW:
+            self.invalidate(int(pk) if pk is not None and pk.isdigit() else None)
+
+
+token_versions = TokenVersionStore(settings.TOKEN_VERSION_CACHE_TTL, settings.USER_CACHE_MAXSIZE)
+dao_cache.on_invalidate(token_versions.on_dao_invalidate)
+# Версии сессий для отзыва refresh-токенов (выход, смена пароля)
+session_versions = TokenVersionStore(settings.TOKEN_VERSION_CACHE_TTL, settings.USER_CACHE_MAXSIZE, SESSION_KEY_PREFIX)
+dao_cache.on_invalidate(session_versions.on_dao_invalidate)
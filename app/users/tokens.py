@@ -0,0 +1,388 @@
+# app/users/tokens.py
+"""
+Выпуск и проверка токенов (JWT) для зависимостей авторизации.
+
+decode_access_token(token) возвращает claims проверенного токена или бросает
+JWTError (ExpiredSignatureError для истекшего), как jose.jwt.decode.
+
+Ускорение:
+  - токены HS256/HS384/HS512 проверяются напрямую через hmac стандартной
+    библиотеки (подпись, заголовок, exp/nbf/iat/sub); токены с другими
+    алгоритмами или claims (aud, iss, jti, at_hash) проверяет python-jose;
+  - проверенные токены запоминаются в LRU (JWT_CACHE_MAXSIZE) по sha256 токена
+    до истечения exp, поэтому токен браузера проверяется один раз,
+    а не на каждом запросе. Токены без exp не запоминаются.
+
+При входе выдаются два токена (set_auth_cookies):
+  - access (cookie users_access_token, ACCESS_TOKEN_EXPIRE_MINUTES) с ролью
+    (rid), маской прав (perm, см. Permission) и версией токенов пользователя
+    (ver, см. app/users/token_versions.py) - по ним роль проверяется без БД;
+  - refresh (cookie users_refresh_token, REFRESH_TOKEN_EXPIRE_DAYS) - только
+    для выпуска нового access-токена: POST /users/refresh/ или прозрачно
+    в TokenRefreshMiddleware, когда access-токен истек. Содержит версию сессий
+    пользователя (ver, см. session_versions): выход и смена пароля увеличивают
+    ее, и выданные ранее refresh-токены отклоняются. Пока версия неизвестна
+    (Redis недоступен), refresh-токены не принимаются.
+
+Claims возвращаются только для чтения (MappingProxyType): один объект
+разделяется всеми запросами с тем же токеном.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+from fastapi import Request, Response
+from jose import jwt
+from jose.exceptions import ExpiredSignatureError, JWTError
+
+from app.config import get_auth_data, settings
+from app.core.config import settings as core_settings
+from app.exceptions import TokenVersionUnavailableException
+from app.roles.models import Permission, role_permissions
+from app.users.snapshot import user_snapshots
+from app.users.token_versions import session_versions, token_versions
+
+
+HMAC_ALGORITHMS = {"HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512}
+# Зарегистрированные claims, которые проверяет только python-jose
+JOSE_ONLY_CLAIMS = frozenset({"aud", "iss", "jti", "at_hash"})
+
+ACCESS_COOKIE = "users_access_token"
+REFRESH_COOKIE = "users_refresh_token"
+ACCESS_TOKEN_TYPE = "access"
+REFRESH_TOKEN_TYPE = "refresh"
+ACCESS_TOKEN_LIFETIME = core_settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+REFRESH_TOKEN_LIFETIME = core_settings.REFRESH_TOKEN_EXPIRE_DAYS * 86400
+
+
+class VerifiedTokenCache:
+    """LRU проверенных токенов: sha256(token) -> (claims, момент истечения)"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: OrderedDict[bytes, tuple[Mapping, float]] = OrderedDict()
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, key: bytes) -> Optional[Mapping]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        claims, expires_at = entry
+        if expires_at <= time.time():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return claims
+
+    def set(self, key: bytes, claims: Mapping):
+        exp = claims.get("exp")
+        if self.maxsize <= 0 or not isinstance(exp, (int, float)):
+            return
+        self._data[key] = (claims, exp)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+
+verified_tokens = VerifiedTokenCache(settings.JWT_CACHE_MAXSIZE)
+
+
+def _b64decode(segment: str) -> bytes:
+    # validate=True: посторонние символы - ошибка, а не пропуск
+    return base64.b64decode(segment + "=" * (-len(segment) % 4), altchars=b"-_", validate=True)
+
+
+def _decode_hmac(token: str, secret_key: str, algorithm: str) -> Optional[dict]:
+    """
+    Проверяет токен HMAC-алгоритма без python-jose.
+    None - токен нужно проверить через python-jose (нестандартные claims).
+    """
+    try:
+        header_segment, payload_segment, signature_segment = token.split(".")
+        header = json.loads(_b64decode(header_segment))
+        signature = _b64decode(signature_segment)
+    except (ValueError, TypeError, UnicodeError):
+        raise JWTError("Invalid token")
+    if not isinstance(header, dict) or header.get("alg") != algorithm:
+        raise JWTError("The specified alg value is not allowed")
+
+    signing_input = f"{header_segment}.{payload_segment}".encode()
+    expected = hmac.new(secret_key.encode(), signing_input, HMAC_ALGORITHMS[algorithm]).digest()
+    if not hmac.compare_digest(expected, signature):
+        raise JWTError("Signature verification failed.")
+
+    try:
+        claims = json.loads(_b64decode(payload_segment))
+    except (ValueError, TypeError):
+        raise JWTError("Invalid payload string")
+    if not isinstance(claims, dict):
+        raise JWTError("Invalid payload string: must be a json object")
+    if not JOSE_ONLY_CLAIMS.isdisjoint(claims):
+        return None
+
+    now = time.time()
+    for name in ("exp", "nbf", "iat"):
+        if name in claims and (isinstance(claims[name], bool) or not isinstance(claims[name], int)):
+            raise JWTError(f"{name} claim must be an integer.")
+    if "nbf" in claims and claims["nbf"] > now:
+        raise JWTError("The token is not yet valid (nbf)")
+    if "exp" in claims and claims["exp"] < now:
+        raise ExpiredSignatureError("Signature has expired.")
+    if "sub" in claims and not isinstance(claims["sub"], str):
+        raise JWTError("Subject must be a string.")
+    return claims
+
+
+def _decode(token: str) -> Mapping:
+    key = verified_tokens.key(token)
+    claims = verified_tokens.get(key)
+    if claims is not None:
+        return claims
+
+    auth_data = get_auth_data()
+    algorithm = auth_data['algorithm']
+    claims = None
+    if algorithm in HMAC_ALGORITHMS:
+        claims = _decode_hmac(token, auth_data['secret_key'], algorithm)
+    if claims is None:
+        claims = jwt.decode(token, auth_data['secret_key'], algorithms=[algorithm])
+
+    claims = MappingProxyType(claims)
+    verified_tokens.set(key, claims)
+    return claims
+
+
+def decode_access_token(token: str) -> Mapping:
+    """Claims проверенного токена (только для чтения); JWTError - токен недействителен"""
+    claims = _decode(token)
+    # Токены, выданные до появления refresh-токенов, не содержат typ
+    if claims.get("typ", ACCESS_TOKEN_TYPE) != ACCESS_TOKEN_TYPE:
+        raise JWTError("Invalid token type")
+    return claims
+
+
+def decode_refresh_token(token: str) -> Mapping:
+    """Claims refresh-токена без проверки отзыва (см. check_refresh_token)"""
+    claims = _decode(token)
+    if claims.get("typ") != REFRESH_TOKEN_TYPE:
+        raise JWTError("Invalid token type")
+    return claims
+
+
+# --- Выпуск токенов ---
+
+def _encode(claims: dict) -> str:
+    auth_data = get_auth_data()
+    return jwt.encode(claims, auth_data['secret_key'], algorithm=auth_data['algorithm'])
+
+
+async def issue_access_token(user_id: int, role_id: Optional[int]) -> str:
+    claims = {
+        "sub": str(user_id),
+        "typ": ACCESS_TOKEN_TYPE,
+        "rid": role_id,
+        "perm": int(role_permissions(role_id)),
+        "exp": int(time.time()) + ACCESS_TOKEN_LIFETIME,
+    }
+    # Без версии (Redis недоступен) роль из токена проверяется по БД
+    version = await token_versions.current(user_id)
+    if version is not None:
+        claims["ver"] = version
+    return _encode(claims)
+
+
+async def issue_refresh_token(user_id: int) -> str:
+    claims = {
+        "sub": str(user_id),
+        "typ": REFRESH_TOKEN_TYPE,
+        "exp": int(time.time()) + REFRESH_TOKEN_LIFETIME,
+    }
+    version = await session_versions.current(user_id)
+    if version is not None:
+        claims["ver"] = version
+    return _encode(claims)
+
+
+async def check_refresh_token(token: str) -> int:
+    """
+    user_id действующего refresh-токена; JWTError - токен недействителен или отозван,
+    TokenVersionUnavailableException - отзыв нельзя проверить (Redis недоступен).
+    Токен без версии считается выданным при версии 0.
+    """
+    claims = decode_refresh_token(token)
+    try:
+        user_id = int(claims["sub"])
+    except (KeyError, ValueError, TypeError):
+        raise JWTError("Invalid subject")
+    version = await session_versions.current(user_id)
+    if version is None:
+        raise TokenVersionUnavailableException
+    if claims.get("ver", 0) != version:
+        raise JWTError("Token revoked")
+    return user_id
+
+
+async def revoke_refresh_tokens(user_id: int):
+    """
+    Отзывает все выданные пользователю refresh-токены (выход, смена пароля);
+    TokenVersionUnavailableException - отзыв не сохранен
+    """
+    await session_versions.bump(user_id)
+
+
+def set_access_cookie(response: Response, access_token: str):
+    response.set_cookie(key=ACCESS_COOKIE, value=access_token, httponly=True,
+                        max_age=ACCESS_TOKEN_LIFETIME, path="/")
+
+
+async def set_auth_cookies(response: Response, user_id: int, role_id: Optional[int]):
+    """Выдает access- и refresh-токены в cookies (вход, POST /users/refresh/)"""
+    set_access_cookie(response, await issue_access_token(user_id, role_id))
+    response.set_cookie(key=REFRESH_COOKIE, value=await issue_refresh_token(user_id), httponly=True,
+                        max_age=REFRESH_TOKEN_LIFETIME, path="/")
+
+
+def cookie_user_id(cookies: Mapping[str, str]) -> Optional[int]:
+    """user_id из refresh- или access-токена в cookies (для выхода; отзыв не проверяется)"""
+    for name, decode in ((REFRESH_COOKIE, decode_refresh_token), (ACCESS_COOKIE, decode_access_token)):
+        token = cookies.get(name)
+        if not token:
+            continue
+        try:
+            return int(decode(token)["sub"])
+        except (JWTError, KeyError, ValueError, TypeError):
+            continue
+    return None
+
+
+def clear_auth_cookies(response: Response):
+    response.delete_cookie(key=ACCESS_COOKIE, path="/")
+    response.delete_cookie(key=REFRESH_COOKIE, path="/")
+
+
+async def refresh_access_token(refresh_token: str) -> Optional[str]:
+    """Новый access-токен по refresh-токену с текущей ролью; None - refresh-токен не принят"""
+    try:
+        user_id = await check_refresh_token(refresh_token)
+    except (JWTError, TokenVersionUnavailableException):
+        return None
+    user = await user_snapshots.get(user_id)
+    if user is None:
+        return None
+    return await issue_access_token(user.id, user.role_id)
+
+
+# --- Роль из токена ---
+
+class TokenPrincipal:
+    """Пользователь по claims access-токена: id, роль и права без загрузки из БД"""
+    __slots__ = ("id", "role_id", "permissions", "user")
+
+    def __init__(self, user_id: int, role_id: Optional[int], permissions: Permission, user=None):
+        self.id = user_id
+        self.role_id = role_id
+        self.permissions = permissions
+        # Снимок пользователя, если он уже загружался при проверке роли
+        self.user = user
+
+    def has(self, permission: Permission) -> bool:
+        return permission in self.permissions
+
+    @property
+    def is_admin(self) -> bool:
+        return self.has(Permission.ADMIN)
+
+    @property
+    def is_super_admin(self) -> bool:
+        return self.has(Permission.SUPER_ADMIN)
+
+    @property
+    def is_moderator(self) -> bool:
+        return self.has(Permission.MODERATE)
+
+    def __repr__(self):
+        return f"TokenPrincipal(id={self.id}, role_id={self.role_id})"
+
+
+async def resolve_principal(claims: Mapping) -> Optional[TokenPrincipal]:
+    """
+    Роль и права из claims, если версия токенов пользователя не менялась после
+    выпуска токена; иначе (или для токена без версии) - по снимку пользователя.
+    None - пользователь не найден.
+    """
+    user_id = int(claims["sub"])
+    version = claims.get("ver")
+    if version is not None and "rid" in claims and await token_versions.current(user_id) == version:
+        return TokenPrincipal(user_id, claims["rid"], Permission(claims.get("perm", 0)))
+
+    user = await user_snapshots.get(user_id)
+    if user is None:
+        return None
+    return TokenPrincipal(user.id, user.role_id, role_permissions(user.role_id), user)
+
+
+# --- Прозрачное обновление access-токена ---
+
+def _access_token_valid(token: Optional[str]) -> bool:
+    if not token:
+        return False
+    try:
+        decode_access_token(token)
+    except JWTError:
+        return False
+    return True
+
+
+class TokenRefreshMiddleware:
+    """
+    Если access-токен отсутствует или истек, а refresh-токен действителен,
+    выпускает новый access-токен до обработки запроса: подставляет его в Cookie
+    запроса и добавляет Set-Cookie в ответ. Страницы и API продолжают работать
+    после истечения короткого access-токена без повторного входа.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        cookies = Request(scope).cookies
+        refresh_token = cookies.get(REFRESH_COOKIE)
+        if not refresh_token or _access_token_valid(cookies.get(ACCESS_COOKIE)):
+            await self.app(scope, receive, send)
+            return
+
+        access_token = await refresh_access_token(refresh_token)
+        if access_token is None:
+            await self.app(scope, receive, send)
+            return
+
+        cookies[ACCESS_COOKIE] = access_token
+        headers = [(name, value) for name, value in scope["headers"] if name != b"cookie"]
+        headers.append((b"cookie", "; ".join(f"{name}={value}" for name, value in cookies.items()).encode("latin-1")))
+        scope = dict(scope, headers=headers)
+
+        cookie_response = Response()
+        set_access_cookie(cookie_response, access_token)
+        set_cookie_headers = [header for header in cookie_response.raw_headers if header[0] == b"set-cookie"]
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + set_cookie_headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
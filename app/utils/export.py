@@ -0,0 +1,76 @@
+# app/utils/export.py
+"""
+Потоковая выгрузка строк (BaseDAO.stream) в NDJSON или CSV.
+Ответ формируется по мере чтения курсора, память не зависит от размера таблицы.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, AsyncIterator, Literal, Sequence
+
+from fastapi.responses import StreamingResponse
+
+
+ExportFormat = Literal["ndjson", "csv"]
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+# Количество строк, отправляемых клиенту одним фрагментом
+FLUSH_EVERY = 500
+
+
+def _plain(value: Any) -> Any:
+    """Значение колонки -> значение для JSON/CSV"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+
+async def ndjson_lines(rows: AsyncIterator) -> AsyncIterator[str]:
+    """Легкие строки (Row) -> NDJSON, по одному JSON-объекту в строке"""
+    buffer = []
+    async for row in rows:
+        buffer.append(json.dumps({field: _plain(value) for field, value in row._mapping.items()}, ensure_ascii=False))
+        if len(buffer) >= FLUSH_EVERY:
+            yield "\n".join(buffer) + "\n"
+            buffer = []
+    if buffer:
+        yield "\n".join(buffer) + "\n"
+
+
+async def csv_lines(rows: AsyncIterator, fields: Sequence[str]) -> AsyncIterator[str]:
+    """Легкие строки (Row) -> CSV с заголовком fields (выгрузка без строк - только заголовок)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    count = 0
+    async for row in rows:
+        writer.writerow([_plain(value) for value in row])
+        count += 1
+        if count % FLUSH_EVERY == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_response(
+    rows: AsyncIterator, fields: Sequence[str], export_format: str, filename: str
+) -> StreamingResponse:
+    """
+    StreamingResponse с выгрузкой rows (BaseDAO.stream с columns) в формате
+    export_format ("ndjson" или "csv"). fields - имена полей строк (заголовок CSV,
+    см. BaseDAO.column_names), filename - имя файла без расширения.
+    """
+    lines = csv_lines(rows, fields) if export_format == "csv" else ndjson_lines(rows)
+    return StreamingResponse(
+        lines,
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'}
+    )
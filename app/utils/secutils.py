@@ -3,7 +3,7 @@ import json
 from typing import List, Optional, Dict, Any
 from fastapi import Request
 from datetime import datetime, timezone
-from app.users.ip_dao import UserAllowedIPsDAO
+from app.users.ip_allowlist import allowlists
 
 class SecurityUtils:
     @staticmethod
@@ -20,19 +20,19 @@ class SecurityUtils:
     
     @staticmethod
     async def is_ip_allowed(user_id: int, client_ip: str) -> bool:
-        """Проверяет, разрешен ли IP адрес для пользователя"""
-        # Если у пользователя нет ограничений по IP, разрешаем доступ
-        user_ips = await UserAllowedIPsDAO.find_by_user_id(user_id, active_only=True)
-        if not user_ips:
-            return True
-        
-        return await UserAllowedIPsDAO.is_ip_allowed(user_id, client_ip)
+        """
+        Проверяет, разрешен ли IP адрес для пользователя (адреса и подсети CIDR).
+        Если у пользователя нет ограничений по IP, доступ разрешен.
+        Список пользователя кэшируется в памяти (см. app/users/ip_allowlist.py)
+        """
+        allowlist = await allowlists.get(user_id)
+        return allowlist.allows(client_ip)
     
     @staticmethod
     def validate_ip_address(ip: str) -> bool:
-        """Валидирует IP адрес"""
+        """Валидирует IP адрес или подсеть в нотации CIDR (IPv4/IPv6)"""
         try:
-            ipaddress.ip_address(ip)
+            ipaddress.ip_network(ip, strict=False)
             return True
         except ValueError:
             return False
@@ -0,0 +1,149 @@
+"""
+Микробенчмарк цепочки авторизации (get_current_user).
+
+Сравнивает накладные расходы на один запрос с cookie-токеном:
+  - "до": jose.jwt.decode + преобразования datetime + поиск пользователя в БД;
+  - "после": decode_access_token (LRU проверенных токенов, проверка HMAC без
+    python-jose) + снимок пользователя из кэша (app/users/snapshot.py).
+
+Часть 1 измеряет только проверку токена, часть 2 - зависимость целиком
+на SQLite в памяти (кэш DAO в Redis отключен, чтобы считать только L1/БД).
+
+Запуск из корня проекта:
+    python scripts/bench_auth.py
+"""
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings требует переменные окружения; для бенчмарка подключение к Postgres не нужно
+for _name in ("DB_HOST", "DB_NAME", "DB_USER", "DB_PASSWORD", "SECRET_KEY", "REDIS_URL",
+              "REDIS_PASSWORD", "REDIS_USER", "REDIS_USER_PASSWORD"):
+    os.environ.setdefault(_name, "bench")
+os.environ.setdefault("DB_PORT", "5432")
+os.environ.setdefault("REDIS_DB", "0")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from jose import jwt
+from jose.exceptions import JWTError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+import app.main  # noqa: F401  регистрирует все модели
+import app.dao.session as dao_session
+from app.config import get_auth_data
+from app.dao.cache import dao_cache
+from app.database import Base
+from app.roles.models import Role
+from app.users.auth import create_access_token
+from app.users.dao import UsersDAO
+from app.users.dependencies import get_current_user
+from app.users.models import User
+from app.users.snapshot import user_snapshots
+from app.users.tokens import _decode_hmac, decode_access_token, verified_tokens
+
+
+ITERATIONS = 20000
+DB_ITERATIONS = 3000
+
+
+def old_decode(token: str) -> dict:
+    auth_data = get_auth_data()
+    payload = jwt.decode(token, auth_data['secret_key'], algorithms=[auth_data['algorithm']])
+    expire_time = datetime.fromtimestamp(int(payload['exp']), tz=timezone.utc)
+    if expire_time < datetime.now(timezone.utc):
+        raise JWTError("expired")
+    return payload
+
+
+def new_decode_miss(token: str) -> dict:
+    verified_tokens.clear()
+    return decode_access_token(token)
+
+
+def new_decode_hit(token: str) -> dict:
+    return decode_access_token(token)
+
+
+async def old_current_user(token: str):
+    payload = old_decode(token)
+    return await UsersDAO.find_one_or_none_by_id(int(payload['sub']))
+
+
+def per_call_us(func, token: str, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(token)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def per_call_async_us(func, token: str, iterations: int) -> float:
+    await func(token)  # прогрев
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await func(token)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def check_compatibility(token: str):
+    """Быстрая проверка HMAC должна принимать и отклонять те же токены, что python-jose"""
+    auth_data = get_auth_data()
+    tampered = token[:-2] + ("AA" if not token.endswith("AA") else "BB")
+    expired = jwt.encode({"sub": "1", "exp": 1}, auth_data['secret_key'], algorithm=auth_data['algorithm'])
+    foreign = jwt.encode({"sub": "1", "exp": 2 ** 31}, "other-secret", algorithm=auth_data['algorithm'])
+    for name, candidate in (("valid", token), ("tampered", tampered), ("expired", expired), ("foreign key", foreign)):
+        results = []
+        for decode in (lambda t: jwt.decode(t, auth_data['secret_key'], algorithms=[auth_data['algorithm']]),
+                       lambda t: _decode_hmac(t, auth_data['secret_key'], auth_data['algorithm'])):
+            try:
+                results.append(("ok", decode(candidate)["sub"]))
+            except JWTError as e:
+                results.append(("error", type(e).__name__))
+        assert results[0] == results[1], (name, results)
+        print(f"  {name:<12} {results[0]}")
+
+
+def print_row(name: str, before: float, after: float):
+    print(f"{name:<26} {before:>10.1f} {after:>10.1f} {before / after:>8.1f}x")
+
+
+async def main():
+    token = create_access_token({"sub": "1"})
+
+    print("0. Совместимость с python-jose")
+    check_compatibility(token)
+
+    print(f"\n1. Проверка токена, мкс/вызов ({ITERATIONS} вызовов)")
+    print(f"{'':<26} {'до':>10} {'после':>10} {'':>9}")
+    before = per_call_us(old_decode, token, ITERATIONS)
+    print_row("decode (промах LRU)", before, per_call_us(new_decode_miss, token, ITERATIONS))
+    print_row("decode (попадание LRU)", before, per_call_us(new_decode_hit, token, ITERATIONS))
+
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    dao_session.async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    dao_cache.enabled = False
+    try:
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        async with dao_session.async_session_maker() as session:
+            session.add(Role(id=4, role_name="User"))
+            session.add(User(id=1, user_phone="+70000000000", user_email="bench@example.com",
+                             user_pass="x", first_name="Bench", last_name="User", role_id=4))
+            await session.commit()
+
+        print(f"\n2. get_current_user целиком на SQLite в памяти, мкс/вызов ({DB_ITERATIONS} вызовов)")
+        print(f"{'':<26} {'до':>10} {'после':>10} {'':>9}")
+        before = await per_call_async_us(old_current_user, token, DB_ITERATIONS)
+        after = await per_call_async_us(get_current_user, token, DB_ITERATIONS)
+        print_row("token + user", before, after)
+        user_snapshots.invalidate()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,127 @@
+"""
+Микробенчмарк реестра запросов (app/dao/statements.py).
+
+Сравнивает накладные расходы Python на один вызов для горячих путей
+авторизации (поиск пользователя по id и email) и списков тикетов:
+  - "до": select(...) строится заново при каждом вызове;
+  - "после": заранее построенный запрос из реестра с bindparam.
+
+Часть 1 измеряет только построение запроса и ключ кэша компиляции (то, что
+SQLAlchemy делает перед каждым выполнением). Часть 2 выполняет запросы
+целиком на SQLite в памяти, чтобы оценить долю выигрыша в полном вызове.
+
+Запуск из корня проекта:
+    python scripts/bench_statements.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings требует переменные окружения; для бенчмарка подключение к Postgres не нужно
+for _name in ("DB_HOST", "DB_NAME", "DB_USER", "DB_PASSWORD", "SECRET_KEY", "REDIS_URL",
+              "REDIS_PASSWORD", "REDIS_USER", "REDIS_USER_PASSWORD"):
+    os.environ.setdefault(_name, "bench")
+os.environ.setdefault("DB_PORT", "5432")
+os.environ.setdefault("REDIS_DB", "0")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+
+import app.main  # noqa: F401  регистрирует все модели
+from app.database import Base
+from app.dao.statements import statements
+from app.tickets.dao import TicketDAO
+from app.tickets.models import Ticket
+from app.users.models import User
+
+
+ITERATIONS = 20000
+DB_ITERATIONS = 3000
+
+
+def old_user_by_id():
+    return select(User).filter_by(id=1), {}
+
+
+def new_user_by_id():
+    return statements.get(("users", "by_id")), {"data_id": 1}
+
+
+def old_user_by_email():
+    return select(User).filter_by(user_email="bench@example.com"), {}
+
+
+def new_user_by_email():
+    return statements.get("users.by_email"), {"user_email": "bench@example.com"}
+
+
+def old_tickets_list():
+    query = select(*TicketDAO.list_columns).select_from(Ticket)
+    for target, onclause in TicketDAO.list_joins:
+        query = query.outerjoin(target, onclause)
+    query = query.where(Ticket.user_id == 1).order_by(desc(Ticket.updated_at)).offset(0).limit(25)
+    return query, {}
+
+
+def new_tickets_list():
+    return statements.get(("tickets.page", ("user_id",), "updated")), {"user_id": 1, "limit": 25, "offset": 0}
+
+
+CASES = [
+    ("auth: user by id", old_user_by_id, new_user_by_id),
+    ("auth: user by email", old_user_by_email, new_user_by_email),
+    ("tickets: list + filter", old_tickets_list, new_tickets_list),
+]
+
+
+def per_call_us(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        query, _params = func()
+        query._generate_cache_key()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def per_call_db_us(engine, func, iterations: int) -> float:
+    async with engine.connect() as connection:
+        query, params = func()
+        await connection.execute(query, params)  # первый вызов - компиляция
+        start = time.perf_counter()
+        for _ in range(iterations):
+            query, params = func()
+            await connection.execute(query, params)
+        return (time.perf_counter() - start) / iterations * 1e6
+
+
+def print_row(name: str, before: float, after: float):
+    print(f"{name:<26} {before:>10.1f} {after:>10.1f} {before / after:>8.1f}x")
+
+
+async def main():
+    print(f"1. Построение запроса + ключ кэша, мкс/вызов ({ITERATIONS} вызовов)")
+    print(f"{'':<26} {'до':>10} {'после':>10} {'':>9}")
+    for name, old, new in CASES:
+        print_row(name, per_call_us(old, ITERATIONS), per_call_us(new, ITERATIONS))
+
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    try:
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+        print(f"\n2. Полное выполнение на SQLite в памяти, мкс/вызов ({DB_ITERATIONS} вызовов)")
+        print(f"{'':<26} {'до':>10} {'после':>10} {'':>9}")
+        for name, old, new in CASES:
+            before = await per_call_db_us(engine, old, DB_ITERATIONS)
+            after = await per_call_db_us(engine, new, DB_ITERATIONS)
+            print_row(name, before, after)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,34 @@
+-- Уникальный ключ (user_id, ip_address) для пакетного upsert разрешенных IP
+-- (UserAllowedIPsDAO.add_multiple_ips). До его добавления приложение добавляет
+-- адреса по одному; после - одним INSERT ... ON CONFLICT (проверяется раз в минуту).
+--
+-- Запуск: psql "$DATABASE_URL" -f scripts/sql/users_allowed_ips_unique.sql
+
+BEGIN;
+
+LOCK TABLE users_allowed_ips IN SHARE ROW EXCLUSIVE MODE;
+
+-- Дубликаты: остается одна строка на пару - активная, среди них самая новая;
+-- описание берется из последней строки, где оно задано
+UPDATE users_allowed_ips AS kept
+SET description = latest.description
+FROM (
+    SELECT DISTINCT ON (user_id, ip_address) user_id, ip_address, description
+    FROM users_allowed_ips
+    WHERE description IS NOT NULL
+    ORDER BY user_id, ip_address, id DESC
+) AS latest
+WHERE kept.user_id = latest.user_id
+  AND kept.ip_address = latest.ip_address
+  AND kept.description IS NULL;
+
+DELETE FROM users_allowed_ips AS a
+USING users_allowed_ips AS b
+WHERE a.user_id = b.user_id
+  AND a.ip_address = b.ip_address
+  AND (COALESCE(a.is_active, 0), a.id) < (COALESCE(b.is_active, 0), b.id);
+
+ALTER TABLE users_allowed_ips
+    ADD CONSTRAINT uq_users_allowed_ips_user_ip UNIQUE (user_id, ip_address);
+
+COMMIT;
@@ -0,0 +1,27 @@
+# tests/conftest.py
+import math
+import os
+
+import pytest
+
+# app.config читает настройки из окружения при импорте
+for name, value in {
+    "DB_HOST": "localhost", "DB_PORT": "5432", "DB_NAME": "test", "DB_USER": "test", "DB_PASSWORD": "test",
+    "SECRET_KEY": "test-secret", "ALGORITHM": "HS256",
+    "REDIS_URL": "redis://127.0.0.1:1", "REDIS_PASSWORD": "", "REDIS_DB": "0",
+    "REDIS_USER": "", "REDIS_USER_PASSWORD": "",
+}.items():
+    os.environ.setdefault(name, value)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+def no_redis(monkeypatch):
+    """Тесты работают без Redis: redis_client() возвращает None (запасной путь)"""
+    import app.core.redis
+
+    monkeypatch.setattr(app.core.redis, "_retry_at", math.inf)
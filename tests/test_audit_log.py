@@ -0,0 +1,109 @@
+# tests/test_audit_log.py
+import asyncio
+import glob
+import os
+
+import pytest
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+import app.users.audit_log as audit_log_module
+from app.users.audit_log import AuditLogWriter
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeLogsTable:
+    """users_logs в памяти: bulk_insert атомарен, как многострочный INSERT"""
+
+    def __init__(self):
+        self.rows = []
+        self.down = False
+        # description строк, нарушающих ограничения БД
+        self.invalid = set()
+        # После стольких успешных вставок БД становится недоступной
+        self.fail_after = None
+
+    async def bulk_insert(self, rows, returning=False):
+        if any(row["description"] in self.invalid for row in rows):
+            raise IntegrityError("INSERT", {}, Exception("foreign key"))
+        if self.down or (self.fail_after is not None and len(self.rows) >= self.fail_after):
+            raise OperationalError("INSERT", {}, Exception("connection refused"))
+        self.rows.extend(rows)
+
+
+@pytest.fixture
+def table(monkeypatch):
+    fake = FakeLogsTable()
+    monkeypatch.setattr(audit_log_module.UserLogsDAO, "bulk_insert", fake.bulk_insert)
+    return fake
+
+
+@pytest.fixture
+def writer(tmp_path):
+    return AuditLogWriter(queue_size=100, batch_size=10, flush_interval=60, spill_dir=str(tmp_path))
+
+
+def write(writer, count, start=0):
+    for i in range(start, start + count):
+        writer.write(user_id=1, action_type="test", description=f"event {i}")
+
+
+def descriptions(rows):
+    return sorted(row["description"] for row in rows)
+
+
+async def test_close_writes_batch_in_hand(table, writer):
+    write(writer, 3)
+    # Фоновая задача берет первое событие и ждет flush_interval
+    await asyncio.sleep(0.01)
+
+    await writer.close()
+    assert descriptions(table.rows) == [f"event {i}" for i in range(3)]
+    assert writer.written == 3
+
+
+async def test_spill_and_replay(table, writer, tmp_path):
+    table.down = True
+    write(writer, 3)
+    await writer.close()
+    assert table.rows == []
+    assert writer.spilled == 3
+    assert len(glob.glob(os.path.join(tmp_path, "*.ndjson"))) == 1
+
+    table.down = False
+    assert await writer.replay() == 3
+    assert descriptions(table.rows) == [f"event {i}" for i in range(3)]
+    assert glob.glob(os.path.join(tmp_path, "*.ndjson")) == []
+
+
+async def test_partial_insert_spills_only_unwritten_rows(table, writer):
+    # Ошибочная строка переводит пакет на построчную запись, затем БД становится недоступной
+    table.invalid = {"event 1"}
+    table.fail_after = 1
+    write(writer, 4)
+    await writer.close()
+    assert descriptions(table.rows) == ["event 0"]
+    assert writer.dropped == 1
+    assert writer.spilled == 2
+    assert writer.written == 1
+
+    table.fail_after = None
+    await writer.replay()
+    assert descriptions(table.rows) == ["event 0", "event 2", "event 3"]
+
+
+async def test_queue_overflow_is_spilled_to_one_file(table, tmp_path):
+    writer = AuditLogWriter(queue_size=2, batch_size=10, flush_interval=60, spill_dir=str(tmp_path))
+    write(writer, 5)
+    # Переполнение сохраняется отдельной задачей, не дожидаясь очереди
+    await writer._overflow_task
+    assert writer.spilled == 3
+    assert (await writer.status())["spill_files"] == 1
+
+    table.down = True
+    await writer.close()
+    assert writer.spilled == 5
+
+    table.down = False
+    assert await writer.replay() == 5
+    assert descriptions(table.rows) == [f"event {i}" for i in range(5)]
@@ -0,0 +1,36 @@
+# tests/test_availability.py
+import pytest
+
+from app.users.availability import BloomFilter, TakenValuesFilter
+
+
+@pytest.mark.parametrize("capacity, count", [(1000, 1000), (100, 5000)])
+def test_bloom_filter_has_no_false_negatives(capacity, count):
+    # Переполненный фильтр чаще ошибается в плюс, но добавленное значение не теряет
+    bloom = BloomFilter(capacity, 0.01)
+    values = [f"email:user{i}@example.com" for i in range(count)]
+    for value in values:
+        bloom.add(value)
+    assert all(value in bloom for value in values)
+
+
+def test_bloom_filter_error_rate_within_capacity():
+    bloom = BloomFilter(10000, 0.01)
+    for i in range(10000):
+        bloom.add(f"nick:user{i}")
+    false_positives = sum(f"nick:other{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+def test_taken_values_are_case_insensitive():
+    taken = TakenValuesFilter(enabled=True, error_rate=0.01)
+    taken._filter = BloomFilter(1000, 0.01)
+    taken._add_row("Ivan", "Ivan@Example.com", None)
+
+    assert taken.might_be_taken_nick(" ivan ")
+    assert taken.might_be_taken_email("ivan@example.com")
+
+
+def test_everything_is_possibly_taken_until_built():
+    taken = TakenValuesFilter(enabled=True, error_rate=0.01)
+    assert taken.might_be_taken_nick("anyone")
@@ -0,0 +1,90 @@
+# tests/test_dao_cache.py
+import asyncio
+import json
+
+import pytest
+from redis.asyncio import Redis
+
+import app.dao.cache as cache_module
+from app.dao.cache import DAOCache
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeRedisServer:
+    """Минимальный RESP сервер: SUBSCRIBE и рассылка сообщений подписчикам"""
+
+    def __init__(self):
+        self.subscribers = []
+        self.server = None
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        for writer in self.subscribers:
+            writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    @staticmethod
+    def _bulk(value: str) -> bytes:
+        data = value.encode()
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+
+    async def _read_command(self, reader) -> list[str]:
+        header = await reader.readline()
+        if not header:
+            raise ConnectionError
+        args = []
+        for _ in range(int(header[1:])):
+            length = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(length + 2))[:-2].decode())
+        return args
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command[0].upper() == "SUBSCRIBE":
+                    self.subscribers.append(writer)
+                    writer.write(b"*3\r\n" + self._bulk("subscribe") + self._bulk(command[1]) + b":1\r\n")
+                else:
+                    writer.write(b"+OK\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+
+    async def publish(self, channel: str, message: str):
+        for writer in self.subscribers:
+            writer.write(b"*3\r\n" + self._bulk("message") + self._bulk(channel) + self._bulk(message))
+            await writer.drain()
+
+
+async def test_idle_subscription_is_not_a_redis_failure(monkeypatch):
+    server = FakeRedisServer()
+    port = await server.start()
+    # Короткий socket_timeout, как у общего клиента: ожидание дольше него не должно быть ошибкой
+    client = Redis(host="127.0.0.1", port=port, socket_timeout=0.05)
+    failures = []
+    monkeypatch.setattr(cache_module, "redis_client", lambda: client)
+    monkeypatch.setattr(cache_module, "redis_failed", lambda: failures.append(1))
+    monkeypatch.setattr(cache_module, "PUBSUB_POLL_TIMEOUT", 0.1)
+
+    cache = DAOCache()
+    resets = []
+    cache.on_invalidate(lambda table, pk: resets.append((table, pk)))
+    await cache.start()
+    try:
+        await asyncio.sleep(0.5)
+        await server.publish(cache_module.CHANNEL, json.dumps({"origin": "other", "table": "users", "pk": "7"}))
+        await asyncio.sleep(0.2)
+    finally:
+        await cache.close()
+        await client.aclose()
+        await server.close()
+
+    assert failures == []
+    # Один полный сброс при подписке и сброс строки от другого воркера
+    assert resets == [(None, None), ("users", "7")]
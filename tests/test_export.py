@@ -0,0 +1,41 @@
+# tests/test_export.py
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+import app.dao.session as session_module
+import app.main  # noqa: F401  регистрирует все модели
+from app.roles.models import Role
+from app.tickets.dao import TicketDAO
+from app.users.dao import UserLogsDAO, UsersDAO
+from app.users.models import User
+from app.utils.export import csv_lines
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def engine(monkeypatch):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    monkeypatch.setattr(session_module, "async_session_maker", async_sessionmaker(engine, expire_on_commit=False))
+    async with engine.begin() as connection:
+        await connection.run_sync(Role.__table__.create)
+        await connection.run_sync(User.__table__.create)
+    yield engine
+    await engine.dispose()
+
+
+async def test_empty_csv_export_has_header(engine):
+    chunks = [chunk async for chunk in csv_lines(UsersDAO.stream_export(), UsersDAO.export_fields())]
+    assert "".join(chunks) == ",".join(UsersDAO.export_fields()) + "\r\n"
+
+
+@pytest.mark.parametrize("dao, columns", [
+    (UsersDAO, UsersDAO.export_columns),
+    (UserLogsDAO, UserLogsDAO._row_projection()[0]),
+    (TicketDAO, TicketDAO.export_columns),
+])
+async def test_export_fields_match_row_fields(dao, columns):
+    query = select(*dao._projection(columns))
+    assert dao.export_fields() == list(query.selected_columns.keys())
@@ -0,0 +1,37 @@
+# tests/test_hashing.py
+import asyncio
+import threading
+
+import pytest
+
+from app.exceptions import PasswordHashingBusyException
+from app.users.hashing import PasswordHasher
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_cancelled_caller_keeps_slot_until_job_finishes():
+    hasher = PasswordHasher(workers=1, queue_limit=1)
+    release = threading.Event()
+    try:
+        task = asyncio.create_task(hasher.run(release.wait))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # Поток все еще занят: отмена не освобождает место
+        assert hasher.pending == 1
+
+        queued = asyncio.create_task(hasher.run(lambda: "ok"))
+        await asyncio.sleep(0.05)
+        with pytest.raises(PasswordHashingBusyException):
+            await hasher.run(lambda: "rejected")
+
+        release.set()
+        assert await queued == "ok"
+        await asyncio.sleep(0.05)
+        assert hasher.pending == 0
+        assert hasher.metrics.calls == 2
+    finally:
+        release.set()
+        hasher.close()
@@ -0,0 +1,50 @@
+# tests/test_ip_allowlist.py
+import pytest
+
+from app.users.ip_allowlist import IPAllowList
+
+
+def test_empty_list_allows_any_address():
+    allow_list = IPAllowList()
+    assert not allow_list.restricted
+    assert allow_list.allows("198.51.100.1")
+
+
+@pytest.mark.parametrize("ip, allowed", [
+    ("192.168.1.10", True),
+    ("192.168.1.11", False),
+    ("10.0.0.0", True),
+    ("10.0.0.255", True),
+    ("10.0.1.0", False),
+    ("9.255.255.255", False),
+    ("172.16.5.4", True),
+    ("172.31.255.255", True),
+    ("172.32.0.0", False),
+    ("2001:db8::1", True),
+    ("2001:db8::ffff:ffff:ffff:ffff", True),
+    ("2001:db8:1::", False),
+    ("::ffff:10.0.0.7", True),
+    ("::ffff:10.0.1.7", False),
+    (" 10.0.0.7 ", True),
+    ("не адрес", False),
+])
+def test_cidr_matching(ip, allowed):
+    allow_list = IPAllowList(["192.168.1.10", "10.0.0.0/24", "172.16.0.0/12", "2001:db8::/64"])
+    assert allow_list.allows(ip) is allowed
+
+
+def test_overlapping_and_adjacent_networks_are_merged():
+    allow_list = IPAllowList(["10.0.0.0/25", "10.0.0.128/25", "10.0.0.64/26", "10.0.2.0/24"])
+    assert allow_list.allows("10.0.0.0") and allow_list.allows("10.0.0.255")
+    assert not allow_list.allows("10.0.1.0")
+    assert allow_list.allows("10.0.2.1")
+
+
+def test_host_bits_in_network_are_ignored():
+    assert IPAllowList(["10.0.0.7/24"]).allows("10.0.0.200")
+
+
+def test_malformed_entry_still_restricts():
+    allow_list = IPAllowList(["не адрес"])
+    assert allow_list.restricted
+    assert not allow_list.allows("10.0.0.1")
@@ -0,0 +1,58 @@
+# tests/test_ip_dao.py
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+import app.dao.session as session_module
+import app.main  # noqa: F401  регистрирует все модели
+from app.users.ip_dao import UserAllowedIPsDAO
+from app.users.models import UserAllowedIP
+
+pytestmark = pytest.mark.anyio
+
+# Таблица существующей БД: без ключа (user_id, ip_address)
+LEGACY_DDL = """
+CREATE TABLE users_allowed_ips (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    ip_address VARCHAR NOT NULL,
+    description VARCHAR,
+    is_active INTEGER DEFAULT 1,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+@pytest.fixture
+async def engine(monkeypatch):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    monkeypatch.setattr(session_module, "async_session_maker", async_sessionmaker(engine, expire_on_commit=False))
+    monkeypatch.setattr(UserAllowedIPsDAO, "_has_upsert_key", None)
+    yield engine
+    await engine.dispose()
+
+
+async def test_upsert_key_is_detected(engine):
+    async with engine.begin() as connection:
+        await connection.run_sync(UserAllowedIP.__table__.create)
+    assert await UserAllowedIPsDAO.has_upsert_key()
+
+
+async def test_database_without_key_adds_addresses_one_by_one(engine):
+    async with engine.begin() as connection:
+        await connection.execute(text(LEGACY_DDL))
+        await connection.execute(text(
+            "INSERT INTO users_allowed_ips (user_id, ip_address, is_active) VALUES (1, '10.0.0.1', 0)"
+        ))
+
+    assert not await UserAllowedIPsDAO.has_upsert_key()
+    added = await UserAllowedIPsDAO.add_multiple_ips(1, ["10.0.0.1", "10.0.0.2"], [None, "office"])
+    assert [ip.ip_address for ip in added] == ["10.0.0.1", "10.0.0.2"]
+
+    async with engine.connect() as connection:
+        rows = (await connection.execute(text(
+            "SELECT ip_address, is_active, description FROM users_allowed_ips ORDER BY id"
+        ))).all()
+    assert rows == [("10.0.0.1", 1, None), ("10.0.0.2", 1, "office")]
@@ -0,0 +1,94 @@
+# tests/test_login_throttle.py
+import pytest
+
+import app.users.login_throttle as login_throttle_module
+from app.exceptions import TooManyLoginAttemptsException
+from app.users.login_throttle import LoginThrottle
+
+pytestmark = pytest.mark.anyio
+
+IP = "203.0.113.7"
+EMAIL = "user@example.com"
+
+
+class Clock:
+    """Заменяет модуль time в login_throttle"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(login_throttle_module, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def throttle():
+    throttle = LoginThrottle()
+    throttle.limits = {"ip": (3, 60), "email": (2, 60)}
+    return throttle
+
+
+async def attempts(throttle, count, ip=IP, email=None):
+    for _ in range(count):
+        await throttle.check(ip, email)
+
+
+async def test_limit_is_inclusive(clock, throttle):
+    await attempts(throttle, 3)
+    with pytest.raises(TooManyLoginAttemptsException) as exc_info:
+        await throttle.check(IP, None)
+    # Четыре попытки окна 0 станут предыдущим окном: 1 + 4 * 0.5 = 3 в t=90
+    assert exc_info.value.headers["Retry-After"] == "90"
+
+
+async def test_previous_window_counts_in_full_at_window_start(clock, throttle):
+    clock.now = 59.0
+    await attempts(throttle, 3)
+    clock.now = 60.0
+    with pytest.raises(TooManyLoginAttemptsException):
+        await throttle.check(IP, None)
+
+
+async def test_previous_window_weight_decays(clock, throttle):
+    clock.now = 59.0
+    await attempts(throttle, 3)
+    # Середина следующего окна: 1 + 3 * 0.5 = 2.5
+    clock.now = 90.0
+    await throttle.check(IP, None)
+    # 2 + 3 * 0.5 = 3.5
+    with pytest.raises(TooManyLoginAttemptsException) as exc_info:
+        await throttle.check(IP, None)
+    assert exc_info.value.headers["Retry-After"] == "30"
+
+
+@pytest.mark.parametrize("rejected_at", [59.0, 66.0, 90.0, 100.0, 119.0])
+async def test_retry_at_retry_after_is_allowed(clock, throttle, rejected_at):
+    clock.now = 59.0
+    await attempts(throttle, 3)
+    clock.now = rejected_at
+    with pytest.raises(TooManyLoginAttemptsException) as exc_info:
+        await attempts(throttle, 3)
+    clock.now += int(exc_info.value.headers["Retry-After"])
+    await throttle.check(IP, None)
+
+
+async def test_attempts_expire_after_two_windows(clock, throttle):
+    await attempts(throttle, 3)
+    clock.now = 120.0
+    await attempts(throttle, 3)
+
+
+async def test_email_limit_and_reset(clock, throttle):
+    await attempts(throttle, 2, ip=None, email=EMAIL)
+    with pytest.raises(TooManyLoginAttemptsException):
+        await throttle.check(None, EMAIL.upper())
+
+    await throttle.reset_email(EMAIL)
+    await throttle.check(None, EMAIL)
@@ -0,0 +1,56 @@
+# tests/test_pagination.py
+import base64
+import json
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, desc
+
+from app.dao.pagination import (
+    InvalidCursorError, check_keys, decode_cursor, encode_cursor, keyset_condition, split_order_by,
+)
+
+items = Table(
+    "items", MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+    Column("title", String, nullable=True),
+)
+KEYS = split_order_by([desc(items.c.created_at), desc(items.c.id)])
+
+
+def raw_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def test_cursor_round_trip():
+    values = [datetime(2026, 10, 17, 12, 30, 15, 123456, tzinfo=timezone.utc), 42]
+    assert decode_cursor(encode_cursor(values), KEYS) == values
+
+
+def test_keyset_condition_uses_cursor_values():
+    condition = keyset_condition(KEYS, decode_cursor(encode_cursor([datetime(2026, 1, 1), 7]), KEYS))
+    assert str(condition.compile()) == "(items.created_at, items.id) < (:param_1, :param_2)"
+
+
+@pytest.mark.parametrize("cursor", [
+    "не base64",
+    raw_cursor({"dt": "2026-01-01T00:00:00"}),
+    raw_cursor([{"dt": "2026-01-01T00:00:00"}]),
+    raw_cursor([{"dt": "2026-01-01T00:00:00"}, 1, 2]),
+    raw_cursor([{"dt": "вчера"}, 1]),
+    raw_cursor([{"dt": "2026-01-01T00:00:00"}, "1; DROP TABLE items"]),
+    raw_cursor([{"dt": "2026-01-01T00:00:00"}, True]),
+    raw_cursor([{"dt": "2026-01-01T00:00:00"}, None]),
+    raw_cursor([{"d": "2026-01-01"}, 1]),
+    raw_cursor(["2026-01-01T00:00:00", 1]),
+])
+def test_tampered_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor, KEYS)
+
+
+def test_nullable_sort_key_is_rejected():
+    with pytest.raises(ValueError):
+        check_keys(split_order_by([items.c.title, items.c.id]))
+    check_keys(KEYS)
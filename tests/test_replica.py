@@ -0,0 +1,51 @@
+# tests/test_replica.py
+import pytest
+
+import app.dao.cache as cache_module
+import app.dao.replica as replica_module
+from app.dao.cache import cached, dao_cache
+from app.dao.replica import RoutingState, primary_reads, replica_allowed, routing_state
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def replica_get(monkeypatch):
+    """GET-запрос, который может читать из исправной реплики"""
+    monkeypatch.setattr(replica_module, "replica_session_maker", object())
+    monkeypatch.setattr(replica_module.replica_monitor, "healthy", True)
+    token = routing_state.set(RoutingState(use_replica=True))
+    yield
+    routing_state.reset(token)
+
+
+def test_primary_reads_disables_replica(replica_get):
+    assert replica_allowed()
+    with primary_reads():
+        assert not replica_allowed()
+    assert replica_allowed()
+
+
+class Item:
+    __tablename__ = "items"
+
+
+class ItemsDAO:
+    model = Item
+    routed_to_replica = []
+
+    @classmethod
+    @cached(by_pk=True)
+    async def find_by_id(cls, item_id: int):
+        cls.routed_to_replica.append(replica_allowed())
+        return {"id": item_id}
+
+
+async def test_cache_fill_reads_primary(replica_get, monkeypatch):
+    monkeypatch.setattr(dao_cache, "enabled", True)
+    monkeypatch.setattr(cache_module, "redis_client", lambda: None)
+    dao_cache.local.clear()
+
+    assert await ItemsDAO.find_by_id(1) == {"id": 1}
+    assert ItemsDAO.routed_to_replica == [False]
+    dao_cache.local.clear()
@@ -0,0 +1,67 @@
+# tests/test_role_counts.py
+import pytest
+
+import app.roles.counts as counts_module
+from app.roles.counts import RECONCILE_LOCK_NAME, RoleCountsReconciler
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeRedis:
+    """SET NX EX с ручным временем истечения ключей"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.data = {}
+
+    async def set(self, key, value, nx=False, ex=None):
+        stored = self.data.get(key)
+        if nx and stored is not None and stored[1] > self.now:
+            return None
+        self.data[key] = (value, self.now + ex)
+        return True
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(counts_module, "redis_client", lambda: fake)
+    return fake
+
+
+def workers(count, calls):
+    result = []
+    for number in range(count):
+        worker = RoleCountsReconciler(interval=300)
+
+        async def reconcile(number=number):
+            calls.append(number)
+            return {}
+
+        worker.reconcile = reconcile
+        result.append(worker)
+    return result
+
+
+async def test_one_worker_reconciles_per_interval(redis):
+    calls = []
+    reconcilers = workers(4, calls)
+
+    for _ in range(3):
+        for worker in reconcilers:
+            await worker.tick()
+    assert calls == [0]
+    assert sum(worker.skipped for worker in reconcilers) == 11
+    assert RECONCILE_LOCK_NAME in redis.data
+
+    redis.now += 300
+    for worker in reversed(reconcilers):
+        await worker.tick()
+    assert calls == [0, 3]
+
+
+async def test_every_worker_reconciles_without_redis():
+    calls = []
+    for worker in workers(3, calls):
+        assert await worker.tick() == {}
+    assert calls == [0, 1, 2]
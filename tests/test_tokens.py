@@ -0,0 +1,146 @@
+# tests/test_tokens.py
+import pytest
+from jose import JWTError
+
+import app.users.token_versions as token_versions_module
+from app.exceptions import TokenVersionUnavailableException
+import app.users.tokens as tokens_module
+from app.users.token_versions import session_versions, token_versions
+from app.users.tokens import (
+    check_refresh_token, decode_access_token, decode_refresh_token, issue_access_token,
+    issue_refresh_token, resolve_principal, revoke_refresh_tokens,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def incr(self, key):
+        self.commands.append(key)
+
+    def expire(self, key, ttl):
+        pass
+
+    async def execute(self):
+        for key in self.commands:
+            self.redis.data[key] = self.redis.data.get(key, 0) + 1
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(token_versions_module, "redis_client", lambda: fake)
+    session_versions.invalidate()
+    token_versions.invalidate()
+    yield fake
+    session_versions.invalidate()
+    token_versions.invalidate()
+
+
+async def test_refresh_token_round_trip(redis):
+    token = await issue_refresh_token(7)
+    assert await check_refresh_token(token) == 7
+
+
+async def test_revoke_rejects_issued_refresh_tokens(redis):
+    old = await issue_refresh_token(7)
+    other_user = await issue_refresh_token(8)
+    await revoke_refresh_tokens(7)
+
+    with pytest.raises(JWTError):
+        await check_refresh_token(old)
+    assert await check_refresh_token(other_user) == 8
+    # Токен, выданный после отзыва, действует
+    assert await check_refresh_token(await issue_refresh_token(7)) == 7
+
+
+async def test_refresh_token_is_rejected_while_version_is_unknown(redis, monkeypatch):
+    token = await issue_refresh_token(7)
+    monkeypatch.setattr(token_versions_module, "redis_client", lambda: None)
+    session_versions.invalidate()
+
+    with pytest.raises(TokenVersionUnavailableException):
+        await check_refresh_token(token)
+    assert await tokens_module.refresh_access_token(token) is None
+
+
+async def test_bump_without_redis_is_reported():
+    with pytest.raises(TokenVersionUnavailableException):
+        await revoke_refresh_tokens(7)
+    with pytest.raises(TokenVersionUnavailableException):
+        await token_versions.bump(7)
+
+
+async def test_failed_bump_is_reported(redis, monkeypatch):
+    async def execute():
+        raise ConnectionError("connection reset")
+
+    pipeline = redis.pipeline
+
+    def failing_pipeline(transaction=True):
+        pipe = pipeline(transaction)
+        pipe.execute = execute
+        return pipe
+
+    monkeypatch.setattr(redis, "pipeline", failing_pipeline)
+    with pytest.raises(TokenVersionUnavailableException):
+        await token_versions.bump(7)
+
+
+async def test_refresh_token_is_not_access_token(redis):
+    refresh = await issue_refresh_token(7)
+    access = await issue_access_token(7, 4)
+
+    with pytest.raises(JWTError):
+        decode_access_token(refresh)
+    with pytest.raises(JWTError):
+        decode_refresh_token(access)
+
+
+async def test_cached_claims_are_read_only(redis):
+    access = await issue_access_token(7, 4)
+    claims = decode_access_token(access)
+    with pytest.raises(TypeError):
+        claims["rid"] = 1
+    assert decode_access_token(access)["rid"] == 4
+
+
+class Snapshot:
+    id = 7
+    role_id = 1
+
+
+async def test_version_bump_resolves_role_from_snapshot(redis, monkeypatch):
+    async def get_snapshot(user_id):
+        return Snapshot()
+
+    monkeypatch.setattr(tokens_module.user_snapshots, "get", get_snapshot)
+    claims = decode_access_token(await issue_access_token(7, 4))
+
+    principal = await resolve_principal(claims)
+    assert principal.role_id == 4 and principal.user is None
+
+    await token_versions.bump(7)
+    principal = await resolve_principal(claims)
+    assert principal.role_id == 1 and principal.user is not None